@@ -7,6 +7,7 @@ Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
 from imgmarker.gui.pyqt import QApplication, QIcon
 from imgmarker.gui.window import MainWindow, _open_save
 from imgmarker import config, ICON, __version__
+from multiprocessing import freeze_support
 import sys
 
 if sys.platform == "darwin":
@@ -22,12 +23,16 @@ if sys.platform == "darwin":
 
 
 def run():
+    # Metadata scanning can use a process pool, which needs this in frozen (PyInstaller) builds
+    freeze_support()
+
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(ICON))
     app.setApplicationName(f"Image Marker v. {__version__}")
     
     config.SAVE_DIR = _open_save()
-    config.IMAGE_DIR, config.GROUP_NAMES, config.CATEGORY_NAMES, config.GROUP_MAX, config.RANDOMIZE_ORDER, left_click_group = config.read()
+    (config.IMAGE_DIR, config.GROUP_NAMES, config.CATEGORY_NAMES, config.GROUP_MAX, config.RANDOMIZE_ORDER, left_click_group,
+     config.PREFETCH_DEPTH, config.PREFETCH_WORKERS) = config.read()
     config.set_left_click_group(left_click_group)
 
     window = MainWindow()
@@ -37,6 +37,47 @@ GROUP_MAX = ['None','None','None','None','None','None','None','None','None']
 RANDOMIZE_ORDER = False
 LEFT_CLICK_GROUP = 1
 
+# Number of images rendered in the background on each side of the current image, and the number of
+# worker threads doing it. Setting either to 0 disables prefetching. Both can be set in the
+# configuration file, as prefetch_depth and prefetch_workers.
+PREFETCH_DEPTH = 2
+PREFETCH_WORKERS = 2
+
+# Number of frames of a cube rendered in the background around the current frame, and the number of
+# worker threads doing it (setting either to 0 disables this), and the default frame rate of playback
+FRAME_BUFFER = 8
+FRAME_WORKERS = 1
+PLAYBACK_FPS = 10
+
+# Number of threads reading image metadata when a directory is scanned for the first time, and the number
+# of processes parsing FITS headers (0 parses them in the threads)
+SCAN_THREADS = 8
+SCAN_PROCESSES = 0
+
+# Memory budget, in bytes, of the cache of decoded and rendered frames
+CACHE_BYTES = 2*1024**3
+
+# Images with more pixels than TILE_THRESHOLD are drawn from a pyramid of TILE_SIZE x TILE_SIZE tiles,
+# rendered by TILE_WORKERS threads, instead of from a single pixmap
+TILE_THRESHOLD = 4096*4096
+TILE_SIZE = 512
+TILE_WORKERS = 2
+
+# Images larger than PREVIEW_SIZE pixels on a side are first shown as a downsampled preview of about
+# that size while the full resolution frame is rendered in the background
+PREVIEW_SIZE = 1024
+
+# Number of threads that scale the bands of a frame concurrently (0 uses one per CPU, 1 disables threading)
+SCALE_THREADS = 0
+
+# The cursor readout interpolates sky coordinates on a grid with nodes SKY_GRID_STEP pixels apart, and
+# uses the exact WCS transform wherever the interpolation error could exceed SKY_GRID_TOLERANCE pixels
+SKY_GRID_STEP = 32
+SKY_GRID_TOLERANCE = 0.01
+
+# Shortest time, in milliseconds, between updates of the cursor readout while the mouse moves
+CURSOR_INTERVAL = 16
+
 MARK_KEYBINDS = {
     1: {Qt.Key.Key_1},
     2: {Qt.Key.Key_2},
@@ -61,7 +102,7 @@ set_left_click_group(LEFT_CLICK_GROUP)
 def path():
     return os.path.join(SAVE_DIR,f'{USER}_config.txt')
 
-def read() -> Tuple[str,List[str],List[str],List[str],List[int],int]:
+def read() -> Tuple[str,List[str],List[str],List[str],List[int],int,int,int]:
     """
     Reads in each line from {username}_config.txt. If there is no configuration file,
     a default configuration file will be created using the required text
@@ -83,6 +124,12 @@ def read() -> Tuple[str,List[str],List[str],List[str],List[int],int]:
 
     left_click_group: int
         The group number that a left mouse click places a mark in.
+
+    prefetch_depth: int
+        Number of images rendered in the background on each side of the current image.
+
+    prefetch_workers: int
+        Number of threads rendering images in the background.
     """
 
     # If the config doesn't exist, create one
@@ -94,17 +141,23 @@ def read() -> Tuple[str,List[str],List[str],List[str],List[int],int]:
             group_max = GROUP_MAX
             randomize_order = RANDOMIZE_ORDER
             left_click_group = LEFT_CLICK_GROUP
+            prefetch_depth = PREFETCH_DEPTH
+            prefetch_workers = PREFETCH_WORKERS
 
             config.write(f'image_dir = {image_dir}\n')
             config.write(f"groups = {','.join(group_names)}\n")
             config.write(f"categories = {','.join(category_names)}\n")
             config.write(f"group_max = {','.join(group_max)}\n")
             config.write(f'randomize_order = {randomize_order}\n')
-            config.write(f'left_click_group = {left_click_group}')
+            config.write(f'left_click_group = {left_click_group}\n')
+            config.write(f'prefetch_depth = {prefetch_depth}\n')
+            config.write(f'prefetch_workers = {prefetch_workers}')
 
     else:
-        # Default for config files written before this option existed
+        # Defaults for config files written before these options existed
         left_click_group = LEFT_CLICK_GROUP
+        prefetch_depth = PREFETCH_DEPTH
+        prefetch_workers = PREFETCH_WORKERS
 
         for l in open(path()):
             var, val = [i.strip() for i in l.replace('\n','').split('=')]
@@ -140,7 +193,13 @@ def read() -> Tuple[str,List[str],List[str],List[str],List[int],int]:
             if var == 'left_click_group':
                 left_click_group = int(val)
 
-    return image_dir, group_names, category_names, group_max, randomize_order, left_click_group
+            if var == 'prefetch_depth':
+                prefetch_depth = max(0,int(val))
+
+            if var == 'prefetch_workers':
+                prefetch_workers = max(0,int(val))
+
+    return image_dir, group_names, category_names, group_max, randomize_order, left_click_group, prefetch_depth, prefetch_workers
 
 def update() -> None:
     """Updates any of the config variables with the corresponding parameter."""
@@ -151,4 +210,6 @@ def update() -> None:
         config.write(f"categories = {','.join(CATEGORY_NAMES[1:])}\n")
         config.write(f"group_max = {','.join(GROUP_MAX)}\n")
         config.write(f'randomize_order = {RANDOMIZE_ORDER}\n')
-        config.write(f'left_click_group = {LEFT_CLICK_GROUP}')
\ No newline at end of file
+        config.write(f'left_click_group = {LEFT_CLICK_GROUP}\n')
+        config.write(f'prefetch_depth = {PREFETCH_DEPTH}\n')
+        config.write(f'prefetch_workers = {PREFETCH_WORKERS}')
\ No newline at end of file
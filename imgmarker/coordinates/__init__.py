@@ -4,99 +4,186 @@ Copyright © 2025, UChicago Argonne, LLC
 Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
 """
 
+"""
+This module converts between pixel and world coordinates and formats them.
+
+Positions are (N, 2) float64 arrays, of (x, y) pixels with the origin at the upper-left corner or of
+(RA, Dec) in degrees, so that any number of positions, e.g. a whole catalog, is converted with a single
+call. `Angle`, `WorldCoord` and `PixCoord` wrap these arrays for single positions.
+"""
+
 import numpy as np
 from astropy.wcs import WCS
-import numpy as np
+from typing import List, Tuple
+
+def pairs(a,b) -> np.ndarray:
+    """Stacks two coordinates, or arrays of them, into a contiguous (..., 2) float64 array."""
+
+    a, b = np.broadcast_arrays(np.asarray(a,dtype=np.float64),np.asarray(b,dtype=np.float64))
+    out = np.empty(a.shape+(2,),dtype=np.float64)
+    out[...,0] = a
+    out[...,1] = b
+    return out
+
+def pix2world(xy:np.ndarray,wcs:WCS) -> np.ndarray:
+    """
+    Converts (..., 2) pixel coordinates, with the origin at the upper-left corner, to (..., 2) (RA, Dec)
+    in degrees.
+    """
+
+    xy = np.asarray(xy,dtype=np.float64)
+    _xy = np.empty(xy.shape,dtype=np.float64)
+    _xy[...,0] = xy[...,0]
+    np.subtract(wcs.pixel_shape[1],xy[...,1],out=_xy[...,1])
+    return wcs.all_pix2world(_xy.reshape(-1,2),0).reshape(xy.shape)
+
+def world2pix(radec:np.ndarray,wcs:WCS) -> np.ndarray:
+    """
+    Converts (..., 2) (RA, Dec) in degrees to (..., 2) pixel coordinates, with the origin at the upper-left
+    corner.
+    """
+
+    radec = np.asarray(radec,dtype=np.float64)
+    xy = wcs.all_world2pix(radec.reshape(-1,2),0)
+    np.subtract(wcs.pixel_shape[1],xy[:,1],out=xy[:,1])
+    return xy.reshape(radec.shape)
+
+def hms(ra) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Signed hours, minutes and seconds of angles in degrees."""
+
+    return _split(np.asarray(ra,dtype=np.float64)*240)
+
+def dms(dec) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Signed degrees, arcminutes and arcseconds of angles in degrees."""
+
+    return _split(np.asarray(dec,dtype=np.float64)*3600)
+
+def _split(seconds:np.ndarray) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    sign = np.sign(seconds)
+    m, s = np.divmod(np.abs(seconds),60)
+    h, m = np.divmod(m,60)
+    return sign*h, sign*m, sign*s
+
+def _sexagesimal(a:np.ndarray,scale:int) -> Tuple[list,list,list,list]:
+    # Rounds to hundredths of a second before splitting, so that seconds never read 60.00
+    finite = np.isfinite(a)
+    hundredths = np.rint(np.abs(np.where(finite,a,0))*(scale*100)).astype(np.int64)
+    m, hundredths = np.divmod(hundredths,6000)
+    h, m = np.divmod(m,60)
+    return h.tolist(), m.tolist(), (hundredths/100).tolist(), finite.tolist()
+
+def formatra(ra,sexagesimal:bool=False,decimals:int=5,symbol:str='°') -> List[str]:
+    """
+    Formats right ascensions in degrees, as hours, minutes and seconds if `sexagesimal` or else as degrees
+    with `decimals` decimals followed by `symbol`.
+    """
+
+    ra = np.asarray(ra,dtype=np.float64).ravel()
+    if not sexagesimal: return [f'{a:03.{decimals}f}{symbol}' for a in ra.tolist()]
+    return [f'{h%24:02d}h {m:02d}m {s:05.2f}s' if finite else 'nan' for h, m, s, finite in zip(*_sexagesimal(ra,240))]
+
+def formatdec(dec,sexagesimal:bool=False,decimals:int=5,symbol:str='°') -> List[str]:
+    """
+    Formats declinations in degrees, with their sign, as degrees, arcminutes and arcseconds if
+    `sexagesimal` or else as degrees with `decimals` decimals followed by `symbol`.
+    """
+
+    dec = np.asarray(dec,dtype=np.float64).ravel()
+    signs = np.where(np.signbit(dec),'-','+').tolist()
+    if not sexagesimal: return [f'{sign}{abs(a):02.{decimals}f}{symbol}' for sign, a in zip(signs,dec.tolist())]
+    return [f'{sign}{d:02d}° {m:02d}\' {s:05.2f}"' if finite else 'nan'
+            for sign, d, m, s, finite in zip(signs,*_sexagesimal(dec,3600))]
 
 class Angle(np.ndarray):
-    """Represents a single angle or an array of angles."""
+    """Represents a single angle or an array of angles, in degrees."""
 
     def __new__(cls,a):
-        obj = np.asarray(a,dtype=float).view(cls)
-        return obj
-
-    def __add__(self, value):
-        return Angle(super().__add__(value))
-    
-    def __sub__(self, value):
-        return Angle(super().__sub__(value))
-    
-    def __mul__(self, value):
-        return Angle(super().__mul__(value))
-    
-    def __abs__(self):
-        return Angle(super().__abs__())
-    
-    def __truediv__(self, value):
-        return Angle(super().__truediv__(value))
-    
+        return np.asarray(a,dtype=float).view(cls)
+
     @property
     def hms(self):
-        sign = np.sign(self)
-        m, s = np.divmod(np.abs(self)*240, 60)
-        h, m = np.divmod(m, 60)
-        return sign*h, sign*m, sign*s
+        return hms(self)
 
     @property
     def dms(self):
-        sign = np.sign(self)
-        m, s = np.divmod(np.abs(self)*3600, 60)
-        d, m = np.divmod(m, 60)
-        return sign*d, sign*m, sign*s
-    
+        return dms(self)
+
 class WorldCoord:
-    """Object containing a right ascension and declination or arrays thereof."""
+    """
+    Object containing a right ascension and declination or arrays thereof.
+
+    The coordinates are kept in a (..., 2) array of degrees, `array`, of which `ra` and `dec` are views.
+    """
 
     def __init__(self, ra:Angle|float|int, dec:Angle|float|int):
-        self.ra = Angle(ra)
-        self.dec = Angle(dec)
+        self.array = pairs(ra,dec)
+
+    @classmethod
+    def fromarray(cls, radec:np.ndarray) -> 'WorldCoord':
+        """Wraps a (..., 2) array of (RA, Dec) in degrees without copying it."""
+
+        coord = cls.__new__(cls)
+        coord.array = np.asarray(radec,dtype=np.float64)
+        return coord
+
+    @property
+    def ra(self) -> Angle:
+        return Angle(self.array[...,0])
+
+    @property
+    def dec(self) -> Angle:
+        return Angle(self.array[...,1])
 
     def __iter__(self):
         return iter((self.ra,self.dec))
-    
+
     def __getitem__(self,index):
         return (self.ra,self.dec)[index]
-    
+
     def __len__(self):
         return 2
-    
+
     def topix(self, wcs:WCS) -> 'PixCoord':
         """Converts world coordinate into pixel coordinates. The origin is the upper-left corner."""
 
-        _radec = np.dstack((self.ra,self.dec))[0]
-        x, _y = wcs.all_world2pix(_radec, 0).T
-        y = wcs.pixel_shape[1] - _y
-        
-        if len(x) == 1:
-            return PixCoord(x[0],y[0])
-        else:
-            return PixCoord(x,y)
-
+        return PixCoord.fromarray(world2pix(self.array,wcs))
 
 class PixCoord:
-    """Object containing an x and y coordinate or arrays thereof."""
-    
+    """
+    Object containing an x and y coordinate or arrays thereof, rounded to whole pixels.
+
+    The coordinates are kept in a (..., 2) array, `array`, of which `x` and `y` are views.
+    """
+
     def __init__(self, x:int|float, y:int|float):
-        self.x = np.round(x)
-        self.y = np.round(y)
+        self.array = np.round(pairs(x,y))
+
+    @classmethod
+    def fromarray(cls, xy:np.ndarray) -> 'PixCoord':
+        """Wraps a rounded copy of (..., 2) pixel coordinates."""
+
+        coord = cls.__new__(cls)
+        coord.array = np.round(np.asarray(xy,dtype=np.float64))
+        return coord
+
+    @property
+    def x(self):
+        return self.array[...,0][()]
+
+    @property
+    def y(self):
+        return self.array[...,1][()]
 
     def __iter__(self):
         return iter((self.x,self.y))
-    
+
     def __getitem__(self,index):
         return (self.x,self.y)[index]
-    
+
     def __len__(self):
         return 2
-    
+
     def toworld(self,wcs:WCS) -> WorldCoord:
         """Converts pixel coordinate into world coordinates. The origin is the upper-left corner."""
 
-        _x, _y = self.x, wcs.pixel_shape[1] - self.y
-        _xy = np.dstack((_x,_y))[0]
-        ra, dec = wcs.all_pix2world(_xy, 0).T
-
-        if len(ra) == 1:
-            return WorldCoord(ra[0],dec[0])
-        else:
-            return WorldCoord(ra,dec)
\ No newline at end of file
+        return WorldCoord.fromarray(pix2world(self.array,wcs))
@@ -11,7 +11,6 @@ from imgmarker import config
 from imgmarker.coordinates import PixCoord, WorldCoord
 import os
 from math import nan, ceil
-from astropy.wcs.utils import proj_plane_pixel_scales
 from typing import TYPE_CHECKING, overload, Literal
 import warnings
 
@@ -148,7 +147,7 @@ class Mark(QGraphicsPathItem):
     @property
     def size(self):
         if self.size_unit == "arcsec":
-            pixel_scale = proj_plane_pixel_scales(self.image.wcs)[0] * 3600
+            pixel_scale = self.image.pixel_scale
             return self.size_value / pixel_scale
         elif self.size_unit == "px":
             return self.size_value
@@ -13,16 +13,20 @@ from PyQt6.QtWidgets import (
     QLineEdit, QGraphicsScene, QGraphicsPixmapItem, QSpinBox,
     QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView,
     QMenu, QColorDialog, QWidgetAction, QComboBox,
+    QProgressDialog, QGraphicsItem,
 )
 
 from PyQt6.QtGui import (
     QIcon, QFont, QClipboard, QAction,
     QPen, QColor, QPixmap, QPainter, QPainterPathStroker,
     QPainterPath, QImage, QShortcut, QDesktopServices,
-    QBrush
+    QBrush, QMouseEvent
 )
     
+from PyQt6 import sip
+
 from PyQt6.QtCore import (
     Qt, QPoint, QKeyCombination, QPointF, 
-    QEvent, QUrl, PYQT_VERSION_STR
+    QEvent, QUrl, PYQT_VERSION_STR, QObject,
+    QRectF, pyqtSignal, QTimer
 )
\ No newline at end of file
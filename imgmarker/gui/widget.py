@@ -6,7 +6,7 @@ Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
 
 """This module contains custom PyQt widgets for Image Marker."""
 
-from imgmarker.gui.pyqt import Qt, QLabel, QWidget, QHBoxLayout, QLineEdit, QFrame, QLineEdit, QSizePolicy, QFileDialog
+from imgmarker.gui.pyqt import Qt, QLabel, QWidget, QHBoxLayout, QLineEdit, QFrame, QLineEdit, QSizePolicy, QFileDialog, QProgressDialog, QApplication
 import os
 
 class QHLine(QFrame):
@@ -93,6 +93,12 @@ class PosWidget(QWidget):
         label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
         label.setFixedHeight(20)
 
+    def settext(self,x:str,y:str,ra:str,dec:str):
+        """Shows coordinates, leaving the fields whose text has not changed untouched."""
+
+        for widget, text in ((self.x_text,x),(self.y_text,y),(self.ra_text,ra),(self.dec_text,dec)):
+            if widget.text() != text: widget.setText(text)
+
     def cleartext(self):
         self.x_text.setText('')
         self.y_text.setText('')
@@ -147,4 +153,24 @@ class DefaultDialog(QFileDialog):
 
     def selectedFiles(self):
         if self.closed: return None
-        else: return super().selectedFiles()
\ No newline at end of file
+        else: return super().selectedFiles()
+
+
+class ProgressDialog(QProgressDialog):
+    """
+    Progress dialog that can be passed as a `progress(done, total)` callback to long-running functions.
+
+    The dialog only appears if the operation takes longer than half a second, and closes itself when done.
+    """
+
+    def __init__(self,text:str):
+        super().__init__(text,None,0,0)
+        self.setWindowTitle('Image Marker')
+        self.setWindowModality(Qt.WindowModality.ApplicationModal)
+        self.setMinimumDuration(500)
+        self.setAutoClose(True)
+
+    def __call__(self,done:int,total:int):
+        self.setMaximum(total)
+        self.setValue(done)
+        QApplication.processEvents()
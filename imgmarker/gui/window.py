@@ -15,12 +15,12 @@ from imgmarker.gui.pyqt import (
     Qt, QPoint, QSpinBox, QMessageBox, QTableWidget, 
     QTableWidgetItem, QHeaderView, QShortcut,
     QDesktopServices, QUrl, QMenu, QColorDialog,
-    QPen, QBrush, QPixmap, QPainter, PYQT_VERSION_STR, QComboBox
+    QPen, QBrush, QPixmap, QImage, QPainter, PYQT_VERSION_STR, QComboBox, QTimer
 )
-from imgmarker.gui import Screen, QHLine, PosWidget, RestrictedLineEdit, DefaultDialog
+from imgmarker.gui import Screen, QHLine, PosWidget, RestrictedLineEdit, DefaultDialog, ProgressDialog
 from imgmarker import HEART_SOLID, HEART_CLEAR, OS, __version__, __license__, __docsurl__
 from imgmarker import io, image, config
-from imgmarker.coordinates import Angle, PixCoord, WorldCoord
+from imgmarker.coordinates import world2pix, formatra, formatdec
 import sys
 from math import floor, inf, nan
 import numpy as np
@@ -391,8 +391,27 @@ class FrameWindow(QWidget):
         self.value_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.value_label.setText(f'Frame: {self.slider.value()}')
 
+        # Playback
+        self.play_button = QPushButton('Play')
+        self.play_button.setCheckable(True)
+        self.play_button.toggled.connect(lambda checked: self.play_button.setText('Pause' if checked else 'Play'))
+
+        self.fps_box = QSpinBox()
+        self.fps_box.setRange(1,60)
+        self.fps_box.setSuffix(' fps')
+        self.fps_box.setValue(config.PLAYBACK_FPS)
+
+        self.rate_label = QLabel()
+        self.rate_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        playback_layout = QHBoxLayout()
+        playback_layout.addWidget(self.play_button)
+        playback_layout.addWidget(self.fps_box)
+        playback_layout.addWidget(self.rate_label)
+
         layout.addWidget(self.value_label)
         layout.addWidget(self.slider)
+        layout.addLayout(playback_layout)
         layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setFixedWidth(int(Screen.width()/6))
         self.setFixedHeight(layout.sizeHint().height())
@@ -728,6 +747,11 @@ class MainWindow(QMainWindow):
         self.image_view = image.ImageView(self.image_scene)
         self.image_view.mouseMoveEvent = self.mouseMoveEvent
         self.clipboard = QApplication.clipboard()
+        self.prefetcher = image.Prefetcher()
+        self.prefetcher.rendered.connect(self.loaded)
+        self.prefetcher.previewed.connect(self.previewed)
+        self.framebuffer = image.FrameBuffer()
+        self.framerate = image.FrameRate()
 
         #Initialize inserting duplicates at random
         self.images_seen_since_duplicate_count = 0 #keeps track of how many images have been seen since last duplicate
@@ -737,11 +761,28 @@ class MainWindow(QMainWindow):
 
         # Setup child windows
         self.blur_window = BlurWindow()
-        self.blur_window.slider.sliderReleased.connect(partial(self.image.blur,self.blur_window.slider.sliderPosition))
+        self.blur_window.slider.sliderReleased.connect(self.blur)
+        self.blur_window.slider.valueChanged.connect(self.blurpreview)
         
         self.frame_window = FrameWindow()
-        self.frame_window.slider.valueChanged.connect(self.image.seek)
+        self.frame_window.slider.valueChanged.connect(self.seekframe)
         self.frame_window.slider.setMaximum(self.image.n_frames-1)
+        self.frame_window.play_button.toggled.connect(self.play)
+        self.frame_window.fps_box.valueChanged.connect(self.setfps)
+
+        self.playback = QTimer(self)
+        self.playback.setTimerType(Qt.TimerType.PreciseTimer)
+        self.playback.timeout.connect(self.playframe)
+
+        # Mouse moves are coalesced so that the cursor readout is updated at most once per interval
+        self.pos_timer = QTimer(self)
+        self.pos_timer.setSingleShot(True)
+        self.pos_timer.setInterval(config.CURSOR_INTERVAL)
+        self.pos_timer.timeout.connect(self.flush_pos)
+        self.pos_pending = False
+        self.pos_state:tuple = None
+        self.pos_events = 0
+        self.pos_updates = 0
 
         self.settings_window = SettingsWindow(self)
         # self.settings_window.show_sexagesimal_box.stateChanged.connect(self.show_sexagesimal)
@@ -846,6 +887,17 @@ class MainWindow(QMainWindow):
         import_ims_action.triggered.connect(self.import_ims)
         file_menu.addAction(import_ims_action)
 
+        ### Image metadata index
+        verify_index_action = QAction('Verify Image Index', self)
+        verify_index_action.setToolTip('Re-read the metadata of new or modified images and forget deleted ones')
+        verify_index_action.triggered.connect(partial(self.update_index,False))
+        file_menu.addAction(verify_index_action)
+
+        rebuild_index_action = QAction('Rebuild Image Index', self)
+        rebuild_index_action.setToolTip('Re-read the metadata of every image')
+        rebuild_index_action.triggered.connect(partial(self.update_index,True))
+        file_menu.addAction(rebuild_index_action)
+
         file_menu.addSeparator()
 
         ### Import mark file
@@ -979,13 +1031,24 @@ class MainWindow(QMainWindow):
         zscale_action.setCheckable(True)
         interval_menu.addAction(zscale_action)
 
+        percentile_action = QAction('99.5%', self)
+        percentile_action.setCheckable(True)
+        interval_menu.addAction(percentile_action)
+
         minmax_action.triggered.connect(partial(setattr,self,'interval',image.Interval.MINMAX))
         minmax_action.triggered.connect(partial(minmax_action.setChecked,True))
         minmax_action.triggered.connect(partial(zscale_action.setChecked,False))
+        minmax_action.triggered.connect(partial(percentile_action.setChecked,False))
 
         zscale_action.triggered.connect(partial(setattr,self,'interval',image.Interval.ZSCALE))
         zscale_action.triggered.connect(partial(minmax_action.setChecked,False))
         zscale_action.triggered.connect(partial(zscale_action.setChecked,True))
+        zscale_action.triggered.connect(partial(percentile_action.setChecked,False))
+
+        percentile_action.triggered.connect(partial(setattr,self,'interval',image.Interval.PERCENTILE))
+        percentile_action.triggered.connect(partial(minmax_action.setChecked,False))
+        percentile_action.triggered.connect(partial(zscale_action.setChecked,False))
+        percentile_action.triggered.connect(partial(percentile_action.setChecked,True))
 
         ### Marks Menu
         self.mark_menu = MarkMenu(self)
@@ -1039,6 +1102,7 @@ class MainWindow(QMainWindow):
         self.update_marks()
         self.update_categories()
         self.settings_window.update_duplicate_percentage()
+        self.prefetch()
 
     def __init_data__(self):
         """Initializes images."""
@@ -1051,7 +1115,7 @@ class MainWindow(QMainWindow):
         
         # Find all images in image directory
         try:
-            self.images, self.idx = io.glob(edited_images=self.images)
+            self.images, self.idx = io.glob(edited_images=self.images,progress=ProgressDialog('Reading image metadata...'))
             self.image = self.images[self.idx]
             self.image.seek(self.frame)
             self.image.seen = True
@@ -1063,14 +1127,14 @@ class MainWindow(QMainWindow):
             if config.IMAGE_DIR == None: sys.exit()
             config.update()
             
-            self.images, self.idx = io.glob(edited_images=self.images)
+            self.images, self.idx = io.glob(edited_images=self.images,progress=ProgressDialog('Reading image metadata...'))
             if len(self.images) < 1 and self.idx == 0:
                 while len(self.images) < 1:
                     invalid_dir_msg = "The chosen directory does not contain compatible images. Please pick a new directory."
                     invalid_dir_win = QMessageBox.information(None, "Image Marker", invalid_dir_msg)
                     config.IMAGE_DIR = _open_ims()
                     config.update()
-                    self.images, self.idx = io.glob(edited_images=self.images)
+                    self.images, self.idx = io.glob(edited_images=self.images,progress=ProgressDialog('Reading image metadata...'))
             self.image = self.images[self.idx]
             self.image.seek(self.frame)
             self.image.seen = True
@@ -1095,6 +1159,7 @@ class MainWindow(QMainWindow):
         self._interval_str = value
         for img in self.images: img.interval = value
         self.image.rescale()
+        self.prefetch()
         
     @property
     def stretch(self): return self._stretch_str
@@ -1103,6 +1168,7 @@ class MainWindow(QMainWindow):
         self._stretch_str = value
         for img in self.images: img.stretch = value
         self.image.rescale()
+        self.prefetch()
 
     def apply_scaling(self) -> None:
         """Applies the currently active stretch/interval to all loaded images.
@@ -1204,7 +1270,22 @@ class MainWindow(QMainWindow):
         """Operations executed when the mouse cursor is moved."""
 
         super().mouseMoveEvent(a0)
-        self.update_pos()
+        self.pos_events += 1
+
+        # The first move updates the readout at once, and later ones until the interval is over are
+        # coalesced into a single update when it ends
+        if self.pos_timer.isActive(): self.pos_pending = True
+        else:
+            self.update_pos()
+            self.pos_timer.start()
+
+    def flush_pos(self):
+        """Updates the cursor readout for mouse moves coalesced during the last interval."""
+
+        if self.pos_pending:
+            self.pos_pending = False
+            self.update_pos()
+            self.pos_timer.start()
 
     def closeEvent(self, a0):
         self.update_comments()
@@ -1215,6 +1296,9 @@ class MainWindow(QMainWindow):
         self.controls_window.close()
         self.settings_window.close()
         self.welcome_window.close()
+        self.prefetcher.shutdown()
+        self.playback.stop()
+        self.framebuffer.shutdown()
         return super().closeEvent(a0)
 
     # === Actions ===
@@ -1282,7 +1366,8 @@ class MainWindow(QMainWindow):
         group_names_old = config.GROUP_NAMES.copy()
 
         config.SAVE_DIR = save_dir
-        config.IMAGE_DIR, config.GROUP_NAMES, config.CATEGORY_NAMES, config.GROUP_MAX, config.RANDOMIZE_ORDER, left_click_group = config.read()
+        (config.IMAGE_DIR, config.GROUP_NAMES, config.CATEGORY_NAMES, config.GROUP_MAX, config.RANDOMIZE_ORDER, left_click_group,
+         config.PREFETCH_DEPTH, config.PREFETCH_WORKERS) = config.read()
         config.set_left_click_group(left_click_group)
         config.update()
 
@@ -1299,7 +1384,7 @@ class MainWindow(QMainWindow):
             self.images_seen_since_duplicate_count = 0
             self.duplicates_seen = []
 
-        self.images, self.idx = io.glob(edited_images=[])
+        self.images, self.idx = io.glob(edited_images=[],progress=ProgressDialog('Reading image metadata...'))
         self.N = len(self.images)
 
         for i, box in enumerate(self.category_boxes): 
@@ -1361,7 +1446,7 @@ class MainWindow(QMainWindow):
         invalid_dir_msg = "The chosen directory does not contain compatible images. Please pick a new directory."
 
         config.IMAGE_DIR = new_image_dir
-        new_images, new_idx = io.glob(edited_images=[])
+        new_images, new_idx = io.glob(edited_images=[],progress=ProgressDialog('Reading image metadata...'))
 
         while len(new_images) < 1:
             invalid_dir_win = QMessageBox.information(None, "Image Marker", invalid_dir_msg)
@@ -1372,7 +1457,7 @@ class MainWindow(QMainWindow):
                 return
             else:
                 config.IMAGE_DIR = new_image_dir
-                new_images, new_idx = io.glob(edited_images=[])
+                new_images, new_idx = io.glob(edited_images=[],progress=ProgressDialog('Reading image metadata...'))
 
         if new_image_dir != _image_dir:
             del self.order; del self.duplicates_seen; del self.images
@@ -1395,6 +1480,17 @@ class MainWindow(QMainWindow):
         self.save()
         self.export_votable_action.setEnabled(any(img.wcs is not None for img in self.images))
 
+    def update_index(self, rebuild:bool=False) -> None:
+        """Verifies or rebuilds the image metadata index and reports how many entries were reused and rescanned."""
+
+        progress = ProgressDialog('Reading image metadata...')
+
+        with io.MetadataIndex() as index:
+            if rebuild: index.rebuild(io.imagepaths(),progress)
+            else: index.verify(io.imagepaths(),progress)
+
+        QMessageBox.information(self, 'Image Index', index.report())
+
     def import_markfile(self, **kwargs):
         """Method for opening a catalog file."""
         if 'src' not in kwargs:
@@ -1459,20 +1555,10 @@ class MainWindow(QMainWindow):
 
         if has_wcs:
             ra, dec = mark_to_copy.wcs_center
-        
-            if self.settings_window.show_sexagesimal_box.isChecked():
-                ra_h,ra_m,ra_s = ra.hms
-                dec_d,dec_m,dec_s = dec.dms
-
-                ra_str = rf'{np.abs(ra_h):02.0f}h {np.abs(ra_m):02.0f}m {np.abs(ra_s):05.2f}s'
-                dec_str = f'{np.abs(dec_d):02.0f}° {np.abs(dec_m):02.0f}\' {np.abs(dec_s):05.2f}\"'.replace('-', '')
 
-            else:
-                ra_str = f'{ra:03.6f}'
-                dec_str = f'{np.abs(dec):02.6f}'
-
-            if dec > 0: dec_str = '+' + dec_str
-            else: dec_str = '-' + dec_str
+            sexagesimal = self.settings_window.show_sexagesimal_box.isChecked()
+            ra_str, = formatra(ra,sexagesimal,decimals=6,symbol='')
+            dec_str, = formatdec(dec,sexagesimal,decimals=6,symbol='')
             
             string_copy = ra_str + ", " + dec_str
 
@@ -1567,10 +1653,54 @@ class MainWindow(QMainWindow):
         self.save()
 
     def shiftframe(self,delta:int):
-        self.image.seek(self.frame+delta)
+        self.seekframe(self.image.frame+delta)
+        self.frame_window.slider.setValue(self.frame)
+
+    def seekframe(self,frame:int):
+        """Shows a frame of the current image, from the frame buffer if it has been rendered, and buffers the frames around it."""
+
+        frame = self.image.wrapframe(frame)
+        if frame == self.image.frame: return
+
+        render = self.framebuffer.take(self.image,frame)
+        if render is not None: self.image.load(render)
+        else: self.image.seek(frame)
 
         self.frame = self.image.frame
-        self.frame_window.slider.setValue(self.frame)
+        self.framebuffer.update(self.image,self.frame)
+
+        # Frames can have their own WCS
+        self.update_pos()
+
+    def play(self,checked:bool):
+        """Starts or stops playing the frames of the current image."""
+
+        if checked and (self.image.n_frames > 1):
+            self.framerate.reset()
+            self.framebuffer.update(self.image,self.image.frame)
+            self.playback.start(round(1000/self.frame_window.fps_box.value()))
+        else:
+            self.playback.stop()
+            self.frame_window.play_button.setChecked(False)
+
+    def setfps(self,fps:int):
+        self.playback.setInterval(round(1000/fps))
+
+    def playframe(self):
+        """
+        Shows the next frame during playback if it has been rendered, and the achieved frame rate.
+
+        Frames that are not rendered in time are waited for rather than read on the spot, so playback
+        never blocks the window; the number of such waits tells whether rendering or showing the
+        frames limits the frame rate.
+        """
+
+        frame = self.image.wrapframe(self.image.frame+1)
+        shown = self.framebuffer.ready(self.image,frame)
+        if shown: self.frame_window.slider.setValue(frame)
+
+        self.framerate.tick(shown)
+        self.frame_window.rate_label.setText(f'{self.framerate.fps:.1f} fps ({self.framerate.waits} waits)')
             
     def enter(self):
         """Enter the text in the comment box into the image."""
@@ -1674,35 +1804,36 @@ class MainWindow(QMainWindow):
 
     # === Update methods ===
     def update_pos(self):
-        # Mark if hovering over image
+        """
+        Updates the cursor readout.
+
+        The readout only depends on the pixel under the cursor, the image, its WCS and the coordinate
+        format, so nothing is done unless one of them changed since the last update. `pos_events` and
+        `pos_updates` count the mouse moves received and the readouts computed.
+        """
+
         pix_pos = self.image_view.mouse_pix_pos()
         x, y = pix_pos.x(), pix_pos.y()
+        inview = self.inview(x,y)
 
-        if self.inview(x,y):
+        state = (x, y, self.settings_window.show_sexagesimal_box.isChecked(), self.image, self.image.wcs) if inview else None
+        if (state is None) and (self.pos_state is None): return
+        if (state is not None) and (self.pos_state is not None):
+            if (state[:3] == self.pos_state[:3]) and all(a is b for a, b in zip(state[3:],self.pos_state[3:])): return
+        self.pos_state = state
+
+        if inview:
+            self.pos_updates += 1
             _x, _y = x, self.image.height - y
 
-            try: ra, dec = self.image.wcs.all_pix2world([[_x, _y]], 0)[0]
+            try: ra, dec = self.image.pix2world(_x,_y)
             except: ra, dec = nan, nan
 
-            if self.settings_window.show_sexagesimal_box.isChecked():
-                ra_h,ra_m,ra_s = Angle(ra).hms
-                dec_d,dec_m,dec_s = Angle(dec).dms
-
-                ra_str = rf'{np.abs(ra_h):02.0f}h {np.abs(ra_m):02.0f}m {np.abs(ra_s):05.2f}s'
-                dec_str = f'{np.abs(dec_d):02.0f}° {np.abs(dec_m):02.0f}\' {np.abs(dec_s):05.2f}\"'.replace('-', '')
-
-            else:
-                ra_str = f'{ra:03.5f}°'
-                dec_str = f'{np.abs(dec):02.5f}°'
-
-            if dec > 0: dec_str = '+' + dec_str
-            else: dec_str = '-' + dec_str
+            sexagesimal = self.settings_window.show_sexagesimal_box.isChecked()
+            ra_str, = formatra(ra,sexagesimal)
+            dec_str, = formatdec(dec,sexagesimal)
 
-            self.pos_widget.x_text.setText(f'{x} px')
-            self.pos_widget.y_text.setText(f'{y} px')
-
-            self.pos_widget.ra_text.setText(ra_str)
-            self.pos_widget.dec_text.setText(dec_str)
+            self.pos_widget.settext(f'{x} px',f'{y} px',ra_str,dec_str)
 
         else:
             self.pos_widget.cleartext()
@@ -1724,12 +1855,6 @@ class MainWindow(QMainWindow):
     def update_images(self):
         """Updates previous image with a new image."""
 
-        # Disconnect sliders from previous image
-        try:
-            self.blur_window.slider.sliderReleased.disconnect()
-            self.frame_window.slider.valueChanged.disconnect(self.image.seek)
-        except: pass
-
         # Update scene
         _w, _h = self.image.width, self.image.height
         try: self.image.close()
@@ -1754,7 +1879,17 @@ class MainWindow(QMainWindow):
         # Continue update_images
         self.frame = self.image.frame
         self.image = self.images[self.idx]
-        self.image.seek(self.frame)
+
+        # Large images that are not ready are previewed while they are rendered in the background
+        if self.prefetcher.ready(self.image,self.frame):
+            render = self.prefetcher.take(self.image,self.frame)
+            if render is not None: self.image.load(render)
+            else: self.image.seek(self.frame)
+        else:
+            if self.image.quickpreview: self.image.preview(self.frame)
+            else: self.image.frame = self.image.wrapframe(self.frame)
+            self.prefetcher.request(self.image,self.frame,preview=not self.image.quickpreview)
+
         self.image_scene.update_image(self.image)
         if self.image.name not in self.order:   # or self.image.duplicate == True: This could be added to preserve order when duplicates are being inserted, but the use case for someone randomizing
                 self.order.append(self.image.name)   # who wants to keep the order if duplicates have been seen and then they turn off and back on randomization is quite low
@@ -1771,13 +1906,14 @@ class MainWindow(QMainWindow):
              
         # Update sliders
         self.blur_window.slider.setValue(int(self.image.r*10))
-        self.frame_window.slider.setValue(self.frame)
-
-        self.blur_window.slider.sliderReleased.connect(partial(self.image.blur,self.blur_window.slider.sliderPosition))
-        self.frame_window.slider.valueChanged.connect(self.image.seek)
+        self.blur_window.slider.setMaximum(self.blur_max)
 
+        # The new image is already shown at its frame, so the slider is moved without seeking
+        self.frame_window.slider.blockSignals(True)
         self.frame_window.slider.setMaximum(self.image.n_frames-1)
-        self.blur_window.slider.setMaximum(self.blur_max)
+        self.frame_window.slider.setValue(self.image.frame)
+        self.frame_window.slider.blockSignals(False)
+        self.frame_window.value_changed(self.image.frame)
 
         # Update image label
         seen_text = "<span style='color: #3CB043;'><b>(seen)</b></span> " if self.image.seen else ""
@@ -1786,10 +1922,14 @@ class MainWindow(QMainWindow):
         # Update menus
         self.update_mark_menu()
 
+        # Frames are only buffered once they are stepped through or played
+        self.framebuffer.clear()
         if self.image.n_frames > 1:
             self.frame_action.setEnabled(True)
+            if self.playback.isActive(): self.framebuffer.update(self.image,self.image.frame)
         else:
             self.frame_action.setEnabled(False)
+            self.play(False)
 
         if self.image.wcs == None:
             self.settings_window.show_sexagesimal_box.setEnabled(False)
@@ -1799,6 +1939,47 @@ class MainWindow(QMainWindow):
         # Set image as seen
         self.image.seen = True
 
+        # Start rendering the images around this one
+        self.prefetch()
+
+    def blur(self):
+        """
+        Blurs the current image with the radius of the blur slider.
+
+        The radius is set straight away, but unless the result is cached it is computed in the
+        background; the preview shown while dragging stays up until it is done.
+        """
+
+        self.image.setradius(self.blur_window.slider.sliderPosition())
+        cached = image.CACHE.displaykey(*self.image.key()) in image.CACHE
+
+        if cached or (self.image.array is None) or (self.prefetcher.pool is None): self.image.blur()
+        else: self.prefetcher.request(self.image,self.image.frame)
+
+    def blurpreview(self,value:int):
+        """Previews the blur on a downsampled copy of the current image while the blur slider is dragged."""
+
+        if self.blur_window.slider.isSliderDown(): self.image.blurpreview(value)
+
+    def loaded(self,render:'image.Render'):
+        """Shows a render of the current image done in the background, e.g. in place of a preview."""
+
+        # Ignore renders of other images, or with settings that have since changed
+        if render.key != self.image.key(): return
+
+        self.prefetcher.take(self.image,self.image.frame)
+        self.image.load(render)
+
+    def previewed(self,key:tuple,qimage:QImage):
+        """Shows a preview of the current image read in the background, unless its render has been shown since."""
+
+        if (key != self.image.key()) or (key != self.prefetcher.current): return
+        self.image.preview(key[1],qimage)
+
+    def prefetch(self):
+        """Renders the neighbours of the current image in the background."""
+
+        self.prefetcher.update(self.images,self.idx,self.frame)
     
     def update_comments(self):
         """Updates image comment with the contents of the comment box."""
@@ -1846,21 +2027,17 @@ class MainWindow(QMainWindow):
             # get imageless marks with coordinates in x/y
             marks_pix = [mark for mark in self.imageless_marks if hasattr(mark,'_center') ]
 
-            # create list of ras/decs
-            ra = [float(mark.wcs_center.ra) for mark in marks_world]
-            dec = [float(mark.wcs_center.dec) for mark in marks_world]
-
-            # create list of x/y
-            x = [mark.center.x for mark in marks_pix]
-            y = [mark.center.y for mark in marks_pix]
+            # (N, 2) arrays of ras/decs and x/y, converting all ras/decs into x/y at once
+            radec = np.array([mark.wcs_center.array for mark in marks_world],dtype=np.float64).reshape(-1,2)
+            xy = np.array([mark.center.array for mark in marks_pix],dtype=np.float64).reshape(-1,2)
 
-            # create pixcoords, converting ras/decs into x/y
-            world_pix = WorldCoord(ra,dec).topix(self.image.wcs)
-            pix_pix = PixCoord(x,y)
+            # Marks are placed at whole pixels, so they are rounded before checking that they are in view
+            if (len(radec) > 0) and (self.image.wcs is not None): world_pix = np.round(world2pix(radec,self.image.wcs))
+            else: world_pix = np.full_like(radec,nan)
 
             # find which coordinates are inside the image
-            world_filter = self.inview(world_pix.x,world_pix.y)
-            pix_filter = self.inview(pix_pix.x,pix_pix.y)
+            world_filter = self.inview(world_pix[:,0],world_pix[:,1])
+            pix_filter = self.inview(xy[:,0],xy[:,1])
 
             # add marks to image scene if it is inside the image
             for mark, viewable in zip(marks_world, world_filter):
@@ -6,27 +6,41 @@ Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
 
 """This module contains code for the `Image` class and image manipulation."""
 
-from imgmarker.gui.pyqt import QImage, QGraphicsPixmapItem, QGraphicsView, QGraphicsScene, QPixmap, Qt, QPointF, QApplication
+from imgmarker.gui.pyqt import QImage, QGraphicsPixmapItem, QGraphicsView, QGraphicsScene, QPixmap, Qt, QPointF, QApplication, QGraphicsItem, QPainterPath, QRectF, sip
 from imgmarker.gui import Mark, MarkLabel
 from io import StringIO
 import os
-from math import floor
+import re
+from math import floor, ceil
 import PIL.Image as pillow
 from PIL.TiffTags import TAGS
 from math import nan
 import numpy as np
-from typing import overload, Union, List, Set
-from astropy.visualization import ZScaleInterval, MinMaxInterval, ManualInterval, LinearStretch, LogStretch
-from . import fits
+from typing import overload, Callable, Union, List, Dict, Tuple
+from astropy.visualization import ZScaleInterval, MinMaxInterval, ManualInterval, PercentileInterval, LinearStretch, LogStretch, BaseInterval, BaseStretch
+from . import fits, tiff
 from .convolution import gaussian_filter
+from .cache import CACHE, FrameCache
+from .prefetch import Prefetcher
+from .frames import FrameBuffer, FrameRate
+from .tiles import Pyramid
+from .skygrid import SkyGrid
+from .histogram import Histogram
+from .buffers import scratch
+from . import parallel
+from imgmarker import config
 from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
 from enum import Enum
 from copy import deepcopy
+from functools import partial
+from weakref import WeakValueDictionary
 import warnings
 
 class Interval:
     ZSCALE = ZScaleInterval()
     MINMAX = MinMaxInterval()
+    PERCENTILE = PercentileInterval(99.5)
     
 class Stretch:
     LINEAR = LinearStretch()
@@ -60,34 +74,52 @@ def pathtoformat(path:str):
     if ext in {'tiff', 'tif'}: return 'TIFF'
     if ext in {'fit', 'fits'}: return 'FITS'
 
-def align8to32(bytes: bytes, width: int, bits_per_pixel: str) -> bytes:
+def qbuffer(height:int,width:int,mode:Mode) -> np.ndarray:
     """
-    converts each scanline of data from 8 bit to 32 bit aligned. slightly modified from Pillow
+    Allocates an array that a `QImage` of `mode` can use without copying.
+
+    QImage requires each scanline to start on a 32-bit boundary, so rows are padded to a multiple of
+    4 bytes and the returned array is a view of the padded buffer with the shape of the image.
+    """
+
+    n = {Mode.RGB: 3, Mode.RGBA: 4}.get(mode,1)
+    itemsize = mode.iinfo.bits//8
+    bytes_per_line = -(-width*n*itemsize//4)*4
+
+    buffer = np.empty((height,bytes_per_line),dtype=np.uint8)
+    array = buffer.view(mode.iinfo.dtype)[:, :width*n]
+    return array.reshape((height,width,n)) if n > 1 else array
+
+def qaligned(array:np.ndarray,mode:Mode) -> bool:
+    """Whether `array` can back a `QImage` of `mode` as it is."""
+
+    return ((array.dtype == mode.iinfo.dtype) and (array.strides[0] % 4 == 0) and
+            (array.ctypes.data % 4 == 0) and array[0].flags.c_contiguous)
+
+def toqimage(array:np.ndarray,mode:Mode) -> QImage:
+    """
+    Wraps an array in a `QImage` without copying it, if it is laid out as a QImage expects (as arrays
+    from `qbuffer` are); otherwise copies it once into such an array.
     """
 
-    # calculate bytes per line and the extra padding if needed
-    bits_per_line = bits_per_pixel * width
-    full_bytes_per_line, remaining_bits_per_line = divmod(bits_per_line, 8)
-    bytes_per_line = full_bytes_per_line + (1 if remaining_bits_per_line else 0)
+    width, height  = array.shape[1], array.shape[0]
 
-    extra_padding = -bytes_per_line % 4
+    if not qaligned(array,mode):
+        buffer = qbuffer(height,width,mode)
+        buffer[...] = array
+        array = buffer
 
-    # already 32 bit aligned by luck
-    if not extra_padding:
-        return bytes
+    qim = QImage(sip.voidptr(array.ctypes.data),width,height,array.strides[0],mode.format)
 
-    new_data = [
-        bytes[i * bytes_per_line : (i + 1) * bytes_per_line] + b"\x00" * extra_padding
-        for i in range(len(bytes) // bytes_per_line)
-    ]
+    # QImage does not take ownership of the buffer
+    qim._data = array
 
-    return b"".join(new_data)
+    return qim
 
 def vibrance(c,mode:Mode):
-    if mode == Mode.RGB:
-        v = np.max(c, axis=2)
-    elif mode == Mode.RGBA:
-        v = np.max(c[:, :, :3], axis=2)
+    # Pairwise maxima are much faster than a reduction over a short last axis
+    if (mode == Mode.RGB) or (mode == Mode.RGBA):
+        v = np.maximum(np.maximum(c[:, :, 0], c[:, :, 1]), c[:, :, 2])
     else: 
         v = c
     return v
@@ -95,7 +127,7 @@ def vibrance(c,mode:Mode):
 def read_wcs(f):
     """Reads WCS information from headers if available. Returns `astropy.wcs.WCS`."""
     try:
-        if isinstance(f,fits.PrimaryHDU) or isinstance(f,fits.ImageHDU):
+        if isinstance(f,(fits.PrimaryHDU,fits.ImageHDU,fits.HDU)):
             
             if not 'CRPIX1' in f.header.keys(): return None
             else: 
@@ -125,9 +157,121 @@ def read_wcs(f):
             return WCS(header)
     except: return None
 
-class Image(QGraphicsPixmapItem):
+# Keywords that a WCS solution is read from, including alternate solutions and distortions
+WCS_KEYWORDS = re.compile(r'(WCSAXES|CRPIX|CRVAL|CDELT|CUNIT|CTYPE|CROTA|CD\d|PC\d|PV\d|PS\d|LONPOLE|LATPOLE|RADESYS|RADECSYS|'
+                          r'EQUINOX|EPOCH|MJD-OBS|DATE-OBS|NAXIS|A_|B_|AP_|BP_|DP\d|DQ\d|CPDIS|CQDIS|D2IM|WCSNAME|RESTFRQ|RESTWAV|SPECSYS)')
+
+# WCS solutions by the WCS keywords of the headers they were read from, for as long as a frame uses them
+_wcs:WeakValueDictionary = WeakValueDictionary()
+
+def wcskey(cards:str) -> str:
+    """Returns the WCS keywords of a header given as a string of 80-character cards, which are the same for headers with the same WCS."""
+
+    return ''.join(cards[i:i+80] for i in range(0,len(cards),80) if WCS_KEYWORDS.match(cards[i:i+8]))
+
+def read_frame_wcs(path:str,frame:int,ifds:Tuple[int,...]=None) -> WCS:
+    """
+    Reads the WCS of a frame of an image file, or returns None if it has none.
+
+    Frames whose headers have the same WCS keywords, in this file or any other, share one `WCS`, so
+    it is only constructed once, e.g. for all the extensions of a mosaic with a common solution. The
+    keywords are compared on the unparsed header.
+    """
+
+    if pathtoformat(path) == 'FITS':
+        with fits.hdus(path) as f:
+            hdu = f[frame]
+            key = wcskey(fits.cards(hdu))
+            wcs = _wcs.get(key)
+            if wcs is None: wcs = read_wcs(hdu)
+    else:
+        with tiff.open(path,ifds) as f:
+            f.seek(frame)
+            key = wcskey(str(f.tag_v2.get(270,'')))
+            wcs = _wcs.get(key)
+            if wcs is None: wcs = read_wcs(f)
+
+    if (wcs is not None) and key: _wcs[key] = wcs
+    return wcs
+
+def wcstostring(wcs:WCS) -> str:
+    """Serializes a WCS solution, including its SIP distortion and pixel shape, to a FITS header string."""
+
+    if wcs is None: return None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        header = wcs.to_header(relax=True)
+
+    if wcs.pixel_shape is not None:
+        header['NAXIS'] = 2
+        header['NAXIS1'], header['NAXIS2'] = wcs.pixel_shape
+
+    return header.tostring()
+
+def wcsfromstring(header:str) -> WCS:
+    """Inverse of `wcstostring`."""
+
+    if header is None: return None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return WCS(fits.Header.fromstring(header))
+
+def read_metadata(path:str,frame:int=0) -> dict:
+    """
+    Reads the width, height, mode, number of channels, number of frames, WCS and, for TIFF files, page
+    offsets (see `imgmarker.image.tiff.ifds`) of an image file.
+
+    This is a plain function of the path so that it can be run in worker threads or processes.
+    Raises an exception if the file is not compatible.
+    """
+
+    metadata = {}
+    if pathtoformat(path) == 'FITS':
+        with fits.hdus(path) as f:
+            metadata['width'] = f[frame].header['NAXIS1']
+            metadata['height'] = f[frame].header['NAXIS2']
+
+            # If more than 1 channel, set number of channels and force 8 bits per channel
+            
+            if 'NAXIS3' in f[frame].header.keys():
+                metadata['n_channels'] = abs(f[frame].header['NAXIS3'])
+                metadata['mode'] = Mode.RGB
+
+            # Otherwise set number of channels to 1, get the bit depth from header
+            else: 
+                metadata['n_channels'] = 1
+                if abs(f[frame].header['BITPIX']) == 8: metadata['mode'] = Mode.I8
+                else: metadata['mode'] = Mode.I16
+
+            metadata['n_frames'] = len(f)
+            metadata['wcs'] = read_wcs(f[frame])
+
+    else:
+        # Pages of TIFF files are indexed once, so counting them and seeking to one walks no other page
+        ifds = tiff.ifds(path) if pathtoformat(path) == 'TIFF' else None
+
+        with tiff.open(path,ifds) as f: 
+            f.seek(frame)
+            metadata['width'] = f.width
+            metadata['height'] = f.height
+            metadata['mode'] = Mode[f.mode.replace(';','')]
+            metadata['n_channels'] = len(f.getbands())
+            try: metadata['n_frames'] = f.n_frames
+            except: metadata['n_frames'] = 1
+            metadata['wcs'] = read_wcs(f)
+            metadata['ifds'] = ifds
+    
+    return metadata
+
+class Image:
     """
-    Image class based on the PyQt QGraphicsPixmapItem.
+    Record of an image file: its metadata, the user's annotations, and the currently loaded frame.
+
+    Images are kept in a list for every file in the image directory, so this is a plain class with
+    `__slots__` rather than a Qt graphics item; the image being shown is displayed by the `ImageItem`
+    of an `ImageScene`.
 
     Attributes
     ----------
@@ -156,11 +300,20 @@ class Image(QGraphicsPixmapItem):
         Image height.
 
     wcs: `astropy.wcs.WCS` or None
-        WCS solution.
+        WCS solution of the current frame.
 
-    wcs_center: list[float]
+    wcs_center: `numpy.ndarray`
         Center of the image in WCS coordinates.
 
+    pixel_scale: float
+        Pixel scale of the current frame in arcseconds per pixel.
+
+    footprint: `numpy.ndarray` or None
+        (RA, Dec) of the four corners of the current frame.
+
+    orientation: float
+        Position angle of the upward axis of the current frame, in degrees east of north.
+
     r: float
         Blur radius applied to the image.
 
@@ -185,29 +338,53 @@ class Image(QGraphicsPixmapItem):
     seen: bool
         Whether this image has been seen by the user or not.
 
-    markfiles: list[str]
-        List of paths to the markfiles that have been imported for this image
+    pixmap: `QPixmap` or None
+        Pixmap of the loaded frame.
+
+    vlims: tuple[float, float]
+        Limits of the interval for the current frame. Limits are derived from the histogram of the
+        frame and cached for each frame and interval.
+
+    pyramid: `imgmarker.image.tiles.Pyramid` or None
+        Tiles of the loaded frame, used instead of the pixmap for images larger than `config.TILE_THRESHOLD`.
+
+    item: `ImageItem` or None
+        Graphics item displaying this image, if it is being shown.
     """
+
+    __slots__ = ('path', 'name', 'format', 'incompatible', 'frame', 'duplicate',
+                 'width', 'height', 'mode', 'n_channels', 'n_frames', 'ifds', '_wcs', '_wcs_header', '_frame_wcs', '_geometry',
+                 'r', 'stretch', 'interval', '_vlims', 'comment', 'categories', 'marks', 'dupe_marks',
+                 'undone_marks', 'seen', '_array', 'array', 'pixmap', 'pyramid', 'item', '__weakref__')
     
-    def __init__(self,path:str):
+    def __init__(self,path:str,metadata:dict=None):
         """
         Parameters
         ----------
         path: str 
             Path to the image.
+
+        metadata: dict, optional
+            Metadata as returned by `Image.read_metadata`, e.g. from `imgmarker.io.MetadataIndex`. The WCS
+            may be given as a header string under 'wcs_header' instead of under 'wcs', in which case it is
+            only parsed when first used. An empty dict marks the image as incompatible. If not given, the
+            metadata is read from the file.
         """
         
-        super().__init__(QPixmap())
-
         self.path = path
         self.name = path.split(os.sep)[-1]
         self.format = pathtoformat(path)
         self.incompatible = False
+        self._array = None
+        self.array = None
+        self.pixmap:QPixmap = None
+        self.pyramid:Pyramid = None
+        self.item:ImageItem = None
         if self.format in FORMATS:
             
             self.frame:int = 0
-            metadata = self.read_metadata()
-            if metadata != None:
+            if metadata is None: metadata = self.read_metadata()
+            if metadata:
                 self.incompatible = False
                 self.duplicate = False
                 self.width = metadata['width']
@@ -215,11 +392,16 @@ class Image(QGraphicsPixmapItem):
                 self.mode:Mode = metadata['mode']
                 self.n_channels = metadata['n_channels'] 
                 self.n_frames = metadata['n_frames']
-                self.wcs:WCS = metadata['wcs']
+                self.ifds:Tuple[int,...] = metadata.get('ifds')
+                self._wcs:WCS = metadata.get('wcs')
+                self._wcs_header:str = metadata.get('wcs_header')
+                self._frame_wcs:Dict[int,WCS] = {}
+                self._geometry:Dict[int,tuple] = {}
 
                 self.r:float = 0.0
                 self.stretch = Stretch.LINEAR
                 self.interval = Interval.MINMAX
+                self._vlims:Dict[tuple,tuple] = {}
                 
                 self.comment = 'None'
                 self.categories:List[int] = []
@@ -227,7 +409,6 @@ class Image(QGraphicsPixmapItem):
                 self.dupe_marks:List['Mark'] = []
                 self.undone_marks:List['Mark'] = []
                 self.seen:bool = False
-                self.markfiles:Set[str] = set()
             else:
                 self.incompatible = True
 
@@ -236,10 +417,47 @@ class Image(QGraphicsPixmapItem):
         _copy = memo.get(id_self)
         if _copy is None:
             _copy = type(self)(
-                deepcopy(self.path, memo))
+                deepcopy(self.path, memo), metadata=self.metadata)
             memo[id_self] = _copy
         return _copy
 
+    @property
+    def wcs(self) -> WCS:
+        """WCS of the current frame."""
+
+        return self.framewcs(self.frame)
+
+    @wcs.setter
+    def wcs(self,value:WCS):
+        self._wcs = value
+        self._wcs_header = None
+
+    def framewcs(self,frame:int) -> WCS:
+        """
+        Returns the WCS of a frame.
+
+        The WCS of the first frame is part of the metadata. Those of other frames are read when first
+        used, with `read_frame_wcs`, and kept for the lifetime of the image.
+        """
+
+        if (frame == 0) or (self.n_frames == 1):
+            if self._wcs_header is not None:
+                self._wcs = wcsfromstring(self._wcs_header)
+                self._wcs_header = None
+            return self._wcs
+
+        if frame not in self._frame_wcs:
+            try: self._frame_wcs[frame] = read_frame_wcs(self.path,frame,self.ifds)
+            except Exception: self._frame_wcs[frame] = None
+        return self._frame_wcs[frame]
+
+    @property
+    def metadata(self) -> dict:
+        """Metadata of the image in the form returned by `Image.read_metadata`."""
+
+        return {'width': self.width, 'height': self.height, 'mode': self.mode,
+                'n_channels': self.n_channels, 'n_frames': self.n_frames, 'wcs': self.framewcs(0), 'ifds': self.ifds}
+
     @property
     def scaling(self):
         return self.stretch + ManualInterval(*self.vlims)
@@ -250,112 +468,306 @@ class Image(QGraphicsPixmapItem):
     
     @property
     def vlims(self):
-        v = vibrance(self._array,self.mode) 
-        vlims = self.interval.get_limits(v)
+        return self.limits(self._array,self.frame)
+
+    def limits(self,_array:np.ndarray,frame:int=None,interval:BaseInterval=None) -> tuple:
+        """
+        Returns the limits of an interval (the current interval by default) for raw data.
+
+        The limits are derived from the histogram of the brightness of the data, so switching interval
+        does not require another pass over the pixels. If `frame` is given, the histogram is kept in the
+        frame cache and the limits on the image; otherwise (e.g. for a preview) nothing is cached.
+
+        The interval is read once, so limits computed in a worker thread are stored under the interval
+        they were computed with even if the interval is changed meanwhile.
+        """
+
+        if interval is None: interval = self.interval
+
+        key = (frame, interval)
+        if (frame is not None) and (key in self._vlims): return self._vlims[key]
+
+        histogram = lambda: Histogram(vibrance(_array,self.mode))
+        if frame is not None: histogram = CACHE.fetch(CACHE.histogramkey(self.path,frame),histogram)
+        else: histogram = histogram()
+
+        vlims = histogram.limits(interval)
+        if vlims is None: vlims = interval.get_limits(vibrance(_array,self.mode))
+
+        if frame is not None: self._vlims[key] = vlims
         return vlims
     
     @property
-    def wcs_center(self) -> list:
-        try: return self.wcs.all_pix2world([[self.width/2, self.height/2]], 0)[0]
-        except: return nan, nan
+    def previewstep(self) -> int:
+        """Downsampling factor of the preview, 1 if the image is small enough not to need one."""
+
+        return max(1,ceil(max(self.width,self.height)/config.PREVIEW_SIZE))
+
+    @property
+    def tiled(self) -> bool:
+        """Whether the image is large enough to be drawn from a `Pyramid` of tiles."""
+
+        return self.width*self.height > config.TILE_THRESHOLD
+
+    def geometry(self,name:str,func:Callable[[WCS],object],default=None):
+        """
+        Returns a quantity derived from the WCS of the current frame by `func`, or `default` if it cannot
+        be computed.
+
+        Quantities are computed once per frame and kept with the WCS and size they were derived from, so
+        they are only computed again when the frame shows a different WCS, e.g. after `Image.wcs` is set.
+        """
+
+        wcs = self.wcs
+        size = (self.width, self.height)
+        entry = self._geometry.get(self.frame)
+
+        if (entry is None) or (entry[0] is not wcs) or (entry[1] != size):
+            entry = self._geometry[self.frame] = (wcs, size, {})
+
+        values = entry[2]
+        if name not in values:
+            try: values[name] = func(wcs)
+            except Exception: values[name] = default
+        return values[name]
+
+    @property
+    def wcs_center(self) -> np.ndarray:
+        def center(wcs:WCS) -> np.ndarray:
+            center = wcs.all_pix2world([[self.width/2, self.height/2]], 0)[0]
+            center.flags.writeable = False
+            return center
+        return self.geometry('center',center,(nan, nan))
+
+    @property
+    def pixel_scale(self) -> float:
+        return self.geometry('pixel_scale',lambda wcs: proj_plane_pixel_scales(wcs)[0]*3600,nan)
+
+    @property
+    def footprint(self) -> np.ndarray:
+        def footprint(wcs:WCS) -> np.ndarray:
+            footprint = wcs.calc_footprint(axes=(self.width,self.height))
+            footprint.flags.writeable = False
+            return footprint
+        return self.geometry('footprint',footprint)
+
+    @property
+    def orientation(self) -> float:
+        def orientation(wcs:WCS) -> float:
+            # Direction of the +y pixel axis on the sky, with x of the projection plane pointing east
+            m = wcs.celestial.pixel_scale_matrix
+            return float(np.degrees(np.arctan2(m[0,1],m[1,1])))
+        return self.geometry('orientation',orientation,nan)
+
+    @property
+    def skygrid(self) -> SkyGrid:
+        """`SkyGrid` of the current frame, or None if its WCS is not celestial."""
+
+        return self.geometry('skygrid',lambda wcs: SkyGrid(wcs,self.width,self.height))
+
+    def pix2world(self,x:float,y:float) -> Tuple[float,float]:
+        """
+        Returns the (RA, Dec) of a pixel of the current frame, with the origin at 0 and y increasing
+        upwards as in the WCS, interpolated by the `SkyGrid` of the frame where it is within tolerance.
+        """
+
+        grid = self.skygrid
+        if grid is not None: return grid(x,y)
+        ra, dec = self.wcs.all_pix2world([[x, y]],0)[0]
+        return ra, dec
+
+    def wrapframe(self,frame:int) -> int:
+        """Wraps a frame index around the available frames in the same way as `Image.seek`."""
+
+        frame = floor(frame)
+        if frame > self.n_frames - 1: frame = 0
+        elif frame < 0: frame = self.n_frames - 1
+        return frame
+
+    def read(self,frame:int=None,step:int=1) -> np.ndarray:
+        """
+        Reads the data of a frame.
+
+        Parameters
+        ----------
+        frame: int, optional
+            Frame to read. Defaults to the current frame.
+        step: int, optional
+            Downsampling factor. FITS files are read with a stride, JPEG files are decoded at a reduced
+            scale and other formats are reduced after decoding, so the shape is only approximately the
+            full shape divided by `step`. Defaults to 1.
+        """
+
+        if frame is None: frame = self.frame
 
-    def read(self) -> np.ndarray:
         if self.format == 'FITS':
-            with fits.open(self.path) as f:
-                data = f[self.frame].data
-                if self.n_channels > 1:
-                    data = np.dstack((data[0], data[1], data[2]))
-                data = np.flipud(data)
-                data = (2**self.mode.iinfo.bits - 1) * ((data - np.nanmin(data)) / (np.nanmax(data) - np.nanmin(data)))
+            with fits.hdus(self.path) as f:
+                data = fits.read(f[frame],self.mode.iinfo.bits,step=step)
         
         else:
-            with pillow.open(self.path) as f:
-                f.seek(self.frame)
-                data = np.array(f)
+            # Metadata from an older index has no page offsets, so they are found on first read
+            if (self.ifds is None) and (self.format == 'TIFF'): self.ifds = tiff.ifds(self.path)
+
+            with tiff.open(self.path,self.ifds) as f:
+                f.seek(frame)
+                if step == 1: data = np.array(f)
+                elif f.format == 'JPEG':
+                    f.draft(f.mode,(ceil(f.width/step),ceil(f.height/step)))
+                    data = np.array(f)
+                else:
+                    try: data = np.array(f.reduce(step))
+                    except ValueError: data = np.array(f)[::step,::step]
 
         return data
     
     def read_metadata(self) -> dict:
-        metadata = {}
-        if self.format == 'FITS':
-            with fits.open(self.path) as f:
-                try:
-                    metadata['width'] = f[self.frame].header['NAXIS2']
-                    metadata['height'] = f[self.frame].header['NAXIS1']
-
-                    # If more than 1 channel, set number of channels and force 8 bits per channel
-                    
-                    if 'NAXIS3' in f[self.frame].header.keys():
-                        metadata['n_channels'] = abs(f[self.frame].header['NAXIS3'])
-                        metadata['mode'] = Mode.RGB
-
-                    # Otherwise set number of channels to 1, get the bit depth from header
-                    else: 
-                        metadata['n_channels'] = 1
-                        if abs(f[self.frame].header['BITPIX']) == 8: metadata['mode'] = Mode.I8
-                        else: metadata['mode'] = Mode.I16
-
-                    metadata['n_frames'] = len(f)
-                    metadata['wcs'] = read_wcs(f[self.frame])
-                    
-                except:
-                    warnings.warn(f"File \"{self.name}\" is not compatible and will not be loaded. Skipping \"{self.name}\".")
-                    self.incompatible = True
-                    return None
+        """Reads the metadata of the image, or returns None and marks the image as incompatible if it cannot be read."""
 
-        else:
-            with pillow.open(self.path) as f: 
-                f.seek(self.frame)
-                metadata['width'] = f.width
-                metadata['height'] = f.height
-                metadata['mode'] = Mode[f.mode.replace(';','')]
-                metadata['n_channels'] = len(f.getbands())
-                try: metadata['n_frames'] = f.n_frames
-                except: metadata['n_frames'] = 1
-                metadata['wcs'] = read_wcs(f)
-        
-        return metadata
+        try: return read_metadata(self.path,self.frame)
+        except Exception:
+            self.incompatible = True
+            return None
     
     def close(self):
         self._array = None
         self.array = None
-        self.setPixmap(QPixmap())
+        self.setPixmap(None)
+        self.setPyramid(None)
+
+    def setPixmap(self,pixmap:QPixmap):
+        """Sets the pixmap of the loaded frame, updating the item displaying the image if it is shown."""
+
+        self.pixmap = pixmap
+        if self.item is not None:
+            self.item.setPixmap(pixmap if pixmap is not None else QPixmap())
+
+    def setPyramid(self,pyramid:Pyramid):
+        """Sets the tiles of the loaded frame, updating the item displaying the image if it is shown."""
+
+        if pyramid is self.pyramid: return
+        if self.pyramid is not None: self.pyramid.close()
+
+        self.pyramid = pyramid
+        if self.item is not None: self.item.setPyramid(pyramid)
+
+    def display(self,key:tuple,out:np.ndarray=None,pixmap:QPixmap=None):
+        """Shows a rendered frame, either as a pixmap or, for large images, as a pyramid of tiles of `out`."""
+
+        if pixmap is not None:
+            self.setPyramid(None)
+            self.setPixmap(pixmap)
+        else:
+            self.setPixmap(None)
+            if (self.pyramid is None) or (self.pyramid.key != key):
+                self.setPyramid(Pyramid(key,out,self.toqimage))
+
+    def render(self,frame:int=0) -> 'Render':
+        """
+        Reads, rescales and blurs a frame without touching the displayed pixmap.
+
+        This only reads attributes of the image, so it is safe to call from a worker thread. The stretch,
+        interval and blur radius are read once and passed on, so the render and the arrays it caches
+        match their keys even if the settings change meanwhile.
+        """
+
+        frame = self.wrapframe(frame)
+        key = self.key(frame)
+        _, _, stretch, interval, r = key
+        _array = CACHE.fetch(CACHE.rawkey(self.path,frame),partial(self.read,frame))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            array = CACHE.fetch(CACHE.scaledkey(self.path,frame,stretch,interval),partial(self.scale,_array,frame,stretch,interval))
+            out = self.filter(array,r)
+
+        if self.tiled: return Render(key, _array, array, display=out)
+        else: return Render(key, _array, array, self.toqimage(out))
+
+    @property
+    def quickpreview(self) -> bool:
+        """
+        Whether a preview is read without decoding the full frame: FITS files are read with a stride and
+        JPEG files at a reduced scale. PNG and TIFF files are decoded in full, so their previews are
+        read in the background.
+        """
+
+        return self.format in {'FITS', 'JPEG'}
+
+    def readpreview(self,frame:int=0) -> QImage:
+        """
+        Reads, rescales and blurs a downsampled copy of a frame for `Image.preview`.
+
+        Like `Image.render`, this only reads attributes of the image, and reads the settings once, so it
+        is safe to call from a worker thread.
+        """
+
+        step = self.previewstep
+        _, _, stretch, interval, r = self.key(frame)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            array = self.scale(self.read(frame,step),None,stretch,interval)
+            out = self.filter(array,r/step)
+
+        return self.toqimage(out)
+
+    def preview(self,frame:int=0,qimage:QImage=None):
+        """
+        Shows a downsampled copy of a frame, to be replaced by `Image.load` or `Image.seek`.
+
+        The preview is stretched over the full size of the image, so the scene (and any marks placed
+        on it) keeps using full resolution pixel coordinates. The data arrays are left unset.
+
+        Parameters
+        ----------
+        frame: int, optional
+            Frame to preview. Defaults to 0.
+        qimage: `QImage`, optional
+            Preview read in the background with `Image.readpreview`. If None, it is read here.
+        """
+
+        self.frame = self.wrapframe(frame)
+        if qimage is None: qimage = self.readpreview(self.frame)
+        self.display(None,pixmap=QPixmap.fromImage(qimage))
+
+    def load(self,render:'Render'):
+        """Displays a frame computed by `Image.render`."""
+
+        self.frame = render.key[1]
+        self._array = render.raw
+        self.array = render.array
+        self.width = self._array.shape[1]
+        self.height = self._array.shape[0]
+
+        if render.qimage is None:
+            CACHE.put(CACHE.displaykey(*render.key),render.display)
+            self.display(render.key,out=render.display)
+        else:
+            pixmap = QPixmap.fromImage(render.qimage)
+            CACHE.put(CACHE.displaykey(*render.key),pixmap)
+            self.display(render.key,pixmap=pixmap)
+
+    def key(self,frame:int=None) -> tuple:
+        """Identifies a displayed frame by path, frame, stretch, interval and blur radius."""
+
+        if frame is None: frame = self.frame
+        return (self.path, frame, self.stretch, self.interval, self.r)
     
     def seek(self,frame:int=0):
         """Switches to a new frame if it exists"""
 
         # Set frame
-        frame = floor(frame)
-        
-        if frame > self.n_frames - 1: frame = 0
-        elif frame < 0: frame = self.n_frames - 1
-
-        self.frame = frame
+        self.frame = self.wrapframe(frame)
 
         # Read data from the frame
-        self._array = self.read()
-        self.array = self._array
+        self._array = CACHE.fetch(CACHE.rawkey(self.path,self.frame),self.read)
         self.width = self._array.shape[1]
         self.height = self._array.shape[0]
-        
+
         # Rescale (and blur)
         with np.errstate(divide='ignore', invalid='ignore'):
             self.rescale()
 
     def toqimage(self,array:np.ndarray) -> QImage:
-        width, height  = array.shape[1], array.shape[0]
-        data = array.tobytes()
-
-        if self.mode in {Mode.I16, Mode.I8, Mode.L}: 
-            data = align8to32(data,width,self.mode.iinfo.bits)
-
-        if array.ndim == 3:
-            n = array.shape[2]
-            qim = QImage(data,width,height,n*width,self.mode.format)
-        else:
-            qim = QImage(data,width,height,self.mode.format)
-
-        return qim
+        return toqimage(array,self.mode)
 
     def topixmap(self,array:np.ndarray) -> QPixmap:
         """Creates a QPixmap from an array."""
@@ -364,29 +776,149 @@ class Image(QGraphicsPixmapItem):
         pixmap = QPixmap.fromImage(qimage)
 
         return pixmap
+
+    def scale(self,_array:np.ndarray,frame:int=None,stretch:BaseStretch=None,interval:BaseInterval=None) -> np.ndarray:
+        """
+        Applies a stretch and interval (the current ones by default) to raw data of `frame`, returning an array of the display dtype.
+
+        8- and 16-bit data are mapped through a lookup table, since the result only depends on the value
+        of a pixel (and, for RGB, on its brightness); other data are scaled pixel by pixel in float32.
+        Either way the data are processed a band of rows at a time in reused working buffers, so the
+        output array is the only full size allocation, and bands are processed concurrently by
+        `config.SCALE_THREADS` threads.
+        """
+
+        if stretch is None: stretch = self.stretch
+        scaling = stretch + ManualInterval(*self.limits(_array,frame,interval))
+        rgb = (self.mode == Mode.RGB) or (self.mode == Mode.RGBA)
+        maximum = self.mode.iinfo.max
+
+        lut = None
+        if (_array.dtype == np.uint8) or (not rgb and (_array.dtype == np.uint16)):
+            lut = self.lut(scaling,_array.dtype).ravel()
+
+        out = np.empty(_array.shape,dtype=self.mode.iinfo.dtype)
+        rows = max(1, fits.BAND_BYTES // (4*_array[0].size))
+
+        # Floating point error handling is per thread, so the caller's is passed on to the workers
+        errstate = np.geterr()
+
+        def kernel(start:int,stop:int):
+            with np.errstate(**errstate): _kernel(start,stop)
+
+        def _kernel(start:int,stop:int):
+            src, dst = _array[start:stop], out[start:stop]
+
+            if (lut is not None) and rgb:
+                # Row of the table for the brightness of each pixel, column for the value of each channel
+                index = scratch('index',src.shape[:2],np.uint16)
+                np.left_shift(vibrance(src,self.mode),8,out=index,dtype=np.uint16)
+
+                channel = scratch('channel',src.shape[:2],np.uint16)
+                dst[...] = src
+                for i in range(3):
+                    np.bitwise_or(index,src[:, :, i],out=channel)
+                    np.take(lut,channel,out=dst[:, :, i])
+
+            elif lut is not None:
+                np.take(lut,src,out=dst)
+
+            else:
+                band = scratch('band',src.shape)
+                np.copyto(band,src,casting='unsafe')
+
+                if rgb:
+                    # Calculate scale factor
+                    v = scratch('v',src.shape[:2])
+                    scale = scratch('scale',src.shape[:2])
+                    np.maximum(band[:, :, 0],band[:, :, 1],out=v)
+                    np.maximum(v,band[:, :, 2],out=v)
+                    np.copyto(scale,v)
+                    scaling(scale,out=scale)
+                    scale *= maximum
+                    scale /= v
+
+                    # Apply scale factor and truncate values greater than the max pixel value for this mode
+                    band[:, :, :3] *= scale[:, :, np.newaxis]
+                    np.minimum(band,maximum,out=band)
+
+                else:
+                    scaling(band,out=band)
+                    band *= maximum
+
+                np.copyto(dst,band,casting='unsafe')
+
+        parallel.run(kernel,parallel.split(_array.shape[0],rows))
+        return out
+
+    def lut(self,scaling,dtype:np.dtype) -> np.ndarray:
+        """
+        Returns the display value of every value of an integer `dtype` under `scaling`.
+
+        For grayscale images the table has one entry per value. For RGB images it is indexed by the
+        brightness of a pixel and then the value of a channel, so that the brightness scale factor is
+        applied in the same way as in `Image.scale`.
+        """
+
+        values = np.arange(np.iinfo(dtype).max + 1,dtype=np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if (self.mode == Mode.RGB) or (self.mode == Mode.RGBA):
+                scale = self.mode.iinfo.max*scaling(values)/values
+                lut = np.minimum(self.mode.iinfo.max,np.outer(scale,values))
+            else:
+                lut = self.mode.iinfo.max*scaling(values)
+
+        # Pixels with no brightness (0/0) are black
+        return np.nan_to_num(lut,nan=0.0).astype(self.mode.iinfo.dtype)
     
     def rescale(self):
-        out = self._array.astype(np.float64)
+        # Still showing a preview
+        if self._array is None: return self.seek(self.frame)
 
-        if (self.mode == Mode.RGB) or (self.mode == Mode.RGBA):
-            # Calculate scale factor
-            v = self.v
-            scale = self.mode.iinfo.max*self.scaling(v)/v
+        stretch, interval = self.stretch, self.interval
+        key = CACHE.scaledkey(self.path,self.frame,stretch,interval)
+        self.array = CACHE.fetch(key,partial(self.scale,self._array,self.frame,stretch,interval))
+        self.blur()
 
-            # Apply scale factor
-            out[:, :, 0] *= scale
-            out[:, :, 1] *= scale
-            out[:, :, 2] *= scale
+    def filter(self,array:np.ndarray,r:float=None) -> np.ndarray:
+        """
+        Applies the blur with radius `r` (the current radius by default) to a scaled array, returning an array of the display dtype.
 
-            # Truncate values greater than the max pixel value for this mode
-            out = np.minimum(self.mode.iinfo.max,out)
+        Scaled arrays are integers of the display dtype, so they have no non-finite pixels to leave out of the blur.
+        """
 
-        else:
-            out = self.mode.iinfo.max*self.scaling(out)
+        if r is None: r = self.r
 
-        self.array = out.astype(self.mode.iinfo.dtype)
-        self.blur()
+        # The result is written straight into a buffer that a QImage can use
+        buffer = qbuffer(array.shape[0],array.shape[1],self.mode)
+        if r == 0: np.copyto(buffer,array,casting='unsafe')
+        else: gaussian_filter(array,r,out=buffer)
+        return buffer
     
+    def setradius(self,value):
+        """Sets the blur radius from a blur slider position, or a callable returning one, without applying it."""
+
+        if callable(value): value = value()
+        self.r = floor(value)/2
+
+    def blurpreview(self,value):
+        """
+        Shows the blur at a slider position on a downsampled copy of the frame, without changing the radius.
+
+        This is fast enough to follow the blur slider while it is dragged; the full resolution blur is
+        done when it is released.
+        """
+
+        if self.array is None: return
+        step = self.previewstep
+        r = floor(value)/2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out = self.filter(self.array[::step, ::step],r/step)
+
+        self.display(None,pixmap=self.topixmap(out))
+
     @overload
     def blur(self) -> None: 
         """Applies the blur to the image"""
@@ -394,42 +926,134 @@ class Image(QGraphicsPixmapItem):
     def blur(self,value) -> None:
         """Applies the blur to the image"""
     def blur(self,*args):
-        if len(args) > 0: 
-            value = args[0]
-            if callable(value): r = value()
-            else: r = value
-            self.r = floor(r)/2
-
-        nanmask = ~np.isfinite(self.array)
-        if True in nanmask:
-            # Create auxillary array
-            _out = self.array.copy()
-            _out[nanmask] = 0
-            out = gaussian_filter(_out,self.r)
-
-            # Calculate weights
-            _w = np.ones_like(self.array)
-            _w[nanmask] = 0
-            w = gaussian_filter(_w,self.r)
-
-            # Apply weights, add nans back in
-            with np.errstate(divide='ignore', invalid='ignore'): 
-                out = out/w
-                out[nanmask] = np.nan
+        if len(args) > 0: self.setradius(args[0])
+
+        # Still showing a preview
+        if self.array is None: return self.rescale()
+
+        key = self.key()
+
+        # Large images keep the blurred array, which is drawn in tiles, instead of a pixmap
+        if self.tiled:
+            out = CACHE.fetch(CACHE.displaykey(*key),partial(self.filter,self.array,key[-1]))
+            self.display(key,out=out)
         else:
-            out = gaussian_filter(self.array,self.r)
+            pixmap = CACHE.fetch(CACHE.displaykey(*key),lambda: self.topixmap(self.filter(self.array,key[-1])))
+            self.display(key,pixmap=pixmap)
+
+
+class Render:
+    """
+    A frame of an image that has been read, rescaled, blurred and converted to a `QImage`.
+
+    Attributes
+    ----------
+    key: tuple
+        (path, frame, stretch, interval, blur radius) that this frame was rendered with.
+
+    raw: `numpy.ndarray`
+        Data as read from the file.
+
+    array: `numpy.ndarray`
+        Rescaled data.
+
+    qimage: `QImage` or None
+        Rescaled and blurred data, ready to be converted to a `QPixmap`.
+
+    display: `numpy.ndarray` or None
+        Rescaled and blurred data of an image that is drawn in tiles, in place of `qimage`.
+    """
+
+    def __init__(self,key:tuple,raw:np.ndarray,array:np.ndarray,qimage:QImage=None,display:np.ndarray=None):
+        self.key = key
+        self.raw = raw
+        self.array = array
+        self.qimage = qimage
+        self.display = display
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the render in bytes, counting the raw and rescaled arrays even though they may also be
+        cached on their own, so that a cache holding renders never exceeds its budget.
+        """
+
+        size = self.raw.nbytes + self.array.nbytes
+        if self.qimage is not None: size += self.qimage.width()*self.qimage.height()*self.qimage.depth()//8
+        if self.display is not None: size += self.display.nbytes
+        return size
+
+
+class ImageItem(QGraphicsPixmapItem):
+    """
+    Graphics item displaying the current `Image` of an `ImageScene`.
+
+    Images are drawn from their pixmap, or from the visible tiles of their pyramid if they have one.
+    """
+
+    def __init__(self):
+        super().__init__(QPixmap())
+        self.image:Image = None
+        self.pyramid:Pyramid = None
+
+        # Gives paint() the exposed rectangle, so only visible tiles are drawn
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def setImage(self,image:Image):
+        """Displays `image`, detaching the previously displayed image."""
+
+        if (self.image is not None) and (self.image.item is self): self.image.item = None
+
+        self.image = image
+        self.image.item = self
+        self.setPixmap(image.pixmap if image.pixmap is not None else QPixmap())
+        self.setPyramid(image.pyramid)
+
+    def setPixmap(self,pixmap:QPixmap):
+        """Sets the pixmap, scaling it to cover the full size of the image if it is a downsampled preview."""
+
+        super().setPixmap(pixmap)
+        if (self.image is not None) and not pixmap.isNull():
+            self.setScale(self.image.width/pixmap.width())
+        else:
+            self.setScale(1.0)
+
+    def setPyramid(self,pyramid:Pyramid):
+        """Draws the image from the tiles of `pyramid`, or from the pixmap if it is None."""
+
+        self.prepareGeometryChange()
+        if self.pyramid is not None:
+            try: self.pyramid.updated.disconnect(self.update)
+            except (TypeError, RuntimeError): pass
+
+        self.pyramid = pyramid
+        if pyramid is not None: pyramid.updated.connect(self.update)
+        self.update()
+
+    def boundingRect(self) -> QRectF:
+        if self.pyramid is None: return super().boundingRect()
+        return QRectF(0,0,self.pyramid.width,self.pyramid.height)
 
-        self.setPixmap(self.topixmap(out.astype(self.mode.iinfo.dtype)))
+    def shape(self) -> QPainterPath:
+        if self.pyramid is None: return super().shape()
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
 
+    def paint(self,painter,option,widget=None):
+        if self.pyramid is None: super().paint(painter,option,widget)
+        else: self.pyramid.paint(painter,option.exposedRect)
 
 class ImageScene(QGraphicsScene):
     """A class in which images and marks are stored."""
     def __init__(self,image:Image):
         super().__init__()
         self.image = image
+        self.item = ImageItem()
+        self.item.setImage(self.image)
 
         self.setBackgroundBrush(Qt.GlobalColor.black)
-        self.addItem(self.image)
+        self.addItem(self.item)
         self.setSceneRect(-4*self.image.width,-4*self.image.height,9*self.image.width,9*self.image.height)
 
     def mousePressEvent(self, event):
@@ -448,7 +1072,8 @@ class ImageScene(QGraphicsScene):
 
         # Update the pixmap
         self.image = image
-        self.addItem(self.image)
+        self.item.setImage(self.image)
+        self.addItem(self.item)
         self.setSceneRect(-4*self.image.width,-4*self.image.height,9*self.image.width,9*self.image.height)
 
     @overload
@@ -538,8 +1163,9 @@ class ImageView(QGraphicsView):
         view_pos = self.mapFromGlobal(self.cursor().pos())
         scene_pos = self.mapToScene(view_pos)
 
-        # Get the pixel coordinates (including padding; half-pixel offset required)
-        pix_pos = self.scene().image.mapFromScene(scene_pos)
+        # Scene coordinates are full resolution image pixels, even while a downsampled preview is shown
+        # (including padding; half-pixel offset required)
+        pix_pos = QPointF(scene_pos)
 
         # Correct half-pixel error
         if correction: pix_pos -= QPointF(0.5,0.5)
@@ -0,0 +1,77 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the working buffers that the image pipeline reuses between frames."""
+
+from contextlib import contextmanager
+from threading import local
+from math import prod
+from typing import Iterator
+import numpy as np
+from .cache import CACHE
+
+_buffers = local()
+
+def scratch(name:str,shape:tuple,dtype=np.float32) -> np.ndarray:
+    """
+    Returns a working array of `shape`, reusing the memory of the previous array with the same name.
+
+    Buffers are kept per thread, so workers rendering in the background never share one, and grow to
+    the largest shape requested, so processing images of the same size (or bands of the same width)
+    allocates nothing after the first. The contents are undefined and are overwritten by the next
+    call with the same name, so the array must not be kept or returned.
+
+    Every thread keeps its buffers for good, so they are meant for bands; full-frame buffers are
+    taken with `borrow`.
+
+    Parameters
+    ----------
+    name: str
+        Name of the buffer.
+    shape: tuple
+        Shape of the array.
+    dtype: optional
+        Data type of the array. Defaults to float32.
+    """
+
+    size = prod(shape)
+    dtype = np.dtype(dtype)
+
+    buffer = getattr(_buffers,name,None)
+    if (buffer is None) or (buffer.dtype != dtype) or (buffer.size < size):
+        buffer = np.empty(size,dtype=dtype)
+        setattr(_buffers,name,buffer)
+
+    return buffer[:size].reshape(shape)
+
+def nbytes() -> int:
+    """Number of bytes held by the `scratch` buffers of the calling thread."""
+
+    return sum(buffer.nbytes for buffer in vars(_buffers).values())
+
+@contextmanager
+def borrow(shape:tuple,dtype=np.float32) -> Iterator[np.ndarray]:
+    """
+    Lends a working array of `shape` for the duration of the block, from a buffer shared by all threads.
+
+    Threads working at the same time get buffers of their own, but only the largest one is kept once
+    they are returned, in the frame cache, so the memory held between calls is at most one frame
+    whatever the number of threads, counts against the cache budget, and is freed with the cache.
+    The contents are undefined.
+    """
+
+    size = prod(shape)
+    dtype = np.dtype(dtype)
+    key = CACHE.bufferkey(dtype)
+
+    buffer = CACHE.pop(key)
+    if (buffer is None) or (buffer.size < size): buffer = np.empty(size,dtype=dtype)
+
+    try: yield buffer[:size].reshape(shape)
+    finally:
+        idle = CACHE.pop(key)
+        if (idle is not None) and (idle.size > buffer.size): buffer = idle
+        CACHE.put(key,buffer)
@@ -0,0 +1,189 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `FrameCache`, a memory-bounded LRU cache of decoded and rendered frames."""
+
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Dict, Callable
+import numpy as np
+from imgmarker.gui.pyqt import QPixmap, QImage
+from imgmarker import config
+
+KINDS = ('raw','histogram','scaled','display','tile','frame','render','buffer')
+
+def nbytes(value) -> int:
+    """Size of a cached value in bytes."""
+
+    if isinstance(value,np.ndarray): return value.nbytes
+    if isinstance(value,(QPixmap,QImage)): return value.width()*value.height()*value.depth()//8
+    if hasattr(value,'nbytes'): return value.nbytes
+    return 0
+
+class FrameCache:
+    """
+    Least-recently-used cache of frames with a byte budget.
+
+    Raw arrays (as read from the file), their histograms, scaled arrays (after the stretch and interval) and display
+    pixmaps (after the blur) are stored separately, so that changing the blur radius does not throw
+    away the scaled array and changing the stretch does not require re-reading the file. Tiles of
+    large images (see `imgmarker.image.tiles`) are stored in place of their display pixmap, and the
+    renders of the frames buffered by a `imgmarker.image.FrameBuffer` and of the images prefetched by a
+    `imgmarker.image.Prefetcher` are stored whole. Idle full-frame working buffers (see
+    `imgmarker.image.buffers.borrow`) are kept here too, so that they are freed under pressure. All kinds
+    share one budget and one recency order.
+
+    Cached arrays are shared, so they must never be modified in place.
+
+    Attributes
+    ----------
+    budget: int
+        Maximum number of bytes held by the cache.
+
+    nbytes: int
+        Number of bytes currently held by the cache.
+
+    hits, misses, evictions: dict[str, int]
+        Counters for each kind of entry ('raw', 'histogram', 'scaled', 'display', 'tile', 'frame', 'render' and 'buffer').
+    """
+
+    def __init__(self,budget:int=None):
+        if budget is None: budget = config.CACHE_BYTES
+
+        self.budget = budget
+        self.nbytes = 0
+        self._entries:OrderedDict[tuple,tuple] = OrderedDict()
+        self._lock = RLock()
+
+        self.hits:Dict[str,int] = dict.fromkeys(KINDS,0)
+        self.misses:Dict[str,int] = dict.fromkeys(KINDS,0)
+        self.evictions:Dict[str,int] = dict.fromkeys(KINDS,0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,key:tuple):
+        return key in self._entries
+
+    @staticmethod
+    def rawkey(path:str,frame:int) -> tuple:
+        return ('raw',path,frame)
+
+    @staticmethod
+    def histogramkey(path:str,frame:int) -> tuple:
+        return ('histogram',path,frame)
+
+    @staticmethod
+    def scaledkey(path:str,frame:int,stretch,interval) -> tuple:
+        return ('scaled',path,frame,stretch,interval)
+
+    @staticmethod
+    def displaykey(path:str,frame:int,stretch,interval,r:float) -> tuple:
+        return ('display',path,frame,stretch,interval,r)
+
+    @staticmethod
+    def tilekey(path:str,frame:int,stretch,interval,r:float,level:int,row:int,col:int) -> tuple:
+        return ('tile',path,frame,stretch,interval,r,level,row,col)
+
+    @staticmethod
+    def framekey(path:str,frame:int,stretch,interval,r:float) -> tuple:
+        return ('frame',path,frame,stretch,interval,r)
+
+    @staticmethod
+    def renderkey(path:str,frame:int,stretch,interval,r:float) -> tuple:
+        return ('render',path,frame,stretch,interval,r)
+
+    @staticmethod
+    def bufferkey(dtype:np.dtype) -> tuple:
+        return ('buffer',np.dtype(dtype).str)
+
+    def get(self,key:tuple) -> Any:
+        """Returns the cached value for `key` and marks it as most recently used, or None if not cached."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses[key[0]] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits[key[0]] += 1
+            return entry[0]
+
+    def put(self,key:tuple,value) -> None:
+        """Caches `value`, evicting least recently used entries until the cache fits in its budget."""
+
+        size = nbytes(value)
+
+        with self._lock:
+            self.discard(key)
+
+            # Values larger than the whole budget are not worth evicting everything else for
+            if size > self.budget: return
+
+            self._entries[key] = (value,size)
+            self.nbytes += size
+            self.shrink()
+
+    def fetch(self,key:tuple,func:Callable) -> Any:
+        """Returns the cached value for `key`, computing and caching it with `func()` on a miss."""
+
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.put(key,value)
+        return value
+
+    def pop(self,key:tuple) -> Any:
+        """Removes and returns the cached value for `key`, or None if not cached."""
+
+        with self._lock:
+            value = self.get(key)
+            self.discard(key)
+            return value
+
+    def discard(self,key:tuple) -> None:
+        """Removes `key` from the cache if it is present."""
+
+        with self._lock:
+            entry = self._entries.pop(key,None)
+            if entry is not None: self.nbytes -= entry[1]
+
+    def shrink(self,budget:int=None) -> None:
+        """Evicts least recently used entries until the cache is within `budget` (the cache budget by default)."""
+
+        if budget is None: budget = self.budget
+
+        with self._lock:
+            while (self.nbytes > budget) and self._entries:
+                key, (_, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
+                self.evictions[key[0]] += 1
+
+    def clear(self) -> None:
+        """Empties the cache. Counters are not reset."""
+
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str,Dict[str,int]]:
+        """Returns the hit, miss and eviction counters, and the number of entries and bytes of each kind."""
+
+        with self._lock:
+            entries = dict.fromkeys(KINDS,0)
+            sizes = dict.fromkeys(KINDS,0)
+            for key, (_, size) in self._entries.items():
+                entries[key[0]] += 1
+                sizes[key[0]] += size
+
+            return {kind: {'hits': self.hits[kind],
+                           'misses': self.misses[kind],
+                           'evictions': self.evictions[kind],
+                           'entries': entries[kind],
+                           'nbytes': sizes[kind]} for kind in KINDS}
+
+CACHE = FrameCache()
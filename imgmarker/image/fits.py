@@ -6,13 +6,434 @@ Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
 
 from astropy.io.fits import open as _open
 from astropy.io.fits import ImageHDU, PrimaryHDU, Header, HDUList
+from builtins import open as _fopen
+from collections import OrderedDict
+from contextlib import contextmanager
+from math import prod
+from threading import RLock
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import mmap
+import os
+import numpy as np
+from .buffers import scratch
+
+# Approximate size of the float32 working band used when reading image data
+BAND_BYTES = 16*1024**2
+
+# FITS files are made of blocks of 2880 bytes, and headers of cards of 80 characters
+BLOCK = 2880
+CARD = 80
+
+# Number of elements reduced at a time by `minmax`, small enough to stay in cache for the second reduction
+CHUNK = 2**16
+
+# Maximum number of file layouts kept by `layout`
+LAYOUTS = 4096
 
 def open(path):
-    _hdus = _open(path)
+    _hdus = _open(path, memmap=True)
 
     if any(isinstance(hdu,ImageHDU) for hdu in _hdus):
         hdus = HDUList([_hdu for _hdu in _hdus if isinstance(_hdu,ImageHDU)])
     else:
         hdus = HDUList([_hdu for _hdu in _hdus if isinstance(_hdu,PrimaryHDU)])
 
-    return hdus
\ No newline at end of file
+    return hdus
+
+class HDU:
+    """
+    Location, shape and scaling of the data of an image HDU, found once by `layout`.
+
+    Like an astropy HDU, it has a `shape`, a `header` and a `section`, so the functions of this module
+    accept either. Indexing the section maps only the requested part of the file, through the `handle`
+    of the file, and applies BSCALE, BZERO and BLANK in the same way as astropy.
+    The full header is only parsed if it is used.
+
+    Attributes
+    ----------
+    path: str
+        Path to the file.
+
+    start, offset: int
+        Byte offsets of the header and of the data in the file.
+
+    shape: tuple
+        Shape of the data, slowest axis first.
+
+    bitpix: int
+        BITPIX of the data.
+
+    bscale, bzero: float
+        BSCALE and BZERO of the data.
+
+    blank: int or None
+        BLANK of integer data.
+    """
+
+    __slots__ = ('path','start','offset','shape','bitpix','bscale','bzero','blank','_header')
+
+    def __init__(self,path:str,start:int,offset:int,shape:tuple,bitpix:int,bscale:float=1.0,bzero:float=0.0,blank:int=None):
+        self.path = path
+        self.start = start
+        self.offset = offset
+        self.shape = shape
+        self.bitpix = bitpix
+        self.bscale = bscale
+        self.bzero = bzero
+        self.blank = blank
+        self._header = None
+
+    @property
+    def scaled(self) -> bool:
+        return (self.bscale != 1) or (self.bzero != 0) or (self.blank is not None)
+
+    @property
+    def cards(self) -> str:
+        """Header as a string of 80-character cards, read from the file without parsing it."""
+
+        return handle(self.path)[self.start:self.offset].decode('ascii')
+
+    @property
+    def header(self) -> Header:
+        if self._header is None: self._header = Header.fromstring(self.cards)
+        return self._header
+
+    @property
+    def data(self) -> np.ndarray:
+        """Raw, big-endian data, mapped from the file."""
+
+        dtype = {8: '>u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}[self.bitpix]
+        return np.ndarray(self.shape,dtype=dtype,buffer=handle(self.path),offset=self.offset)
+
+    @property
+    def section(self) -> 'HDU':
+        return self
+
+    def __getitem__(self,key) -> np.ndarray:
+        raw = self.data[key]
+        if not self.scaled: return raw
+
+        # Unsigned integers stored with an offset BZERO are returned as unsigned integers, as in astropy
+        if (self.bitpix > 8) and (self.bscale == 1) and (self.blank is None) and (self.bzero == 1 << (self.bitpix-1)):
+            unsigned = np.dtype(f'u{self.bitpix//8}')
+            return raw.astype(raw.dtype.newbyteorder('=')).view(unsigned) ^ unsigned.type(self.bzero)
+
+        # 8- and 16-bit integers fit in float32, wider integers need float64 as in astropy
+        out = raw.astype(np.float64 if self.bitpix in (32,64) else np.float32)
+        if self.blank is not None: out[raw == self.blank] = np.nan
+        if self.bscale != 1: out *= self.bscale
+        if self.bzero != 0: out += self.bzero
+        return out
+
+_lock = RLock()
+_handles:Dict[str,list] = {}
+_layouts:OrderedDict = OrderedDict()
+
+def handle(path:str) -> mmap.mmap:
+    """
+    Returns a read-only memory map of a file, the one kept by `mapped` while the file is being read.
+
+    Maps are not kept otherwise, so a map is closed as soon as no array uses it and the file can then
+    be overwritten or deleted, which Windows does not allow while it is mapped.
+    """
+
+    with _lock:
+        entry = _handles.get(path)
+        if entry is not None: return entry[0]
+
+    with _fopen(path,'rb') as fp:
+        return mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ)
+
+@contextmanager
+def mapped(path:str) -> Iterator[mmap.mmap]:
+    """Keeps a single map of a file for `handle` until the outermost block reading the file exits."""
+
+    with _lock:
+        entry = _handles.get(path)
+        if entry is None: entry = _handles[path] = [handle(path),0]
+        entry[1] += 1
+
+    try: yield entry[0]
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if entry[1] == 0: del _handles[path]
+
+def _value(card:bytes):
+    """Parses the value of a header card holding a number, logical or string."""
+
+    value = card[10:].decode('ascii').strip()
+    if value.startswith("'"): return value[1:value.index("'",1)].rstrip()
+
+    value = value.split('/')[0].strip()
+    if value in ('T','F'): return value == 'T'
+    try: return int(value)
+    except ValueError: return float(value.replace('D','E'))
+
+KEYWORDS = {'SIMPLE','XTENSION','BITPIX','NAXIS','PCOUNT','GCOUNT','BSCALE','BZERO','BLANK','GROUPS','ZIMAGE'}
+
+def _scan(path:str) -> Optional[List[HDU]]:
+    """Reads the headers of a file for `layout`, returning None if it has HDUs that astropy must handle."""
+
+    size = os.path.getsize(path)
+    images, primary = [], None
+    pos = 0
+
+    with _fopen(path,'rb') as fp:
+        while pos + BLOCK <= size:
+            start = pos
+            cards = {}
+            end = False
+
+            while not end:
+                fp.seek(pos)
+                block = fp.read(BLOCK)
+                if len(block) < BLOCK: return None
+                pos += BLOCK
+
+                for i in range(0,BLOCK,CARD):
+                    card = block[i:i+CARD]
+                    key = card[:8].rstrip().decode('ascii','replace')
+                    if key == 'END':
+                        end = True
+                        break
+                    if (card[8:10] == b'= ') and ((key in KEYWORDS) or key.startswith('NAXIS')):
+                        cards[key] = _value(card)
+
+            if ('SIMPLE' not in cards) and ('XTENSION' not in cards): return None
+            if cards.get('GROUPS') or cards.get('ZIMAGE'): return None
+
+            naxis = cards.get('NAXIS',0)
+            shape = tuple(cards[f'NAXIS{i}'] for i in range(naxis,0,-1))
+            nbytes = abs(cards['BITPIX'])//8*cards.get('GCOUNT',1)*(cards.get('PCOUNT',0) + prod(shape)) if naxis else 0
+            if pos + nbytes > size: return None
+
+            blank = cards.get('BLANK') if cards['BITPIX'] > 0 else None
+            hdu = HDU(path,start,pos,shape,cards['BITPIX'],cards.get('BSCALE',1.0),cards.get('BZERO',0.0),blank)
+
+            if start == 0: primary = hdu
+            elif cards.get('XTENSION') == 'IMAGE': images.append(hdu)
+
+            pos += -(-nbytes//BLOCK)*BLOCK
+
+    # Same selection as `open`
+    if images: return images
+    return [primary] if primary is not None else None
+
+def layout(path:str) -> Optional[List[HDU]]:
+    """
+    Returns the image HDUs of a FITS file, the same ones as `open`, or None if the file has HDUs that
+    only astropy can read (compressed images or random groups) or cannot be parsed.
+
+    The headers are read once and only for their structural keywords, and the result is kept until the
+    size or modification time of the file changes, so switching frames of a file with hundreds of
+    extensions does not parse every header again.
+    """
+
+    stat = os.stat(path)
+    key = (stat.st_size,stat.st_mtime_ns)
+
+    with _lock:
+        entry = _layouts.get(path)
+        if (entry is not None) and (entry[0] == key):
+            _layouts.move_to_end(path)
+            return entry[1]
+
+    try: hdus = _scan(path)
+    except (OSError, KeyError, ValueError, UnicodeDecodeError): hdus = None
+
+    with _lock:
+        _layouts[path] = (key,hdus)
+        while len(_layouts) > LAYOUTS: _layouts.popitem(last=False)
+
+    return hdus
+
+def cards(hdu:Union[HDU,PrimaryHDU,ImageHDU]) -> str:
+    """Returns the header of an HDU as a string of 80-character cards, without parsing it if it comes from a `layout`."""
+
+    return hdu.cards if isinstance(hdu,HDU) else hdu.header.tostring()
+
+@contextmanager
+def hdus(path:str) -> Iterator[Sequence[Union[HDU,PrimaryHDU,ImageHDU]]]:
+    """Yields the image HDUs of a FITS file, from its cached `layout` or, if it has none, from `open`."""
+
+    _hdus = layout(path)
+    if _hdus is not None: yield _hdus
+    else:
+        with open(path) as f: yield f
+
+def bands(height:int,rows:int) -> Iterator[Tuple[int,int]]:
+    """Yields (start, stop) row ranges of at most `rows` rows covering `height` rows."""
+
+    for start in range(0,height,rows):
+        yield start, min(start+rows,height)
+
+def _band(hdu:Union[PrimaryHDU,ImageHDU],start:int,stop:int,rgb:bool,step:int=1) -> np.ndarray:
+    """Reads every `step`-th row and column of rows `start` to `stop` of an HDU through its memory-mapped section."""
+
+    if rgb: return hdu.section[:3,start:stop:step,::step]
+    elif len(hdu.shape) == 3: return hdu.section[0,start:stop:step,::step]
+    else: return hdu.section[start:stop:step,::step]
+
+def _rows(shape:tuple,rgb:bool,step:int) -> int:
+    """Number of rows, a multiple of `step`, whose float32 band fits in `BAND_BYTES`."""
+
+    width = -(-shape[-1]//step)
+    return step*max(1, BAND_BYTES // (4*width*(3 if rgb else 1)))
+
+def dtype(hdu:Union[PrimaryHDU,ImageHDU],bits:int) -> np.dtype:
+    """
+    Returns the dtype that `read` produces for an HDU.
+
+    Unscaled integer data with no more levels than the display, i.e. 8-bit data or 16-bit data on a
+    16-bit display, has no NaNs and loses nothing when normalized, so it is normalized straight into
+    the unsigned integer type of the display. Wider integer types could have all their levels around
+    the sky squeezed into one by an outlier before the interval is applied, so they, floating point
+    data and scaled data (which may have NaNs) are kept as float32.
+    """
+
+    if isinstance(hdu,HDU): bitpix, scaled = hdu.bitpix, hdu.scaled
+    else:
+        header = hdu.header
+        bitpix = header['BITPIX']
+        scaled = (header.get('BSCALE',1) != 1) or (header.get('BZERO',0) != 0) or ('BLANK' in header)
+
+    if (bitpix > 0) and (bitpix <= bits) and not scaled:
+        return np.dtype(np.uint8) if bits <= 8 else np.dtype(np.uint16)
+    else:
+        return np.dtype(np.float32)
+
+def minmax(a:np.ndarray,lo:float=np.inf,hi:float=-np.inf) -> Tuple[float,float]:
+    """
+    Returns the smallest and largest non-NaN values of `a`, or of `a` and `lo` and `hi` if given.
+
+    The array is reduced in chunks of `CHUNK` elements, so the maximum is taken from cache right
+    after the minimum instead of reading the whole array from memory twice.
+    """
+
+    flat = a.reshape(-1)
+    with np.errstate(invalid='ignore'):
+        for i in range(0,flat.size,CHUNK):
+            chunk = flat[i:i+CHUNK]
+            lo = min(lo,np.fmin.reduce(chunk))
+            hi = max(hi,np.fmax.reduce(chunk))
+
+    return float(lo), float(hi)
+
+def _native(data:np.ndarray,name:str) -> np.ndarray:
+    """Returns `data` as a contiguous, native-endian array, converted into a reused buffer if needed."""
+
+    if data.dtype.isnative and data.flags.c_contiguous: return data
+    native = scratch(name,data.shape,data.dtype.newbyteorder('='))
+    np.copyto(native,data)
+    return native
+
+def limits(hdu:Union[PrimaryHDU,ImageHDU],rows:int=None,step:int=1) -> Tuple[float,float]:
+    """
+    Returns the minimum and maximum finite values of an HDU without loading all of its data.
+
+    Each band is converted to native byte order once and then reduced with `minmax`.
+
+    Parameters
+    ----------
+    hdu: `PrimaryHDU` or `ImageHDU`
+        HDU to read.
+    rows: int, optional
+        Number of rows read at a time. Defaults to as many as fit in `BAND_BYTES`.
+    step: int, optional
+        Only every `step`-th row and column is read. Defaults to 1.
+    """
+
+    shape = hdu.shape
+    rgb = (len(shape) == 3) and (shape[0] > 1)
+    if rows is None: rows = _rows(shape,rgb,step)
+
+    lo, hi = np.inf, -np.inf
+    for start, stop in bands(shape[-2],rows):
+        band = _band(hdu,start,stop,rgb,step)
+        if band.size == 0: continue
+        lo, hi = minmax(_native(band,'limits'),lo,hi)
+
+    return float(lo), float(hi)
+
+def read(hdu:Union[PrimaryHDU,ImageHDU],bits:int,rows:int=None,step:int=1) -> np.ndarray:
+    """
+    Reads the data of an HDU, normalized to the range [0, 2**bits - 1] and flipped so that the first row is the top.
+
+    Data are read a band of rows at a time through the memory-mapped section of the HDU, so only the
+    output array and one band are ever held in memory, regardless of the size of the file. Floating
+    point and scaled data are converted to native float32 once, straight into the output with the
+    planes of cubes interleaved, while their limits are found, and then normalized in place, so the
+    file is read only once. Integer data that `dtype` keeps as integers are normalized into the display
+    type in a reused float32 band after a first pass finds their limits.
+
+    Parameters
+    ----------
+    hdu: `PrimaryHDU` or `ImageHDU`
+        HDU to read. Cubes are returned as RGB using their first three planes.
+    bits: int
+        Bit depth of the display.
+    rows: int, optional
+        Number of rows read at a time. Defaults to as many as fit in `BAND_BYTES`. Must be a multiple of `step`.
+    step: int, optional
+        Only every `step`-th row and column is read, for a quick downsampled preview. Defaults to 1.
+
+    Returns
+    ----------
+    out: `numpy.ndarray`
+        Array of shape (height, width) or (height, width, 3), with the dtype given by `dtype`. The height
+        and width are divided by `step`, rounding up.
+    """
+
+    if not isinstance(hdu,HDU): return _read(hdu,bits,rows,step)
+
+    # The file is mapped once for all the bands, and unmapped when the frame is read
+    with mapped(hdu.path): return _read(hdu,bits,rows,step)
+
+def _read(hdu:Union[HDU,PrimaryHDU,ImageHDU],bits:int,rows:int,step:int) -> np.ndarray:
+    shape = hdu.shape
+    height, width = -(-shape[-2]//step), -(-shape[-1]//step)
+    rgb = (len(shape) == 3) and (shape[0] > 1)
+    if rows is None: rows = _rows(shape,rgb,step)
+
+    out_dtype = dtype(hdu,bits)
+    out = np.empty((height,width,3) if rgb else (height,width), dtype=out_dtype)
+
+    def place(start:int,data:np.ndarray) -> Tuple[np.ndarray,np.ndarray]:
+        """Returns a band with its channels last and rows flipped, and the rows of `out` that it goes to."""
+
+        if rgb: data = np.moveaxis(data,0,-1)
+        start = start//step
+        stop = start + data.shape[0]
+        return data[::-1], out[height-stop:height-start]
+
+    if out_dtype.kind == 'f':
+        lo, hi = np.inf, -np.inf
+        for start, stop in bands(shape[-2],rows):
+            data, dst = place(start,_band(hdu,start,stop,rgb,step))
+            np.copyto(dst,data,casting='unsafe')
+            lo, hi = minmax(dst,lo,hi)
+
+        scale = (2**bits - 1)/(hi - lo) if hi > lo else 0.0
+        flat = out.reshape(-1)
+        for start in range(0,flat.size,CHUNK):
+            chunk = flat[start:start+CHUNK]
+            chunk -= lo
+            chunk *= scale
+
+        return out
+
+    lo, hi = limits(hdu,rows,step)
+    scale = (2**bits - 1)/(hi - lo) if hi > lo else 0.0
+
+    for start, stop in bands(shape[-2],rows):
+        data = _band(hdu,start,stop,rgb,step)
+        band = scratch('fits',data.shape)
+        np.subtract(data,lo,out=band,dtype=np.float32,casting='unsafe')
+        band *= scale
+        np.rint(band,out=band)
+
+        band, dst = place(start,band)
+        np.copyto(dst,band,casting='unsafe')
+
+    return out
@@ -0,0 +1,189 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `FrameBuffer`, which renders the frames around the current frame of a cube in the background."""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import partial
+from threading import RLock
+from typing import TYPE_CHECKING, Dict, List, Set
+import time
+from imgmarker import config
+from .cache import CACHE
+
+if TYPE_CHECKING:
+    from imgmarker.image import Image, Render
+
+def window(n:int,frame:int,size:int) -> List[int]:
+    """
+    Returns up to `size` frames around `frame` of `n` frames, nearest first.
+
+    Three quarters of the frames follow `frame` and one quarter precedes it, since frames are mostly
+    stepped through and played forwards. Frames wrap around the ends in the same way as `Image.seek`.
+    """
+
+    ahead = size - size//4
+    frames = []
+    for d in range(1,ahead+1):
+        for i in ((frame+d) % n, (frame-d) % n) if d <= size//4 else ((frame+d) % n,):
+            if (i != frame) and (i not in frames): frames.append(i)
+    return frames[:size]
+
+class FrameBuffer:
+    """
+    Ring buffer of the frames of an image around its current frame, rendered in a pool of worker threads.
+
+    Every frame in the buffer is read, rescaled and blurred (see `Image.render`), so stepping or
+    playing through a cube only has to show it. Moving the current frame drops the frames that fall
+    out of the window and schedules the ones that come into it, so the buffer holds at most `size`
+    frames whatever the length of the cube.
+
+    Finished renders are kept in the frame cache rather than by the buffer, so they count against
+    its budget and are evicted like any other frame.
+
+    Attributes
+    ----------
+    size: int
+        Number of frames kept around the current frame.
+
+    jobs: dict[tuple, `concurrent.futures.Future`]
+        Pending renders, keyed by `Image.key`.
+
+    frames: set[tuple]
+        Keys of the frames in the window, rendered or not.
+    """
+
+    def __init__(self,size:int=None,workers:int=None):
+        if size is None: size = config.FRAME_BUFFER
+        if workers is None: workers = config.FRAME_WORKERS
+
+        self.size = size
+        self.jobs:Dict[tuple,Future] = {}
+        self.frames:Set[tuple] = set()
+        self.pool = None
+        self._lock = RLock()
+
+        if (size > 0) and (workers > 0):
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='imgmarker-frames')
+
+    def update(self,image:'Image',frame:int) -> None:
+        """Schedules the frames around `frame` of `image` and drops the others."""
+
+        if self.pool is None: return
+
+        wanted = [image.key(i) for i in window(image.n_frames,image.wrapframe(frame),self.size)]
+
+        with self._lock:
+            # Frames that have already started finish in the background and are discarded
+            for key in self.frames.difference(wanted): self.drop(key)
+
+            for key in wanted:
+                self.frames.add(key)
+                if (key in self.jobs) or (CACHE.framekey(*key) in CACHE): continue
+                job = self.jobs[key] = self.pool.submit(image.render,key[1])
+                job.add_done_callback(partial(self._done,key))
+
+    def _done(self,key:tuple,job:Future) -> None:
+        # Runs in the worker thread; the render moves into the frame cache, unless it was dropped meanwhile
+        with self._lock:
+            if self.jobs.get(key) is not job: return
+            del self.jobs[key]
+            if job.cancelled() or (job.exception() is not None): return
+            CACHE.put(CACHE.framekey(*key),job.result())
+
+    def drop(self,key:tuple) -> None:
+        """Cancels or forgets the render of a frame."""
+
+        with self._lock:
+            self.frames.discard(key)
+            job = self.jobs.pop(key,None)
+            if job is not None: job.cancel()
+            CACHE.discard(CACHE.framekey(*key))
+
+    def ready(self,image:'Image',frame:int) -> bool:
+        """Whether `frame` of `image` can be shown without waiting for it to be rendered."""
+
+        if self.pool is None: return True
+        return CACHE.framekey(*image.key(image.wrapframe(frame))) in CACHE
+
+    def take(self,image:'Image',frame:int) -> 'Render':
+        """
+        Returns the render of `frame` of `image` if it is finished, or None.
+
+        The render stays in the buffer, so stepping back and forth over the same frames reuses it.
+        """
+
+        return CACHE.get(CACHE.framekey(*image.key(image.wrapframe(frame))))
+
+    def clear(self) -> None:
+        """Cancels and drops all frames."""
+
+        with self._lock:
+            for key in list(self.frames) + list(self.jobs): self.drop(key)
+
+    def shutdown(self) -> None:
+        """Drops all frames and stops the worker threads."""
+
+        self.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+class FrameRate:
+    """
+    Rate at which frames are shown during playback.
+
+    Along with the achieved frame rate, the number of timer ticks on which the next frame was not
+    rendered yet is counted: if it keeps growing, reading and rendering are the bottleneck, and if the
+    rate is low without it growing, showing the frames is.
+
+    Attributes
+    ----------
+    shown: int
+        Number of frames shown.
+
+    waits: int
+        Number of ticks on which the next frame was not ready.
+    """
+
+    def __init__(self,period:float=1.0):
+        """
+        Parameters
+        ----------
+        period: float, optional
+            Time in seconds over which the rate is averaged. Defaults to 1.
+        """
+
+        self.period = period
+        self.times = deque()
+        self.shown = 0
+        self.waits = 0
+
+    def tick(self,shown:bool) -> None:
+        """Records a timer tick, on which a frame was shown or not."""
+
+        if not shown:
+            self.waits += 1
+            return
+
+        now = time.perf_counter()
+        self.times.append(now)
+        self.shown += 1
+        while now - self.times[0] > self.period: self.times.popleft()
+
+    @property
+    def fps(self) -> float:
+        """Frames shown per second over the last `period` seconds."""
+
+        if len(self.times) < 2: return 0.0
+        span = self.times[-1] - self.times[0]
+        return (len(self.times) - 1)/span if span > 0 else 0.0
+
+    def reset(self) -> None:
+        self.times.clear()
+        self.shown = 0
+        self.waits = 0
@@ -0,0 +1,179 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `Histogram` of a frame, from which interval limits are derived without another pass over the data."""
+
+from typing import Tuple, Union
+import numpy as np
+from astropy.visualization import (BaseInterval, MinMaxInterval, ZScaleInterval,
+                                   AsymmetricPercentileInterval, ManualInterval)
+
+# Number of bins of the histogram of floating point data
+FLOAT_BINS = 2**16
+
+# Floating point data whose quantiles from REFINE_TAIL to 1 - REFINE_TAIL fall into fewer than
+# REFINE_BINS bins, e.g. because of an outlier, has those bins split into FLOAT_BINS bins, up to
+# REFINEMENTS times
+REFINE_TAIL = 1e-4
+REFINE_BINS = 2**12
+REFINEMENTS = 3
+
+# Limits of floating point data that fall into a bin wider than this fraction of the distance between
+# them are not derived from the histogram
+TOLERANCE = 1e-3
+
+class Histogram:
+    """
+    Histogram of the brightness (vibrance) of a frame.
+
+    8- and 16-bit integer data get one bin per possible value, so limits derived from them are exact.
+    Floating point data is binned into `FLOAT_BINS` equal bins spanning its finite range, so the bins
+    adapt to the data, and values are interpolated within a bin. A single outlier can squeeze most of
+    the data into a few of these bins, so the bins holding all but the `REFINE_TAIL` smallest and
+    largest values are binned again into `FLOAT_BINS` bins while they are fewer than `REFINE_BINS`.
+    Non-finite values are ignored, like the astropy intervals do.
+
+    Attributes
+    ----------
+    counts: `numpy.ndarray`
+        Number of pixels in each bin.
+
+    edges: `numpy.ndarray`
+        Edges of the bins, one more than there are bins.
+
+    lo, hi: float
+        Smallest and largest finite values.
+
+    exact: bool
+        Whether every bin holds a single value.
+
+    n: int
+        Number of finite values.
+    """
+
+    def __init__(self,v:np.ndarray):
+        """
+        Parameters
+        ----------
+        v: `numpy.ndarray`
+            Brightness of each pixel, as returned by `imgmarker.image.vibrance`.
+        """
+
+        if (v.dtype.kind == 'u') and (v.dtype.itemsize <= 2):
+            self.counts = np.bincount(v.ravel(),minlength=np.iinfo(v.dtype).max+1)
+            self.edges = np.arange(self.counts.size+1,dtype=float)
+            nonzero = np.flatnonzero(self.counts)
+            self.lo, self.hi = (float(nonzero[0]), float(nonzero[-1])) if nonzero.size else (0.0, 0.0)
+            self.exact = True
+            self.cumulative = np.cumsum(self.counts)
+
+        else:
+            with np.errstate(invalid='ignore'):
+                lo, hi = float(np.nanmin(v)), float(np.nanmax(v))
+            if not np.isfinite(lo) or not np.isfinite(hi):
+                finite = v[np.isfinite(v)]
+                lo, hi = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 0.0)
+
+            self.counts, self.edges = np.histogram(v,bins=FLOAT_BINS,range=(lo,hi if hi > lo else lo+1))
+            self.lo, self.hi = lo, hi
+            self.exact = False
+            self.cumulative = np.cumsum(self.counts)
+
+            for _ in range(REFINEMENTS):
+                if not self.refine(v): break
+
+        self.n = int(self.cumulative[-1])
+
+    def refine(self,v:np.ndarray) -> bool:
+        """
+        Splits the bins holding the quantiles from `REFINE_TAIL` to 1 - `REFINE_TAIL` of `v` into
+        `FLOAT_BINS` bins, if they are fewer than `REFINE_BINS` and wider than the float32 resolution.
+        Returns whether they were split.
+        """
+
+        n = int(self.cumulative[-1])
+        if n == 0: return False
+
+        first, last = np.searchsorted(self.cumulative,[REFINE_TAIL*(n-1),(1-REFINE_TAIL)*(n-1)],side='right')
+        last = min(int(last),self.counts.size-1)
+        if last - first + 1 >= REFINE_BINS: return False
+
+        lo, hi = self.edges[first], self.edges[last+1]
+        if (hi - lo) <= FLOAT_BINS*np.spacing(np.float32(max(abs(lo),abs(hi)))): return False
+
+        # The values in the bins, with the largest value in the last bin like `numpy.histogram` does
+        if last == self.counts.size-1: values = v[(v >= lo) & (v <= hi)]
+        else: values = v[(v >= lo) & (v < hi)]
+        counts, edges = np.histogram(values,bins=FLOAT_BINS,range=(lo,hi))
+
+        self.counts = np.concatenate((self.counts[:first],counts,self.counts[last+1:]))
+        self.edges = np.concatenate((self.edges[:first],edges,self.edges[last+2:]))
+        self.cumulative = np.cumsum(self.counts)
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes + self.edges.nbytes + self.cumulative.nbytes
+
+    def quantile(self,q:Union[float,np.ndarray]) -> np.ndarray:
+        """Returns the values below which a fraction `q` of the finite values lie."""
+
+        if self.n == 0: return np.full(np.shape(q),np.nan)
+
+        rank = np.asarray(q,dtype=float)*(self.n - 1)
+        i = np.searchsorted(self.cumulative,rank,side='right')
+        i = np.minimum(i,self.counts.size - 1)
+
+        if self.exact: return self.edges[i]
+
+        # Interpolate linearly within the bin
+        below = np.where(i > 0,self.cumulative[i-1],0)
+        fraction = (rank - below + 0.5)/np.maximum(self.counts[i],1)
+        return np.clip(self.edges[i] + fraction*(self.edges[i+1] - self.edges[i]), self.lo, self.hi)
+
+    def minmax(self) -> Tuple[float,float]:
+        return self.lo, self.hi
+
+    def percentile(self,lower:float,upper:float) -> Tuple[float,float]:
+        vmin, vmax = self.quantile(np.array([lower,upper])/100)
+        return float(vmin), float(vmax)
+
+    def zscale(self,interval:ZScaleInterval) -> Tuple[float,float]:
+        """
+        Returns the limits of `interval` computed on evenly spaced quantiles of the data.
+
+        ZScale fits a line to a sorted sample of the pixels, which is an estimate of the quantile
+        function that the histogram provides directly.
+        """
+
+        if self.n == 0: return 0.0, 0.0
+        n = min(interval.n_samples,self.n)
+        sample = self.quantile((np.arange(n) + 0.5)/n)
+        return interval.get_limits(sample)
+
+    def resolves(self,vmin:float,vmax:float) -> bool:
+        """Whether the bins of `vmin` and `vmax` are narrower than `TOLERANCE` times the distance between them."""
+
+        if self.exact: return True
+        i = np.clip(np.searchsorted(self.edges,[vmin,vmax],side='right') - 1,0,self.counts.size - 1)
+        return bool(np.all(self.edges[i+1] - self.edges[i] <= TOLERANCE*(vmax - vmin)))
+
+    def limits(self,interval:BaseInterval) -> Tuple[float,float]:
+        """
+        Returns the limits of `interval`, or None if it cannot be derived from a histogram or the bins
+        of the limits are too wide to resolve them (see `Histogram.resolves`).
+        """
+
+        if isinstance(interval,MinMaxInterval): return self.minmax()
+        if isinstance(interval,ManualInterval) and (interval.vmin is not None) and (interval.vmax is not None):
+            return interval.vmin, interval.vmax
+
+        if isinstance(interval,ZScaleInterval): vlims = self.zscale(interval)
+        elif isinstance(interval,AsymmetricPercentileInterval) and (interval.n_samples is None):
+            vlims = self.percentile(interval.lower_percentile,interval.upper_percentile)
+        else: return None
+
+        return vlims if self.resolves(*vlims) else None
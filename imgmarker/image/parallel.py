@@ -0,0 +1,53 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the thread pool that processes the bands of a frame concurrently."""
+
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from typing import Callable, Iterable, List, Tuple
+import os
+from imgmarker import config
+from .fits import bands
+
+_pool:ThreadPoolExecutor = None
+
+def threads() -> int:
+    """Number of threads processing bands, from `config.SCALE_THREADS` (0 for one per CPU)."""
+
+    return config.SCALE_THREADS if config.SCALE_THREADS > 0 else (os.cpu_count() or 1)
+
+def pool() -> ThreadPoolExecutor:
+    """Returns the thread pool shared by all band kernels, creating it on first use."""
+
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=threads(), thread_name_prefix='imgmarker-bands')
+    return _pool
+
+def split(height:int,rows:int) -> List[Tuple[int,int]]:
+    """
+    Returns (start, stop) row ranges of at most `rows` rows covering `height` rows.
+
+    The bands are made smaller if needed so that there are at least as many as there are threads.
+    """
+
+    rows = max(1,min(rows,ceil(height/threads())))
+    return list(bands(height,rows))
+
+def run(func:Callable[[int,int],None],ranges:Iterable[Tuple[int,int]]) -> None:
+    """
+    Calls `func(start, stop)` for each row range, concurrently if there is more than one thread.
+
+    numpy releases the GIL in its loops, so bands written into disjoint rows of a shared output array
+    are processed in parallel. Exceptions raised by `func` are raised here.
+    """
+
+    ranges = list(ranges)
+    if (threads() == 1) or (len(ranges) == 1):
+        for start, stop in ranges: func(start,stop)
+    else:
+        for _ in pool().map(lambda r: func(*r),ranges): pass
@@ -0,0 +1,222 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `Prefetcher`, which renders the images around the current one in the background."""
+
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+from typing import TYPE_CHECKING, List, Dict
+from functools import partial
+from threading import RLock
+from imgmarker.gui.pyqt import QObject, pyqtSignal
+from imgmarker import config
+from .cache import CACHE
+
+if TYPE_CHECKING:
+    from imgmarker.image import Image, Render
+
+def neighbours(n:int,idx:int,depth:int) -> List[int]:
+    """
+    Returns the indices of the images following and preceding `idx`, nearest first.
+
+    Indices wrap around the ends of the list in the same way as `MainWindow.shift`.
+    """
+
+    indices = []
+    for d in range(1,depth+1):
+        for i in ((idx+d) % n, (idx-d) % n):
+            if (i != idx) and (i not in indices): indices.append(i)
+    return indices
+
+class Prefetcher(QObject):
+    """
+    Renders the next and previous images of a list in a pool of worker threads.
+
+    The current image can also be rendered in the background with `Prefetcher.request`, while a preview
+    of it is shown; the `rendered` signal is emitted in the GUI thread when it is done. Previews that
+    need the full frame to be decoded are read in the background too, and emitted with `previewed`.
+
+    Reading, rescaling and blurring are done with numpy, scipy and astropy, which release the GIL for
+    the heavy lifting, so a thread pool is used rather than a process pool (which would have to copy
+    every rendered frame back to the GUI process).
+
+    Finished renders are moved into the frame cache, so they count against its budget and are evicted
+    like any other frame; the prefetcher only keeps the jobs that are still pending.
+
+    Attributes
+    ----------
+    depth: int
+        Number of images to render on each side of the current image.
+
+    workers: int
+        Number of worker threads.
+
+    jobs: dict[tuple, `concurrent.futures.Future`]
+        Pending renders, keyed by `Image.key`.
+
+    current: tuple or None
+        Key of the render requested with `Prefetcher.request`, which is never cancelled by `Prefetcher.update`.
+
+    rendered: `pyqtSignal`
+        Emitted with the `Render` of the requested image when it is done.
+
+    previewed: `pyqtSignal`
+        Emitted with the key and the preview `QImage` of the requested image, if the preview is done
+        before the render.
+    """
+
+    rendered = pyqtSignal(object)
+    previewed = pyqtSignal(object,object)
+
+    def __init__(self,depth:int=None,workers:int=None):
+        super().__init__()
+        if depth is None: depth = config.PREFETCH_DEPTH
+        if workers is None: workers = config.PREFETCH_WORKERS
+
+        self.depth = depth
+        self.workers = workers
+        self.jobs:Dict[tuple,Future] = {}
+        self.current:tuple = None
+        self.pool = None
+        self._lock = RLock()
+
+        if (self.depth > 0) and (self.workers > 0):
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='imgmarker-prefetch')
+
+    def update(self,images:List['Image'],idx:int,frame:int=0) -> None:
+        """
+        Schedules the neighbours of `images[idx]` for rendering and cancels jobs that are no longer needed.
+
+        Parameters
+        ----------
+        images: list[`imgmarker.image.Image`]
+            Images in the order they are shown.
+        idx: int
+            Index of the current image.
+        frame: int, optional
+            Frame that the neighbouring images will be shown at. Defaults to 0.
+        """
+
+        if self.pool is None: return
+
+        wanted = {}
+        for i in neighbours(len(images),idx,self.depth):
+            img = images[i]
+            key = img.key(img.wrapframe(frame))
+            if key not in wanted: wanted[key] = img
+
+        with self._lock:
+            # Drop stale jobs; ones that have already started finish in the background and are discarded
+            for key in list(self.jobs):
+                if (key not in wanted) and (key != self.current):
+                    self.jobs.pop(key).cancel()
+
+            # Nearest images are submitted first so they are picked up first
+            for key, img in wanted.items():
+                if (CACHE.displaykey(*key) in CACHE) or (CACHE.renderkey(*key) in CACHE): continue
+                if key not in self.jobs: self.submit(key,img.render)
+
+    def submit(self,key:tuple,func) -> Future:
+        """Runs `func(frame)` for the frame of `key` in the pool, moving its render into the cache when it is done."""
+
+        with self._lock:
+            job = self.jobs[key] = self.pool.submit(func,key[1])
+            job.add_done_callback(partial(self._done,key))
+            return job
+
+    def ready(self,image:'Image',frame:int=0) -> bool:
+        """Whether `image` can be shown at `frame` without waiting: it is small, already rendered, or cannot be rendered in the background."""
+
+        key = image.key(image.wrapframe(frame))
+
+        if (self.pool is None) or (image.previewstep == 1): return True
+        return (CACHE.displaykey(*key) in CACHE) or (CACHE.renderkey(*key) in CACHE)
+
+    def request(self,image:'Image',frame:int=0,preview:bool=False) -> None:
+        """
+        Renders `image` at `frame` in the background, reusing a prefetch job if there is one, and emits
+        `rendered` when it is done.
+
+        A previous request that has not started yet is cancelled; one that is running finishes, but
+        does not emit `rendered`. If `preview`, a preview is read first with `Image.readpreview` and
+        emitted with `previewed`.
+        """
+
+        key = image.key(image.wrapframe(frame))
+
+        with self._lock:
+            if (self.current is not None) and (self.current != key):
+                job = self.jobs.pop(self.current,None)
+                if job is not None: job.cancel()
+            self.current = key
+
+            if preview: self.pool.submit(image.readpreview,key[1]).add_done_callback(partial(self._previewed,key))
+            if key in self.jobs: return
+
+            # A render that finished since `ready` was checked is passed through the pool, so that
+            # `rendered` is always emitted from a worker thread
+            render = CACHE.get(CACHE.renderkey(*key))
+            if render is None: self.submit(key,image.render)
+            else: self.submit(key,lambda _: render)
+
+    def _done(self,key:tuple,job:Future) -> None:
+        # Runs in the worker thread; the signal is queued to the GUI thread
+        with self._lock:
+            if self.jobs.get(key) is not job: return
+            del self.jobs[key]
+            if job.cancelled() or (job.exception() is not None): return
+            render = job.result()
+            CACHE.put(CACHE.renderkey(*key),render)
+            if key != self.current: return
+
+        try: self.rendered.emit(render)
+        except RuntimeError: pass # The prefetcher was deleted while rendering
+
+    def _previewed(self,key:tuple,job:Future) -> None:
+        # Runs in the worker thread; a preview is of no use once the render is done
+        if (key != self.current) or job.cancelled() or (job.exception() is not None): return
+        if key not in self.jobs: return
+        try: self.previewed.emit(key,job.result())
+        except RuntimeError: pass
+
+    def take(self,image:'Image',frame:int=0) -> 'Render':
+        """
+        Returns the prefetched render of `image` at `frame`, or None if it was never scheduled, failed or
+        was evicted from the cache.
+
+        If the render is still in progress this waits for it, which is never slower than starting over.
+        The render is removed from the cache, since the frame it shows is cached once it is displayed.
+        """
+
+        key = image.key(image.wrapframe(frame))
+
+        with self._lock:
+            if key == self.current: self.current = None
+            job = self.jobs.pop(key,None)
+
+        if job is not None:
+            try: return job.result()
+            except CancelledError: return None
+            except Exception: return None
+
+        render = CACHE.get(CACHE.renderkey(*key))
+        CACHE.discard(CACHE.renderkey(*key))
+        return render
+
+    def clear(self) -> None:
+        """Cancels all jobs."""
+
+        with self._lock:
+            for job in list(self.jobs.values()): job.cancel()
+            self.jobs.clear()
+            self.current = None
+
+    def shutdown(self) -> None:
+        """Cancels all jobs and stops the worker threads."""
+
+        self.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
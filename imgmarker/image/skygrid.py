@@ -0,0 +1,195 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `SkyGrid`, which interpolates the sky coordinates of pixels for the cursor readout."""
+
+from math import atan2, ceil, degrees, hypot
+from typing import Tuple
+import numpy as np
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+from imgmarker import config
+
+# Grids are not refined beyond this many cells
+MAX_CELLS = 2**18
+
+def tosphere(world:np.ndarray) -> np.ndarray:
+    """Converts (N, 2) (RA, Dec) in degrees to (N, 3) unit vectors."""
+
+    ra, dec = np.radians(world[:,0]), np.radians(world[:,1])
+    cos = np.cos(dec)
+    return np.stack((cos*np.cos(ra),cos*np.sin(ra),np.sin(dec)),axis=-1)
+
+def fromsphere(v:np.ndarray) -> np.ndarray:
+    """Converts (N, 3) vectors to (N, 2) (RA, Dec) in degrees, with RA in [0, 360)."""
+
+    ra = np.degrees(np.arctan2(v[:,1],v[:,0])) % 360
+    dec = np.degrees(np.arctan2(v[:,2],np.hypot(v[:,0],v[:,1])))
+    return np.stack((ra,dec),axis=-1)
+
+class SkyGrid:
+    """
+    Sky coordinates of the pixels of a frame, interpolated between the nodes of a regular grid.
+
+    The WCS is evaluated once at the nodes, and the unit vectors of the nodes are interpolated bilinearly,
+    so that the interpolation is continuous across RA = 0 and near the poles. The error of every cell is
+    measured at its centre and at the midpoints of its edges, where the error of bilinear interpolation of
+    a smooth distortion peaks, and the grid is refined until the error is below half the tolerance or it
+    reaches `MAX_CELLS` cells. Points in cells that are still out of tolerance, and points outside the
+    frame, are transformed exactly.
+
+    Coordinates are in the pixel convention of the WCS, with the origin at 0.
+
+    Attributes
+    ----------
+    wcs: `astropy.wcs.WCS`
+        Exact transform.
+
+    width, height: int
+        Size of the frame.
+
+    step: int
+        Spacing of the nodes in pixels.
+
+    tolerance: float
+        Maximum interpolation error, in pixels.
+
+    nodes: `numpy.ndarray`
+        (rows + 1, cols + 1, 3) unit vectors of the nodes.
+
+    exact: `numpy.ndarray`
+        (rows, cols) booleans, True for cells that are transformed exactly.
+
+    error: float
+        Largest error, in pixels, measured in the interpolated cells.
+    """
+
+    def __init__(self,wcs:WCS,width:int,height:int,step:int=None,tolerance:float=None):
+        """
+        Parameters
+        ----------
+        wcs: `astropy.wcs.WCS`
+            Celestial WCS of the frame.
+        width, height: int
+            Size of the frame.
+        step: int, optional
+            Initial spacing of the nodes. Defaults to `config.SKY_GRID_STEP`.
+        tolerance: float, optional
+            Maximum interpolation error in pixels. Defaults to `config.SKY_GRID_TOLERANCE`.
+        """
+
+        if step is None: step = config.SKY_GRID_STEP
+        if tolerance is None: tolerance = config.SKY_GRID_TOLERANCE
+        if (wcs.wcs.lng, wcs.wcs.lat) != (0, 1): raise ValueError('WCS has no celestial longitude and latitude axes')
+
+        self.wcs = wcs
+        self.width, self.height = width, height
+        self.tolerance = tolerance
+
+        # Angular size of a pixel in radians
+        scale = np.radians(proj_plane_pixel_scales(wcs.celestial).min())
+
+        step = max(1,int(step))
+        while True:
+            self.step = step
+            self.nodes, self.exact, self.error = self._build(step,0.5*tolerance*scale)
+            self.error = float(self.error/scale)
+            cells = ceil(width/step)*ceil(height/step)
+            if (not self.exact.any()) or (step == 1) or (4*cells > MAX_CELLS): break
+            step = max(1,step//2)
+
+        self._cell:tuple = None
+
+    def _build(self,step:int,limit:float) -> Tuple[np.ndarray,np.ndarray,float]:
+        cols, rows = max(1,ceil(self.width/step)), max(1,ceil(self.height/step))
+        x, y = np.arange(cols+1)*step, np.arange(rows+1)*step
+
+        def transform(px:np.ndarray,py:np.ndarray) -> np.ndarray:
+            px, py = np.broadcast_arrays(px,py)
+            world = self.wcs.all_pix2world(np.stack((px.ravel(),py.ravel()),axis=-1).astype(float),0)
+            return tosphere(world).reshape(px.shape+(3,))
+
+        nodes = transform(x[None,:],y[:,None])
+        mid_x, mid_y = x[:-1] + step/2, y[:-1] + step/2
+
+        def deviation(exact:np.ndarray,interpolated:np.ndarray) -> np.ndarray:
+            interpolated = interpolated/np.linalg.norm(interpolated,axis=-1,keepdims=True)
+            return np.linalg.norm(exact - interpolated,axis=-1)
+
+        # Centres of the cells, and midpoints of the horizontal and vertical edges
+        centre = deviation(transform(mid_x[None,:],mid_y[:,None]),
+                           nodes[:-1,:-1] + nodes[:-1,1:] + nodes[1:,:-1] + nodes[1:,1:])
+        horizontal = deviation(transform(mid_x[None,:],y[:,None]),nodes[:,:-1] + nodes[:,1:])
+        vertical = deviation(transform(x[None,:],mid_y[:,None]),nodes[:-1,:] + nodes[1:,:])
+
+        error = np.fmax.reduce([centre,horizontal[:-1],horizontal[1:],vertical[:,:-1],vertical[:,1:]])
+
+        # Cells whose nodes or samples cannot be transformed are exact too
+        exact = ~(error <= limit)
+        interpolated = error[~exact]
+        return nodes, exact, float(interpolated.max()) if interpolated.size else 0.0
+
+    def _cell_at(self,x:float,y:float) -> tuple:
+        # (left, right, top, bottom, coefficients) of the interpolated cell containing a point inside
+        # the frame, with the bilinear coefficients a + b*fx + c*fy + d*fx*fy of each component
+        rows, cols = self.exact.shape
+        row, col = min(int(y/self.step),rows-1), min(int(x/self.step),cols-1)
+        if self.exact[row,col]: return None
+
+        (a, b), (c, d) = self.nodes[row:row+2,col:col+2].tolist()
+        coefficients = tuple(coefficient for k in range(3) for coefficient in (a[k], b[k]-a[k], c[k]-a[k], a[k]-b[k]-c[k]+d[k]))
+        return col*self.step, (col+1)*self.step, row*self.step, (row+1)*self.step, coefficients
+
+    def __call__(self,x:float,y:float) -> Tuple[float,float]:
+        """
+        Returns the (RA, Dec) in degrees of the pixel (`x`, `y`).
+
+        A cursor mostly moves within a cell, so the last interpolated cell is kept and a readout is a few
+        multiplications.
+        """
+
+        cell = self._cell
+        if (cell is None) or not ((cell[0] <= x <= cell[1]) and (cell[2] <= y <= cell[3])):
+            if (0 <= x <= self.width) and (0 <= y <= self.height): cell = self._cell_at(x,y)
+            else: cell = None
+
+            if cell is None:
+                ra, dec = self.wcs.all_pix2world([[x, y]],0)[0]
+                return float(ra), float(dec)
+            self._cell = cell
+
+        left, _, top, _, (a0, b0, c0, d0, a1, b1, c1, d1, a2, b2, c2, d2) = cell
+        fx, fy = (x - left)/self.step, (y - top)/self.step
+        fxy = fx*fy
+        v0 = a0 + b0*fx + c0*fy + d0*fxy
+        v1 = a1 + b1*fx + c1*fy + d1*fxy
+        v2 = a2 + b2*fx + c2*fy + d2*fxy
+        return degrees(atan2(v1,v0)) % 360, degrees(atan2(v2,hypot(v0,v1)))
+
+    def pix2world(self,xy:np.ndarray) -> np.ndarray:
+        """
+        Returns the (N, 2) (RA, Dec) in degrees of (N, 2) pixel coordinates, interpolated in the same way
+        as by calling the grid. Large batches are transformed as fast by `WCS.all_pix2world`; this is
+        meant for checking the interpolation.
+        """
+
+        xy = np.asarray(xy,dtype=float).reshape(-1,2)
+        x, y = xy[:,0], xy[:,1]
+        rows, cols = self.exact.shape
+
+        inside = (x >= 0) & (x <= self.width) & (y >= 0) & (y <= self.height)
+        col = np.clip(np.floor(np.where(inside,x,0)/self.step),0,cols-1).astype(np.intp)
+        row = np.clip(np.floor(np.where(inside,y,0)/self.step),0,rows-1).astype(np.intp)
+        inside &= ~self.exact[row,col]
+
+        fx, fy = (x/self.step - col)[:,None], (y/self.step - row)[:,None]
+        n = self.nodes
+        v = (1-fy)*((1-fx)*n[row,col] + fx*n[row,col+1]) + fy*((1-fx)*n[row+1,col] + fx*n[row+1,col+1])
+
+        world = np.empty_like(xy)
+        world[inside] = fromsphere(v[inside])
+        if not inside.all(): world[~inside] = self.wcs.all_pix2world(xy[~inside],0)
+        return world
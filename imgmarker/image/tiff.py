@@ -0,0 +1,65 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module indexes the pages of multi-page TIFF files, so that any page can be decoded without walking the pages before it."""
+
+from builtins import open as _open
+import struct
+from typing import Optional, Tuple
+import PIL.Image as pillow
+
+def ifds(path:str) -> Optional[Tuple[int,...]]:
+    """
+    Returns the offsets of the image file directories (IFDs) of a TIFF file, one per page, or None if
+    the file is not a TIFF file.
+
+    Pillow finds a page by loading every tag of every page before it. Here only the number of entries
+    and the offset of the next directory are read from each directory, so a stack of a thousand pages
+    is indexed in a few milliseconds. Both classic and BigTIFF files are supported.
+    """
+
+    with _open(path,'rb') as fp:
+        header = fp.read(16)
+
+        if header[:2] == b'II': order = '<'
+        elif header[:2] == b'MM': order = '>'
+        else: return None
+
+        version = struct.unpack(order+'H',header[2:4])[0]
+        if version == 42: count, entry, pointer, offset = 'H', 12, 'I', struct.unpack(order+'I',header[4:8])[0]
+        elif version == 43: count, entry, pointer, offset = 'Q', 20, 'Q', struct.unpack(order+'Q',header[8:16])[0]
+        else: return None
+
+        count, pointer = struct.Struct(order+count), struct.Struct(order+pointer)
+        offsets, seen = [], set()
+
+        # Like Pillow, stop at a directory that has already been seen
+        while offset and (offset not in seen):
+            fp.seek(offset)
+            data = fp.read(count.size)
+            if len(data) < count.size: break
+            offsets.append(offset)
+            seen.add(offset)
+
+            fp.seek(offset + count.size + entry*count.unpack(data)[0])
+            data = fp.read(pointer.size)
+            if len(data) < pointer.size: break
+            offset = pointer.unpack(data)[0]
+
+    return tuple(offsets)
+
+def open(path:str,ifds:Tuple[int,...]=None) -> pillow.Image:
+    """
+    Opens an image with Pillow. If `ifds` is given and the image is a TIFF file, Pillow is given the
+    offsets of all of its pages, so seeking to a page and counting pages read no other page.
+    """
+
+    f = pillow.open(path)
+    if (ifds is not None) and (len(ifds) > 0) and (f.format == 'TIFF') and hasattr(f,'_frame_pos'):
+        f._frame_pos = list(ifds)
+        f._n_frames = len(ifds)
+        f.is_animated = len(ifds) > 1
+    return f
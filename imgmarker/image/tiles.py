@@ -0,0 +1,195 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""This module contains the `Pyramid`, which draws large images from tiles at several resolutions."""
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from math import ceil, floor, log2
+from typing import Callable, Dict, Iterator, Tuple
+import numpy as np
+from imgmarker.gui.pyqt import QObject, QImage, QPainter, QRectF, pyqtSignal
+from imgmarker import config
+from .cache import CACHE
+
+_pool:ThreadPoolExecutor = None
+
+def pool() -> ThreadPoolExecutor:
+    """Returns the thread pool shared by all pyramids, creating it on first use."""
+
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(1,config.TILE_WORKERS), thread_name_prefix='imgmarker-tiles')
+    return _pool
+
+def nlevels(width:int,height:int,size:int) -> int:
+    """Number of levels needed for the coarsest level of a pyramid to fit in a single tile."""
+
+    return max(0,ceil(log2(max(width,height,1)/size))) + 1
+
+def level(scale:float,levels:int) -> int:
+    """
+    Returns the pyramid level to draw at a given zoom.
+
+    Level n is downsampled by 2**n, so the coarsest level that still has at least one image pixel per
+    screen pixel is used.
+    """
+
+    if scale <= 0: return levels - 1
+    if scale >= 1: return 0
+    return min(levels - 1, floor(log2(1/scale)))
+
+class Pyramid(QObject):
+    """
+    Tiles of a rendered frame at power-of-two levels of detail.
+
+    Level 0 is the full resolution frame, and each level above it is downsampled by a further factor of
+    two, until the whole frame fits in one tile. Tiles are only made when they are first drawn, in a
+    pool of worker threads, and are kept in the frame cache, so a large image never has to be converted
+    into one huge pixmap and only the tiles on screen at the current zoom are ever produced.
+
+    Tiles are downsampled by striding, which matches the nearest neighbour scaling of the image view.
+
+    Attributes
+    ----------
+    key: tuple
+        (path, frame, stretch, interval, blur radius) of the frame, as given by `Image.key`.
+
+    array: `numpy.ndarray`
+        Rendered frame at full resolution, with the first row at the top.
+
+    width, height: int
+        Size of the frame.
+
+    size: int
+        Width and height of a tile in pixels.
+
+    levels: int
+        Number of levels.
+
+    updated: `pyqtSignal`
+        Emitted when a tile has been made and the image should be redrawn.
+    """
+
+    updated = pyqtSignal()
+
+    def __init__(self,key:tuple,array:np.ndarray,toqimage:Callable[[np.ndarray],QImage],size:int=None):
+        """
+        Parameters
+        ----------
+        key: tuple
+            (path, frame, stretch, interval, blur radius) of the frame.
+        array: `numpy.ndarray`
+            Rendered frame at full resolution. It must not be modified afterwards.
+        toqimage: callable
+            Converts an array of the same mode as `array` to a `QImage`, e.g. `Image.toqimage`.
+        size: int, optional
+            Width and height of a tile. Defaults to `config.TILE_SIZE`.
+        """
+
+        super().__init__()
+        if size is None: size = config.TILE_SIZE
+
+        self.key = key
+        self.array = array
+        self.toqimage = toqimage
+        self.height, self.width = array.shape[0], array.shape[1]
+        self.size = size
+        self.levels = nlevels(self.width,self.height,size)
+        self.jobs:Dict[tuple,Future] = {}
+
+    def tilekey(self,level:int,row:int,col:int) -> tuple:
+        return CACHE.tilekey(*self.key,level,row,col)
+
+    def span(self,level:int) -> int:
+        """Width and height, in full resolution pixels, covered by a tile at `level`."""
+
+        return self.size << level
+
+    def tiles(self,level:int,rect:QRectF) -> Iterator[Tuple[int,int]]:
+        """Yields the (row, col) of every tile at `level` intersecting `rect`, in image pixels."""
+
+        span = self.span(level)
+        rows = ceil(self.height/span)
+        cols = ceil(self.width/span)
+
+        row0 = max(0,floor(rect.top()/span))
+        row1 = min(rows,ceil(rect.bottom()/span))
+        col0 = max(0,floor(rect.left()/span))
+        col1 = min(cols,ceil(rect.right()/span))
+
+        for row in range(row0,row1):
+            for col in range(col0,col1):
+                yield row, col
+
+    def tile(self,level:int,row:int,col:int) -> QImage:
+        """Makes the tile at (`row`, `col`) of `level`. Safe to call from a worker thread."""
+
+        step = 1 << level
+        span = self.span(level)
+        top, left = row*span, col*span
+
+        return self.toqimage(self.array[top:top+span:step,left:left+span:step])
+
+    def _make(self,level:int,row:int,col:int) -> None:
+        CACHE.put(self.tilekey(level,row,col),self.tile(level,row,col))
+
+    def _done(self,job:Future) -> None:
+        # Runs in the worker thread; the signal is queued to the GUI thread
+        if job.cancelled(): return
+        try: self.updated.emit()
+        except RuntimeError: pass # The pyramid was deleted while the tile was being made
+
+    def request(self,level:int,row:int,col:int) -> None:
+        """Schedules a tile to be made in the background, unless it is cached or already scheduled."""
+
+        key = self.tilekey(level,row,col)
+        if key in CACHE: return
+
+        job = self.jobs.get(key)
+        if job is not None:
+            # Tiles that failed are not retried; ones that were evicted are made again
+            if not job.done() or (job.exception() is not None): return
+
+        job = pool().submit(self._make,level,row,col)
+        job.add_done_callback(self._done)
+        self.jobs[key] = job
+
+    def paint(self,painter:QPainter,rect:QRectF) -> None:
+        """
+        Draws the tiles intersecting `rect`, in image pixels, at the level matching the zoom of `painter`.
+
+        Missing tiles are requested and drawn from the nearest coarser level that is cached in the meantime.
+        """
+
+        _level = level(painter.worldTransform().m11(),self.levels)
+        rect = rect.intersected(QRectF(0,0,self.width,self.height))
+
+        # The coarsest level is a single tile and makes a placeholder for everything else
+        self.request(self.levels-1,0,0)
+
+        for row, col in self.tiles(_level,rect):
+            span = self.span(_level)
+            target = QRectF(col*span,row*span,min(span,self.width-col*span),min(span,self.height-row*span))
+
+            for l in range(_level,self.levels):
+                d = l - _level
+                qimage = CACHE.get(self.tilekey(l,row>>d,col>>d))
+
+                if qimage is not None:
+                    step = 1 << l
+                    left = target.left() - (col>>d)*self.span(l)
+                    top = target.top() - (row>>d)*self.span(l)
+                    source = QRectF(left/step,top/step,target.width()/step,target.height()/step)
+                    painter.drawImage(target,qimage,source)
+                    break
+
+                if l == _level: self.request(l,row,col)
+
+    def close(self) -> None:
+        """Cancels tiles that have not been started."""
+
+        for job in self.jobs.values(): job.cancel()
+        self.jobs.clear()
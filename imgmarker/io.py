@@ -12,9 +12,12 @@ from imgmarker.gui import Mark
 from imgmarker import image, config
 import glob as _glob
 from math import nan, isnan
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Callable
 import csv
 import datetime as dt
+import sqlite3
+import warnings
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 class MarkFile:
     VALID_FIELDNAMES = [
@@ -341,6 +344,7 @@ class ImagesFile:
         """
 
         images:List[image.Image] = []
+        rows:List[Tuple[str,List[int],str]] = []
         
         # Get list of images from images.csv
         if os.path.exists(self.path):
@@ -359,11 +363,15 @@ class ImagesFile:
                     categories = [config.CATEGORY_NAMES.index(cat) for cat in categories if cat != 'None']
                     categories.sort()
 
-                    img = image.Image(os.path.join(config.IMAGE_DIR,name))
-                    img.comment = comment
-                    img.categories = categories
-                    img.seen = True
-                    images.append(img)
+                    rows.append((name,categories,comment))
+
+            with MetadataIndex() as index:
+                images = index.images([os.path.join(config.IMAGE_DIR,name) for name, _, _ in rows])
+
+            for img, (name, categories, comment) in zip(images,rows):
+                img.comment = comment
+                img.categories = categories
+                img.seen = True
 
         return images
 
@@ -395,10 +403,11 @@ class ImagesFile:
                     categories = '+'.join([config.CATEGORY_NAMES[i] for i in category_list])
                 else: categories = 'None'
 
+                ra, dec = img.wcs_center
                 image_rows.append({'date': str(date),
                                     'image': str(name),
-                                    'RA': str(img.wcs_center[0]),
-                                    'DEC': str(img.wcs_center[1]),
+                                    'RA': str(ra),
+                                    'DEC': str(dec),
                                     'categories': str(categories),
                                     'comment': str(comment)})
 
@@ -478,10 +487,11 @@ class FavoritesFile:
                     categories = '+'.join([config.CATEGORY_NAMES[i] for i in category_list])
                 else: categories = 'None'
 
+                ra, dec = img.wcs_center
                 image_rows.append({'date': str(date),
                                     'image': str(name),
-                                    'RA': str(img.wcs_center[0]),
-                                    'DEC': str(img.wcs_center[1]),
+                                    'RA': str(ra),
+                                    'DEC': str(dec),
                                     'categories': str(categories),
                                     'comment': str(comment)})
         if len(favorited) > 0:
@@ -494,6 +504,247 @@ class FavoritesFile:
             with open(self.path, 'w') as f:
                 f.write('')
         
+class MetadataIndex:
+    """
+    Persistent index of image metadata, stored as an SQLite database in SAVE_DIR.
+
+    Each entry holds the width, height, mode, number of channels, number of frames, serialized WCS
+    header and TIFF page offsets of an image, along with the size and modification time of the file when it was read. An entry
+    is reused as long as the size and modification time still match, so loading a previously indexed
+    directory only needs to `stat` each file. Incompatible files are indexed too, so that they are not
+    re-read every time.
+
+    Use as a context manager, which commits new entries on exit.
+
+    Attributes
+    ----------
+    path: str
+        Path to the database.
+
+    reused: int
+        Number of images whose metadata was taken from the index.
+
+    rescanned: int
+        Number of images whose metadata had to be read from the file.
+
+    removed: int
+        Number of entries removed by `verify` because their file no longer exists.
+    """
+
+    def __init__(self,path:str=None):
+        if path is None: path = os.path.join(config.SAVE_DIR,'imgmarker_index.db')
+        self.path = path
+        self.reused = 0
+        self.rescanned = 0
+        self.removed = 0
+        self.connection:sqlite3.Connection = None
+        self._entries:Dict[str,tuple] = None
+
+    def __eq__(self, value):
+        if hasattr(value,'path'):
+            return self.path == value.path
+        else:
+            return self.path == value
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def open(self) -> None:
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS images ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, compatible INTEGER, '
+            'width INTEGER, height INTEGER, mode TEXT, n_channels INTEGER, n_frames INTEGER, wcs TEXT, ifds BLOB)'
+        )
+
+        # Indexes made before page offsets were stored get the column, and their entries fill it on rescan
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(images)')]
+        if 'ifds' not in columns: self.connection.execute('ALTER TABLE images ADD COLUMN ifds BLOB')
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    @property
+    def entries(self) -> Dict[str,tuple]:
+        """All entries of the index, keyed by path, loaded with a single query on first use."""
+
+        if self._entries is None:
+            rows = self.connection.execute('SELECT * FROM images')
+            self._entries = {row[0]: row[1:] for row in rows}
+        return self._entries
+
+    def get(self,path:str) -> dict:
+        """
+        Returns the indexed metadata of an image, or None if there is no valid entry for it.
+
+        An empty dict is returned for files that are indexed as incompatible.
+        """
+
+        entry = self.entries.get(path)
+        if entry is None: return None
+
+        try: stat = os.stat(path)
+        except OSError: return None
+
+        size, mtime, compatible, width, height, mode, n_channels, n_frames, wcs, ifds = entry
+        if (size != stat.st_size) or (mtime != stat.st_mtime_ns): return None
+        if not compatible: return {}
+
+        return {'width': width, 'height': height, 'mode': image.Mode[mode],
+                'n_channels': n_channels, 'n_frames': n_frames, 'wcs_header': wcs,
+                'ifds': tuple(np.frombuffer(ifds,dtype='<u8').tolist()) if ifds is not None else None}
+
+    def put(self,img:image.Image) -> None:
+        """Adds or replaces the entry of an image."""
+
+        try: stat = os.stat(img.path)
+        except OSError: return
+
+        if img.incompatible:
+            entry = (stat.st_size, stat.st_mtime_ns, 0, None, None, None, None, None, None, None)
+        else:
+            ifds = np.array(img.ifds,dtype='<u8').tobytes() if img.ifds is not None else None
+            entry = (stat.st_size, stat.st_mtime_ns, 1, img.width, img.height, img.mode.name,
+                     img.n_channels, img.n_frames, image.wcstostring(img.framewcs(0)), ifds)
+
+        self.connection.execute('INSERT OR REPLACE INTO images VALUES (?,?,?,?,?,?,?,?,?,?,?)', (img.path,) + entry)
+        self.entries[img.path] = entry
+
+    def images(self,paths:List[str],progress:Callable[[int,int],None]=None) -> List[image.Image]:
+        """
+        Creates an `imgmarker.image.Image` for each path, in the same order, using the indexed metadata where
+        it is valid. The metadata of the remaining images is read in parallel with `scan` and indexed.
+
+        Parameters
+        ----------
+        paths: list[str]
+            Paths to the images.
+        progress: callable, optional
+            Called as `progress(done, total)` while metadata is read from files.
+        """
+
+        metadata = [self.get(path) for path in paths]
+        stale = [i for i, m in enumerate(metadata) if m is None]
+
+        for i, m in zip(stale, scan([paths[i] for i in stale],progress)):
+            metadata[i] = m
+
+        images = [image.Image(path,metadata=m) for path, m in zip(paths,metadata)]
+        for i in stale: self.put(images[i])
+
+        self.reused += len(paths) - len(stale)
+        self.rescanned += len(stale)
+
+        return images
+
+    def image(self,path:str) -> image.Image:
+        """Creates an `imgmarker.image.Image`, using the indexed metadata if it is valid and indexing it otherwise."""
+
+        return self.images([path])[0]
+
+    def verify(self,paths:List[str],progress:Callable[[int,int],None]=None) -> None:
+        """Re-reads the metadata of any of `paths` whose entry is missing or stale, and removes entries of deleted files."""
+
+        self.images(paths,progress)
+
+        for path in [path for path in self.entries if not os.path.exists(path)]:
+            self.connection.execute('DELETE FROM images WHERE path = ?', (path,))
+            del self.entries[path]
+            self.removed += 1
+
+    def rebuild(self,paths:List[str],progress:Callable[[int,int],None]=None) -> None:
+        """Discards all entries and re-reads the metadata of `paths`."""
+
+        self.connection.execute('DELETE FROM images')
+        self._entries = {}
+        self.images(paths,progress)
+
+    def report(self) -> str:
+        """Returns a summary of how many entries were reused, rescanned and removed."""
+
+        report = f'Image index: {self.reused} reused, {self.rescanned} rescanned'
+        if self.removed > 0: report += f', {self.removed} removed'
+        return report + '.'
+
+def _read_metadata(path:str) -> dict:
+    """Reads the metadata of an image for `scan`, returning an empty dict if the file is incompatible."""
+
+    try: return image.read_metadata(path)
+    except Exception: return {}
+
+def scan(paths:List[str],progress:Callable[[int,int],None]=None) -> List[dict]:
+    """
+    Reads the metadata of many images in parallel.
+
+    Opening files is dominated by I/O latency (especially on network storage), so files are read by a pool
+    of `config.SCAN_THREADS` threads. Parsing FITS headers is pure Python and holds the GIL, so if
+    `config.SCAN_PROCESSES` is greater than 0, FITS files are read by a pool of that many processes instead.
+
+    Parameters
+    ----------
+    paths: list[str]
+        Paths to the images.
+    progress: callable, optional
+        Called as `progress(done, total)` as results come in.
+
+    Returns
+    ----------
+    metadata: list[dict]
+        Metadata of each image as returned by `imgmarker.image.read_metadata`, in the same order as `paths`.
+        Incompatible files get an empty dict.
+    """
+
+    n = len(paths)
+    if n == 0: return []
+
+    threads = ThreadPoolExecutor(max_workers=max(1,config.SCAN_THREADS), thread_name_prefix='imgmarker-scan')
+    processes = None
+    if (config.SCAN_PROCESSES > 0) and any(image.pathtoformat(path) == 'FITS' for path in paths):
+        processes = ProcessPoolExecutor(max_workers=config.SCAN_PROCESSES)
+
+    try:
+        jobs = []
+        for path in paths:
+            pool = processes if (processes is not None) and (image.pathtoformat(path) == 'FITS') else threads
+            jobs.append(pool.submit(_read_metadata,path))
+
+        metadata = []
+        for i, (path, job) in enumerate(zip(paths,jobs)):
+            # Fall back to reading in this thread if a worker process died
+            try: metadata.append(job.result())
+            except Exception: metadata.append(_read_metadata(path))
+
+            if progress is not None: progress(i+1,n)
+
+    finally:
+        threads.shutdown(cancel_futures=True)
+        if processes is not None: processes.shutdown(cancel_futures=True)
+
+    return metadata
+
+def report_incompatible(images:List[image.Image]) -> None:
+    """Writes the names of incompatible images to a report in SAVE_DIR and warns once about all of them."""
+
+    if len(images) == 0: return
+
+    path = os.path.join(config.SAVE_DIR,'imgmarker_incompatible.txt')
+    names = [img.name for img in images]
+
+    with open(path,'w') as f:
+        f.write('\n'.join(names) + '\n')
+
+    shown = ', '.join(f'"{name}"' for name in names[:5])
+    if len(names) > 5: shown += f' and {len(names)-5} more'
+
+    warnings.warn(f'{len(names)} file(s) are not compatible and will not be loaded: {shown}. The full list is in "{path}".')
+
 def markpaths() -> List[str]:
     _paths = [os.path.join(config.SAVE_DIR,f'{config.USER}_marks.csv')]
     import_dir = os.path.join(config.SAVE_DIR,'imports')
@@ -510,16 +761,27 @@ def markpaths() -> List[str]:
 
     return paths
 
-def glob(edited_images:List[image.Image]=[]) -> Tuple[List[image.Image],int]:
+def imagepaths() -> List[str]:
+    """Returns the sorted paths of all files in IMAGE_DIR with a supported format."""
+
+    paths = sorted(_glob.glob(os.path.join(config.IMAGE_DIR, '*.*')))
+    return [fp for fp in paths if image.pathtoformat(fp) in image.FORMATS]
+
+def glob(edited_images:List[image.Image]=[],progress:Callable[[int,int],None]=None) -> Tuple[List[image.Image],int]:
     """
     Globs in IMAGE_DIR, using edited_images to sort, with edited_images in order at the beginning of the list
     and the remaining unedited images in randomized order at the end of the list.
 
+    Metadata of the images is taken from the `MetadataIndex` in SAVE_DIR where it is still valid.
+
     Parameters
     ----------
     edited_images: list['imgmarker.image.Image']
         A list of Image objects containing the loaded-in information for each edited image.
 
+    progress: callable, optional
+        Called as `progress(done, total)` while metadata of unindexed images is read.
+
     Returns
     ----------
     images: list['imgmarker.image.Image']
@@ -531,8 +793,7 @@ def glob(edited_images:List[image.Image]=[]) -> Tuple[List[image.Image],int]:
     """
 
     # Find all images in image directory
-    paths = sorted(_glob.glob(os.path.join(config.IMAGE_DIR, '*.*')))
-    paths = [fp for fp in paths if image.pathtoformat(fp) in image.FORMATS]
+    paths = imagepaths()
 
     if len(paths) < 1:
         return [], 0
@@ -547,11 +808,12 @@ def glob(edited_images:List[image.Image]=[]) -> Tuple[List[image.Image],int]:
         rng.shuffle(unedited_paths)
 
     # Put edited images at the beginning, unedited images at front
-    images = edited_images + [image.Image(fp) for fp in unedited_paths]
-    for img in images:
-        if img.incompatible == True:
-            images.remove(img)
+    with MetadataIndex() as index:
+        images = edited_images + index.images(unedited_paths,progress)
+    
+    report_incompatible([img for img in images if img.incompatible])
+    images = [img for img in images if not img.incompatible]
 
     idx = min(len(edited_images),len(paths)-1)
 
-    return images, idx
\ No newline at end of file
+    return images, idx
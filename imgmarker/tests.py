@@ -9,6 +9,7 @@ import pytest
 from pytestqt.qtbot import QtBot
 import numpy as np
 from getpass import getuser
+import threading
 import datetime as dt
 from imgmarker.gui.window import MainWindow
 from imgmarker import gui, config, io, image
@@ -44,8 +45,10 @@ def test_load_images(app:MainWindow, qtbot:QtBot):
 
 def test_image_shown(app:MainWindow, qtbot:QtBot):
     test_load_images(app, qtbot)
-    image = app.image_scene.image
-    assert image in app.image_scene.items()
+    item = app.image_scene.item
+    assert item in app.image_scene.items()
+    assert item.image is app.image
+    assert item.pixmap().cacheKey() == app.image.pixmap.cacheKey()
 
 def test_import_markfile(app:MainWindow, qtbot:QtBot):
     app.import_markfile(src=test_catalog_dir_csv)
@@ -248,6 +251,692 @@ def test_next_image(app:MainWindow, qtbot):
 
     assert not np.all(current_image_array == new_image_array)
 
+def test_prefetch(app:MainWindow, qtbot:QtBot):
+    image.CACHE.clear()
+    app.prefetch()
+
+    next_image = app.images[(app.idx+1) % app.N]
+    key = next_image.key(next_image.wrapframe(app.frame))
+    assert (key in app.prefetcher.jobs) or (image.CACHE.renderkey(*key) in image.CACHE)
+
+    # Finished renders are held by the cache, within its budget, rather than by the jobs
+    qtbot.waitUntil(lambda: image.CACHE.renderkey(*key) in image.CACHE)
+    assert key not in app.prefetcher.jobs
+    render = image.CACHE.get(image.CACHE.renderkey(*key))
+    assert image.CACHE.stats()['render']['nbytes'] >= render.nbytes
+
+    app.shift(+1)
+    assert app.image is next_image
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assert np.all(app.image.array == app.image.scale(app.image.read()))
+
+def test_frame_cache(app:MainWindow, qtbot:QtBot):
+    hits = image.CACHE.hits['display']
+    app.shift(+1)
+    app.shift(-1)
+
+    assert image.CACHE.hits['display'] > hits
+    assert image.CACHE.nbytes <= image.CACHE.budget
+
+    cache = image.FrameCache(budget=app.image.array.nbytes)
+    cache.put(cache.rawkey('a',0),app.image.array)
+    cache.put(cache.rawkey('b',0),app.image.array)
+
+    assert cache.get(cache.rawkey('a',0)) is None
+    assert cache.get(cache.rawkey('b',0)) is app.image.array
+    assert cache.evictions['raw'] == 1
+
+def test_fits_read(tmp_path):
+    from astropy.io.fits import PrimaryHDU
+    path = os.path.join(tmp_path,'test.fits')
+    data = np.random.default_rng(0).random((3,50,40)).astype(np.float32)
+    data[0,3,4] = np.nan
+    PrimaryHDU(data).writeto(path)
+
+    with image.fits.open(path) as f:
+        out = image.fits.read(f[0],8,rows=7)
+
+    expected = np.flipud(np.dstack(data))
+    expected = 255*(expected - np.nanmin(data))/(np.nanmax(data) - np.nanmin(data))
+
+    assert out.shape == (50,40,3)
+    assert np.isnan(out[-4,4,0])
+    assert np.allclose(out,expected,atol=1e-3,equal_nan=True)
+
+def test_metadata_index(app:MainWindow, qtbot:QtBot):
+    paths = io.imagepaths()
+
+    with io.MetadataIndex() as index:
+        index.verify(paths)
+    
+    assert (index.reused, index.rescanned) == (len(paths), 0)
+
+    with io.MetadataIndex() as index:
+        img = index.image(app.image.path)
+    
+    assert index.reused == 1
+    assert img.metadata == app.image.metadata | {'wcs': img.wcs}
+    assert np.allclose(img.wcs_center, app.image.wcs_center)
+
+    with io.MetadataIndex() as index:
+        index.rebuild(paths)
+    
+    assert (index.reused, index.rescanned) == (0, len(paths))
+
+def test_scan(app:MainWindow, qtbot:QtBot):
+    paths = io.imagepaths()
+    serial = [image.read_metadata(path) for path in paths]
+    progress = []
+
+    parallel = io.scan(paths + [__file__.replace('.py','.fits')], progress=lambda done, total: progress.append(done))
+
+    assert [m['width'] for m in parallel[:-1]] == [m['width'] for m in serial]
+    assert [m['n_frames'] for m in parallel[:-1]] == [m['n_frames'] for m in serial]
+    assert parallel[-1] == {}
+    assert progress == list(range(1,len(paths)+2))
+
+def test_tiles(app:MainWindow, qtbot:QtBot, monkeypatch):
+    monkeypatch.setattr(config,'TILE_THRESHOLD',0)
+    monkeypatch.setattr(config,'TILE_SIZE',64)
+    image.CACHE.clear()
+    app.image.blur()
+
+    pyramid = app.image.pyramid
+    assert app.image.pixmap is None
+    assert app.image_scene.item.pyramid is pyramid
+    assert pyramid.levels == image.tiles.nlevels(app.image.width,app.image.height,64)
+
+    app.image_view.grab()
+    qtbot.waitUntil(lambda: pyramid.tilekey(pyramid.levels-1,0,0) in image.CACHE)
+
+    tile = pyramid.tile(1,0,1)
+    assert (tile.width(), tile.height()) == (64,64)
+    assert tile == pyramid.toqimage(np.ascontiguousarray(pyramid.array[0:128:2,128:256:2]))
+    image.CACHE.clear()
+
+def test_preview(app:MainWindow, qtbot:QtBot, monkeypatch):
+    monkeypatch.setattr(config,'PREVIEW_SIZE',128)
+    image.CACHE.clear()
+    app.prefetcher.clear()
+
+    # Holds the render back, so the preview read in the background is shown first
+    gate = threading.Event()
+    render = image.Image.render
+    monkeypatch.setattr(image.Image,'render',lambda self, frame=0: gate.wait(10) and render(self,frame))
+    app.shift(+1)
+
+    item = app.image_scene.item
+    assert not app.image.quickpreview
+    assert app.image._array is None
+    qtbot.waitUntil(lambda: not item.pixmap().isNull())
+    assert item.pixmap().width() < app.image.width
+    assert item.boundingRect().width()*item.scale() == app.image.width
+
+    gate.set()
+    qtbot.waitUntil(lambda: app.image._array is not None)
+    assert item.scale() == 1
+    assert item.pixmap().width() == app.image.width
+
+def test_histogram(app:MainWindow, qtbot:QtBot):
+    v = image.vibrance(app.image._array,app.image.mode)
+    histogram = image.Histogram(v)
+    span = float(v.max()) - float(v.min())
+
+    assert histogram.limits(image.Interval.MINMAX) == image.Interval.MINMAX.get_limits(v)
+    assert np.allclose(histogram.limits(image.Interval.PERCENTILE),image.Interval.PERCENTILE.get_limits(v),atol=1)
+    assert np.allclose(histogram.limits(image.Interval.ZSCALE),image.Interval.ZSCALE.get_limits(v),atol=0.05*span)
+
+    app.interval = image.Interval.ZSCALE
+    misses = image.CACHE.misses['histogram']
+    app.interval = image.Interval.PERCENTILE
+    assert image.CACHE.misses['histogram'] == misses
+    assert (app.image.frame, image.Interval.PERCENTILE) in app.image._vlims
+
+def test_lut(app:MainWindow, qtbot:QtBot):
+    raw = app.image.read()
+    app.image.stretch = image.Stretch.LOG
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assert np.array_equal(app.image.scale(raw),app.image.scale(raw.astype(np.float32)))
+
+    app.image.mode = image.Mode.I16
+    raw = np.arange(2**16,dtype=np.uint16).reshape(256,256)
+
+    # Float data are scaled in float32, which can truncate one count lower than the float64 table
+    assert np.abs(app.image.scale(raw).astype(int) - app.image.scale(raw.astype(np.float32))).max() <= 1
+
+def test_toqimage(app:MainWindow, qtbot:QtBot):
+    array = np.arange(3*5*3,dtype=np.uint8).reshape(3,5,3)
+    buffer = image.qbuffer(3,5,image.Mode.RGB)
+    buffer[...] = array
+
+    assert buffer.strides[0] == 16
+    assert image.toqimage(buffer,image.Mode.RGB)._data is buffer
+    assert image.toqimage(array,image.Mode.RGB) == image.toqimage(buffer,image.Mode.RGB)
+    assert image.toqimage(buffer,image.Mode.RGB).pixelColor(4,2).getRgb()[:3] == tuple(array[2,4])
+
+    qimage = app.image.toqimage(app.image.filter(app.image.array))
+    assert qimage == app.image.pixmap.toImage().convertToFormat(qimage.format())
+
+def test_parallel_scale(app:MainWindow, qtbot:QtBot, monkeypatch):
+    raw = app.image.read().astype(np.float32)
+    monkeypatch.setattr(image.fits,'BAND_BYTES',4096)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        monkeypatch.setattr(config,'SCALE_THREADS',1)
+        serial = app.image.scale(raw)
+        monkeypatch.setattr(config,'SCALE_THREADS',4)
+        assert len(image.parallel.split(raw.shape[0],1000)) >= 4
+        assert np.array_equal(app.image.scale(raw),serial)
+
+def test_blur(app:MainWindow, qtbot:QtBot):
+    image.CACHE.clear()
+    slider = app.blur_window.slider
+    unblurred = app.image.pixmap
+
+    slider.setSliderDown(True)
+    slider.setValue(6)
+    assert app.image.r == 0
+    assert app.image.pixmap is not unblurred
+
+    slider.setSliderDown(False)
+    assert app.image.r == 3
+
+    key = image.CACHE.displaykey(*app.image.key())
+    qtbot.waitUntil(lambda: (key in image.CACHE) and (app.image.pixmap is image.CACHE.get(key)))
+
+def test_gaussian_filter(app:MainWindow, qtbot:QtBot):
+    from scipy.ndimage import gaussian_filter
+    array = app.image.array.astype(np.float32)
+
+    for sigma in (2,5,10):
+        out = image.convolution.gaussian_filter(array,sigma)
+        expected = gaussian_filter(array,(sigma,sigma,0))
+
+        assert np.sqrt(np.mean((out - expected)**2)) < 0.01*255
+        assert np.abs(out - expected).max() < 0.1*255
+        assert np.array_equal(out,image.convolution.gaussian_filter(array,sigma,threads=False))
+
+def test_blur_cache(app:MainWindow, qtbot:QtBot, monkeypatch):
+    image.CACHE.clear()
+    calls = []
+    def gaussian_filter(*args, **kwargs):
+        calls.append(args[1])
+        return image.convolution.gaussian_filter(*args, **kwargs)
+    monkeypatch.setattr(image,'gaussian_filter',gaussian_filter)
+
+    # Returning to a radius reuses the blurred frame
+    app.image.blur(6)
+    app.image.blur(10)
+    calls.clear()
+    app.image.blur(6)
+    assert calls == []
+
+    image.CACHE.clear()
+
+def test_frame_buffer(tmp_path, qtbot:QtBot):
+    from astropy.io.fits import HDUList, PrimaryHDU, ImageHDU
+    path = os.path.join(tmp_path,'cube.fits')
+    data = np.random.default_rng(0).random((10,30,20)).astype(np.float32)
+    HDUList([PrimaryHDU()] + [ImageHDU(frame) for frame in data]).writeto(path)
+
+    assert image.frames.window(10,0,4) == [1,9,2,3]
+
+    img = image.Image(path)
+    assert img.n_frames == 10
+    buffer = image.FrameBuffer(size=4,workers=1)
+    buffer.update(img,0)
+    qtbot.waitUntil(lambda: all(buffer.ready(img,i) for i in (1,2,3,9)))
+    assert not buffer.ready(img,5)
+
+    render = buffer.take(img,2)
+    assert render.key == img.key(2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assert np.array_equal(render.array,img.scale(img.read(2),2))
+
+    # Renders are held by the cache, within its budget
+    assert image.CACHE.stats()['frame']['entries'] == 4
+    assert image.CACHE.stats()['frame']['nbytes'] == 4*render.nbytes
+
+    # Frames leaving the window are dropped
+    buffer.update(img,5)
+    assert set(key[1] for key in buffer.frames) == {6,4,7,8}
+    assert not buffer.ready(img,2)
+
+    rate = image.FrameRate()
+    for shown in (True,False,True,True): rate.tick(shown)
+    assert (rate.shown, rate.waits) == (3, 1)
+    assert rate.fps > 0
+
+    buffer.shutdown()
+    image.CACHE.clear()
+
+def test_tiff_pages(tmp_path):
+    import PIL.Image as pillow
+    path = os.path.join(tmp_path,'stack.tif')
+    data = np.random.default_rng(0).integers(0,255,(20,30,40),dtype=np.uint8)
+    pages = [pillow.fromarray(page) for page in data]
+    pages[0].save(path,save_all=True,append_images=pages[1:])
+
+    ifds = image.tiff.ifds(path)
+    with pillow.open(path) as f:
+        assert len(ifds) == f.n_frames == 20
+        assert list(ifds) == f._frame_pos
+
+    img = image.Image(path)
+    assert (img.n_frames, img.ifds) == (20, ifds)
+    assert np.array_equal(img.read(19),data[19])
+    assert image.tiff.ifds(__file__) is None
+
+    with io.MetadataIndex(os.path.join(tmp_path,'index.db')) as index:
+        index.put(img)
+        assert index.image(path).ifds == ifds
+
+def test_fits_layout(tmp_path):
+    from astropy.io import fits as astropy_fits
+    path = os.path.join(tmp_path,'layout.fits')
+    rng = np.random.default_rng(0)
+
+    scaled = astropy_fits.ImageHDU(rng.integers(-1000,1000,(30,40),dtype=np.int16),do_not_scale_image_data=True)
+    scaled.header.update(BSCALE=2.0,BZERO=10.0,BLANK=-1000)
+    table = astropy_fits.BinTableHDU.from_columns([astropy_fits.Column(name='a',format='E',array=np.arange(5.0))])
+    astropy_fits.HDUList([astropy_fits.PrimaryHDU(), astropy_fits.ImageHDU(rng.random((3,30,40))), table,
+                          astropy_fits.ImageHDU(rng.integers(0,60000,(30,40)).astype(np.uint16)), scaled]).writeto(path)
+
+    layout = image.fits.layout(path)
+    assert image.fits.layout(path) is layout
+    expected = [hdu for hdu in astropy_fits.open(path,memmap=False) if isinstance(hdu,astropy_fits.ImageHDU)]
+    assert len(layout) == len(expected) == 3
+
+    for hdu, other in zip(layout,expected):
+        assert hdu.header == other.header
+        for step in (1,3):
+            assert np.array_equal(image.fits.read(hdu,16,step=step),image.fits.read(other,16,step=step),equal_nan=True)
+
+    # A file is mapped once while it is read, and unmapped afterwards so that it can be replaced
+    with image.fits.mapped(path) as mm:
+        assert image.fits.handle(path) is mm
+        with image.fits.mapped(path): pass
+        assert image.fits._handles[path][0] is mm
+    assert image.fits._handles == {}
+
+    # Files that changed are scanned again
+    os.remove(path)
+    astropy_fits.PrimaryHDU(rng.random((20,10))).writeto(path)
+    assert [hdu.shape for hdu in image.fits.layout(path)] == [(20,10)]
+
+def test_fits_normalize(tmp_path, monkeypatch):
+    from astropy.io.fits import PrimaryHDU
+    monkeypatch.setattr(image.fits,'CHUNK',7)
+    rng = np.random.default_rng(0)
+
+    values = rng.random(100)
+    values[[0,50]] = np.nan
+    assert image.fits.minmax(values) == (np.nanmin(values), np.nanmax(values))
+    assert image.fits.minmax(values[:1]) == (np.inf, -np.inf)
+
+    for data in (rng.integers(-2**15,2**15,(50,40),dtype=np.int16), rng.random((3,50,40))):
+        path = os.path.join(tmp_path,f'{data.dtype}.fits')
+        PrimaryHDU(data).writeto(path)
+        hdu = image.fits.layout(path)[0]
+        out = image.fits.read(hdu,16,rows=7)
+
+        expected = np.flipud(np.dstack(data) if data.ndim == 3 else data).astype(np.float64)
+        expected = 65535*(expected - data.min())/(float(data.max()) - data.min())
+
+        assert out.dtype.isnative and (out.dtype == image.fits.dtype(hdu,16))
+        assert np.allclose(out,expected,atol=0.5,rtol=1e-6)
+
+def test_frame_wcs(tmp_path, qtbot:QtBot):
+    from astropy.io import fits as astropy_fits
+    path = os.path.join(tmp_path,'wcs.fits')
+    hdus = [astropy_fits.PrimaryHDU()]
+    for i, ra in enumerate((10.0, 20.0, 20.0)):
+        hdu = astropy_fits.ImageHDU(np.zeros((30,40),dtype=np.float32))
+        hdu.header.update(CTYPE1='RA---TAN',CTYPE2='DEC--TAN',CRPIX1=20,CRPIX2=15,CRVAL1=ra,CRVAL2=-30,
+                          CDELT1=-1e-4,CDELT2=1e-4,EXTNAME=f'FRAME{i}')
+        hdus.append(hdu)
+    astropy_fits.HDUList(hdus).writeto(path)
+
+    img = image.Image(path)
+    ras = []
+    for frame in range(3):
+        img.frame = frame
+        ras.append(img.wcs.wcs.crval[0])
+        assert img.wcs is img.framewcs(frame)
+    assert ras == [10.0, 20.0, 20.0]
+
+    # Frames with the same WCS keywords share a solution, even across images
+    assert img.framewcs(1) is img.framewcs(2)
+    assert image.Image(path).framewcs(2) is img.framewcs(1)
+    assert img.metadata['wcs'] is img.framewcs(0)
+
+    mark = gui.Mark(10,12,image=img)
+    assert np.allclose(mark.wcs_center.topix(img.wcs),(10,12))
+
+def test_wcs_geometry(tmp_path, qtbot:QtBot, monkeypatch):
+    from astropy.io import fits as astropy_fits
+    from astropy.wcs import WCS
+    path = os.path.join(tmp_path,'geometry.fits')
+    hdus = [astropy_fits.PrimaryHDU()]
+    for ra, angle in ((10.0, 0.0), (20.0, 30.0)):
+        hdu = astropy_fits.ImageHDU(np.zeros((30,40),dtype=np.float32))
+        c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+        hdu.header.update(CTYPE1='RA---TAN',CTYPE2='DEC--TAN',CRPIX1=20,CRPIX2=15,CRVAL1=ra,CRVAL2=-30,
+                          CDELT1=-1e-4,CDELT2=1e-4,PC1_1=c,PC1_2=s,PC2_1=-s,PC2_2=c)
+        hdus.append(hdu)
+    astropy_fits.HDUList(hdus).writeto(path)
+
+    calls = []
+    all_pix2world = WCS.all_pix2world
+    def counted(self,*args,**kwargs):
+        calls.append(None)
+        return all_pix2world(self,*args,**kwargs)
+    monkeypatch.setattr(WCS,'all_pix2world',counted)
+
+    img = image.Image(path)
+    expected = img.wcs.all_pix2world([[img.width/2, img.height/2]],0)[0]
+    calls.clear()
+
+    # Computed once per frame, however often it is used
+    for _ in range(5): assert np.allclose(img.wcs_center,expected)
+    assert len(calls) == 1
+    assert np.isclose(img.pixel_scale,0.36)
+    assert np.isclose(img.orientation,0.0)
+    assert img.footprint.shape == (4,2)
+    calls.clear()
+
+    img.frame = 1
+    assert np.isclose(img.wcs_center[0],20.0,atol=0.01)
+    assert np.isclose(img.orientation,-30.0)
+    assert np.isclose(img.pixel_scale,0.36)
+    img.frame = 0
+    assert np.allclose(img.wcs_center,expected)
+    assert len(calls) == 1
+
+    # Setting the WCS replaces the quantities derived from it
+    img.wcs = img.framewcs(1)
+    assert np.isclose(img.wcs_center[0],20.0,atol=0.01)
+    assert len(calls) == 2
+
+    img.wcs = None
+    assert np.isnan(img.wcs_center).all() and np.isnan(img.pixel_scale)
+    assert img.footprint is None
+
+    mark = gui.Mark(10,12,image=image.Image(path),size_unit='arcsec',size=1.8)
+    assert np.isclose(mark.size,5)
+
+def test_skygrid(monkeypatch):
+    from astropy.io import fits as astropy_fits
+    from astropy.wcs import WCS
+    from astropy.coordinates import SkyCoord
+    header = astropy_fits.Header({'NAXIS': 2, 'NAXIS1': 1000, 'NAXIS2': 800,
+                                  'CTYPE1': 'RA---TAN-SIP', 'CTYPE2': 'DEC--TAN-SIP', 'CRPIX1': 500, 'CRPIX2': 400,
+                                  'CRVAL1': 0.01, 'CRVAL2': 60.0, 'CD1_1': -1e-4, 'CD1_2': 2e-5, 'CD2_1': 2e-5, 'CD2_2': 1e-4,
+                                  'A_ORDER': 3, 'B_ORDER': 3, 'A_2_0': 2e-5, 'A_1_1': 1e-5, 'B_0_2': -2e-5, 'A_3_0': 1e-8, 'B_0_3': 1e-8})
+    wcs = WCS(header)
+    scale = 0.36*np.sqrt(1 + 0.2**2)
+
+    def check(grid, xy):
+        exact = SkyCoord(*wcs.all_pix2world(xy,0).T,unit='deg')
+        batch = SkyCoord(*grid.pix2world(xy).T,unit='deg')
+        single = SkyCoord(*np.array([grid(x,y) for x, y in xy.tolist()]).T,unit='deg')
+        assert exact.separation(batch).arcsec.max()/scale < grid.tolerance
+        assert exact.separation(single).arcsec.max()/scale < grid.tolerance
+
+    rng = np.random.default_rng(0)
+    xy = np.concatenate([rng.uniform(0,(1000,800),(2000,2)),[[0,0],[1000,800],[1000,0],[-5,3],[1200,900]]])
+
+    # Refined until every cell is within tolerance, across RA = 0
+    grid = image.SkyGrid(wcs,1000,800,step=64,tolerance=0.01)
+    assert grid.step < 64 and not grid.exact.any() and grid.error < 0.005
+    check(grid, xy)
+
+    # Cells that cannot be refined further fall back to the exact transform
+    monkeypatch.setattr(image.skygrid,'MAX_CELLS',100)
+    grid = image.SkyGrid(wcs,1000,800,step=64,tolerance=0.06)
+    assert grid.exact.any() and not grid.exact.all()
+    check(grid, xy)
+
+def test_cursor_throttle(app:MainWindow, qtbot:QtBot, monkeypatch):
+    from imgmarker.gui.pyqt import QPoint, QPointF, QEvent, QMouseEvent, Qt
+    pos = [QPoint(10,10)]
+    monkeypatch.setattr(app.image_view,'mouse_pix_pos',lambda correction=True: pos[0])
+    event = QMouseEvent(QEvent.Type.MouseMove,QPointF(0,0),QPointF(0,0),Qt.MouseButton.NoButton,
+                        Qt.MouseButton.NoButton,Qt.KeyboardModifier.NoModifier)
+    app.pos_timer.setInterval(1000)
+    app.pos_events = app.pos_updates = 0
+
+    # A burst of moves updates the readout on the first one and once more when the interval ends
+    for i in range(50):
+        pos[0] = QPoint(10+i,10)
+        app.mouseMoveEvent(event)
+    assert app.pos_events == 50
+    assert app.pos_updates == 1
+    assert app.pos_widget.x_text.text() == '10 px'
+
+    app.pos_timer.setInterval(0)
+    qtbot.waitUntil(lambda: app.pos_widget.x_text.text() == '59 px')
+    assert app.pos_updates == 2
+    ra = app.pos_widget.ra_text.text()
+    assert ra.endswith('°')
+
+    # Nothing is recomputed while the pixel, image, WCS and format are unchanged
+    app.update_pos()
+    app.update_pos()
+    assert app.pos_updates == 2
+
+    app.settings_window.show_sexagesimal_box.setChecked(not app.settings_window.show_sexagesimal_box.isChecked())
+    app.update_pos()
+    assert app.pos_updates == 3
+    assert app.pos_widget.ra_text.text() != ra
+
+    pos[0] = QPoint(-5,-5)
+    app.update_pos()
+    assert app.pos_widget.x_text.text() == ''
+    assert app.pos_updates == 3
+
+def test_coordinates():
+    from astropy.wcs import WCS
+    from imgmarker import coordinates
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crpix = [50, 40]
+    wcs.wcs.crval = [150.0, -2.0]
+    wcs.wcs.cdelt = [-1e-3, 1e-3]
+    wcs.pixel_shape = (100, 80)
+
+    # Batches convert in one call, with the origin at the upper-left corner
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0,(100,80),(1000,2))
+    radec = coordinates.pix2world(xy,wcs)
+    assert radec.shape == (1000,2)
+    assert np.allclose(radec,wcs.all_pix2world(np.column_stack((xy[:,0],80-xy[:,1])),0))
+    assert np.allclose(coordinates.world2pix(radec,wcs),xy)
+
+    # The classes wrap the arrays, giving scalars for single positions
+    pix = coordinates.WorldCoord(*radec[0]).topix(wcs)
+    assert np.ndim(pix.x) == 0 and (pix.x, pix.y) == tuple(np.round(xy[0]))
+    world = coordinates.PixCoord(xy[:,0],xy[:,1]).toworld(wcs)
+    assert world.ra.shape == (1000,) and isinstance(world.ra,coordinates.Angle)
+    assert np.allclose(world.array,coordinates.pix2world(np.round(xy),wcs))
+    pix = coordinates.PixCoord.fromarray(xy)
+    assert np.array_equal(pix.array,np.round(xy)) and not np.array_equal(xy,pix.array)
+    h, m, s = coordinates.Angle(-15.5).hms
+    assert (h, m, s) == (-1, -2, -0.0)
+
+    # Bulk formatting, carrying seconds that round to 60
+    ra = [150.0, 359.99999999, np.nan]
+    dec = [-2.5, 0.0, 89.999999999]
+    assert coordinates.formatra(ra,True) == ['10h 00m 00.00s', '00h 00m 00.00s', 'nan']
+    assert coordinates.formatdec(dec,True) == ['-02° 30\' 00.00"', '+00° 00\' 00.00"', '+90° 00\' 00.00"']
+    assert coordinates.formatra(ra[:1]) == ['150.00000°']
+    assert coordinates.formatdec(dec[:1],decimals=6,symbol='') == ['-2.500000']
+
+def test_config_prefetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(config,'SAVE_DIR',str(tmp_path))
+    monkeypatch.setattr(config,'IMAGE_DIR',str(tmp_path))
+    monkeypatch.setattr(config,'PREFETCH_DEPTH',3)
+    monkeypatch.setattr(config,'PREFETCH_WORKERS',1)
+
+    # Written to a new configuration file, and read back from it
+    assert config.read()[-2:] == (3, 1)
+    assert config.read()[-2:] == (3, 1)
+    assert 'prefetch_depth = 3' in open(config.path()).read()
+
+    # Configuration files without them use the defaults
+    lines = [l for l in open(config.path()) if not l.startswith('prefetch')]
+    with open(config.path(),'w') as f: f.write(''.join(lines).strip())
+    monkeypatch.setattr(config,'PREFETCH_DEPTH',2)
+    assert config.read()[-2:] == (2, 1)
+
+def test_fits_wide_integers(tmp_path, qtbot:QtBot):
+    from astropy.io.fits import PrimaryHDU
+    rng = np.random.default_rng(0)
+
+    # An outlier must not squeeze the sky of 32- and 64-bit data into one display level
+    for dtype in (np.int32, np.int64, np.float32):
+        data = rng.normal(1000,10,(200,200)).astype(dtype)
+        data[5,5] = 1e9
+        path = os.path.join(tmp_path,f'{np.dtype(dtype).name}.fits')
+        PrimaryHDU(data).writeto(path)
+
+        img = image.Image(path)
+        assert image.fits.dtype(image.fits.layout(path)[0],img.mode.iinfo.bits) == np.float32
+        img.interval = image.Interval.ZSCALE
+        img.seek(0)
+        assert len(np.unique(img.array)) > 50
+
+def test_fits_preview(tmp_path, qtbot:QtBot, monkeypatch):
+    from astropy.io.fits import PrimaryHDU
+    monkeypatch.setattr(config,'PREVIEW_SIZE',100)
+
+    path = os.path.join(tmp_path,'wide.fits')
+    PrimaryHDU(np.arange(200*400,dtype=np.float32).reshape(200,400)).writeto(path)
+
+    img = image.Image(path)
+    assert (img.width, img.height) == (400, 200)
+    assert img.quickpreview
+
+    # The preview of a non-square image covers the full image in both directions
+    item = image.ImageItem()
+    item.setImage(img)
+    img.preview(0)
+    assert (item.pixmap().width(), item.pixmap().height()) == (100, 50)
+    assert item.pixmap().width()*item.scale() == 400
+    assert item.pixmap().height()*item.scale() == 200
+
+def test_histogram_outlier(qtbot:QtBot):
+    rng = np.random.default_rng(0)
+    v = rng.normal(1000,10,(500,500)).astype(np.float32)
+    v[7,7] = 1e7
+
+    # An outlier must not leave the sky in a handful of bins
+    histogram = image.Histogram(v)
+    assert np.allclose(histogram.limits(image.Interval.PERCENTILE),image.Interval.PERCENTILE.get_limits(v),atol=0.01)
+
+    # ZScale is fitted to evenly spaced quantiles rather than to a sample of the pixels
+    n = image.Interval.ZSCALE.n_samples
+    quantiles = np.quantile(v,(np.arange(n) + 0.5)/n)
+    assert np.allclose(histogram.limits(image.Interval.ZSCALE),image.Interval.ZSCALE.get_limits(quantiles),atol=0.01)
+    assert np.allclose(histogram.limits(image.Interval.ZSCALE),image.Interval.ZSCALE.get_limits(v),atol=10)
+
+    # Limits in bins too wide to resolve them are left to the interval
+    v = np.exp(rng.normal(0,5,(500,500))).astype(np.float32)
+    assert image.Histogram(v).limits(image.Interval.PERCENTILE) is None
+
+def test_imageless_edge(app:MainWindow, qtbot:QtBot):
+    from imgmarker import coordinates
+    assert app.image.wcs is not None
+
+    # Marks within half a pixel of the edge are rounded into the image
+    ra, dec = coordinates.pix2world([-0.4, 10],app.image.wcs)
+    mark = gui.Mark(ra=ra,dec=dec,image=None)
+    app.imageless_marks = [mark]
+    app.update_marks()
+    assert mark in app.image_scene.items()
+
+def test_frame_buffer_lazy(app:MainWindow, qtbot:QtBot, tmp_path, monkeypatch):
+    from astropy.io.fits import HDUList, PrimaryHDU, ImageHDU
+    path = os.path.join(tmp_path,'cube.fits')
+    data = np.random.default_rng(0).random((5,30,20)).astype(np.float32)
+    HDUList([PrimaryHDU()] + [ImageHDU(frame) for frame in data]).writeto(path)
+
+    # Showing a cube does not buffer its frames until they are stepped through
+    app.images.insert(app.idx+1,image.Image(path))
+    app.N = len(app.images)
+    app.shift(+1)
+    assert app.image.n_frames == 5
+    assert not app.framebuffer.frames
+
+    app.shiftframe(+1)
+    assert app.framebuffer.frames
+    app.framebuffer.clear()
+    image.CACHE.clear()
+
+def test_limits_interval_switch(tmp_path, monkeypatch):
+    from astropy.io.fits import PrimaryHDU
+    path = os.path.join(tmp_path,'switch.fits')
+    PrimaryHDU(np.random.default_rng(0).normal(1000,10,(50,40)).astype(np.float32)).writeto(path)
+    img = image.Image(path)
+    img.interval = image.Interval.MINMAX
+    raw = img.read(0)
+
+    # The interval changes while the histogram is built, as it can while a worker renders
+    histogram = image.Histogram
+    def switch(v):
+        img.interval = image.Interval.ZSCALE
+        return histogram(v)
+    monkeypatch.setattr(image,'Histogram',switch)
+
+    vlims = img.limits(raw,0)
+    assert vlims == image.Interval.MINMAX.get_limits(image.vibrance(raw,img.mode))
+    assert img._vlims == {(0, image.Interval.MINMAX): vlims}
+    image.CACHE.clear()
+
+def test_render_settings_switch(tmp_path, monkeypatch):
+    from astropy.io.fits import PrimaryHDU
+    path = os.path.join(tmp_path,'switch.fits')
+    PrimaryHDU(np.random.default_rng(0).normal(1000,10,(50,40)).astype(np.float32)).writeto(path)
+    img = image.Image(path)
+    img.stretch, img.interval = image.Stretch.LINEAR, image.Interval.MINMAX
+    key = img.key(0)
+
+    # The settings change while the frame is scaled, as they can while a worker renders
+    histogram = image.Histogram
+    def switch(v):
+        img.stretch, img.interval = image.Stretch.LOG, image.Interval.ZSCALE
+        return histogram(v)
+    monkeypatch.setattr(image,'Histogram',switch)
+
+    render = img.render(0)
+    assert render.key == key
+    raw = img.read(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = img.scale(raw,None,image.Stretch.LINEAR,image.Interval.MINMAX)
+    assert np.array_equal(render.array,expected)
+    assert image.CACHE.get(image.CACHE.scaledkey(path,0,*key[2:4])) is render.array
+    image.CACHE.clear()
+
+def test_scratch_threads():
+    from imgmarker.image import buffers
+    image.CACHE.clear()
+    array = np.random.default_rng(0).random((64,48,3)).astype(np.float32)
+    barrier = threading.Barrier(4)
+    held = []
+    def blur():
+        barrier.wait()
+        for _ in range(3): image.convolution.gaussian_filter(array,2)
+        held.append(buffers.nbytes())
+    threads = [threading.Thread(target=blur) for _ in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert held == [0]*4
+    stats = image.CACHE.stats()['buffer']
+    assert stats['entries'] == 1 and stats['nbytes'] == array.size*4
+    image.CACHE.clear()
+    assert image.CACHE.stats()['buffer']['nbytes'] == 0
+
 # def test_save_category(app, qtbot):
 #     app.mark(group=1, test=True)
 #     date = 0
@@ -0,0 +1,658 @@
+"""
+Copyright © 2025, UChicago Argonne, LLC
+
+Full license found at _YOUR_INSTALLATION_DIRECTORY_/imgmarker/LICENSE
+"""
+
+"""
+Benchmarks of the image pipeline of Image Marker.
+
+Run a benchmark with
+
+    python tools/benchmarks.py <benchmark> [options]
+
+and list the benchmarks with `python tools/benchmarks.py --help`.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from math import inf, nan
+from typing import Callable
+import numpy as np
+from astropy.io import fits
+from astropy.visualization import ManualInterval
+from imgmarker.gui.pyqt import QApplication, QImage
+from imgmarker import config
+from imgmarker.image import Image, Mode, FrameBuffer, FrameRate, CACHE, qbuffer, toqimage, vibrance, parallel
+from imgmarker.image.convolution import gaussian_filter, sigma_to_size
+
+try: import resource # POSIX only
+except ImportError: resource = None
+
+try: import psutil
+except ImportError: psutil = None
+
+def best(func:Callable,repeat:int=3) -> float:
+    """Returns the fastest of `repeat` wall times of `func()`, in seconds."""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def size(value:str) -> tuple:
+    """Parses a WIDTHxHEIGHT argument."""
+
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def random(shape:tuple,mode:Mode) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0,mode.iinfo.max,shape,dtype=mode.iinfo.dtype,endpoint=True)
+
+def shape(width:int,height:int,mode:Mode) -> tuple:
+    n = {Mode.RGB: 3, Mode.RGBA: 4}.get(mode,1)
+    return (height,width,n) if n > 1 else (height,width)
+
+def align8to32(bytes: bytes, width: int, bits_per_pixel: str) -> bytes:
+    """
+    converts each scanline of data from 8 bit to 32 bit aligned. slightly modified from Pillow
+    """
+
+    # calculate bytes per line and the extra padding if needed
+    bits_per_line = bits_per_pixel * width
+    full_bytes_per_line, remaining_bits_per_line = divmod(bits_per_line, 8)
+    bytes_per_line = full_bytes_per_line + (1 if remaining_bits_per_line else 0)
+
+    extra_padding = -bytes_per_line % 4
+
+    # already 32 bit aligned by luck
+    if not extra_padding:
+        return bytes
+
+    new_data = [
+        bytes[i * bytes_per_line : (i + 1) * bytes_per_line] + b"\x00" * extra_padding
+        for i in range(len(bytes) // bytes_per_line)
+    ]
+
+    return b"".join(new_data)
+
+def legacy_toqimage(array:np.ndarray,mode:Mode) -> QImage:
+    """Conversion used before arrays were written into QImage-compatible buffers."""
+
+    width, height  = array.shape[1], array.shape[0]
+    data = array.tobytes()
+
+    if mode in {Mode.I16, Mode.I8, Mode.L}:
+        data = align8to32(data,width,mode.iinfo.bits)
+
+    if array.ndim == 3:
+        n = array.shape[2]
+        qim = QImage(data,width,height,n*width,mode.format)
+    else:
+        qim = QImage(data,width,height,mode.format)
+
+    qim._data = data
+    return qim
+
+def maxrss() -> float:
+    """
+    Peak resident set size of this process, in bytes. Without the `resource` module (on Windows) the
+    peak working set from psutil is used, and nan is returned if psutil is not installed either.
+    """
+
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else 1024*rss
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info,'peak_wset',info.rss)
+    return nan
+
+def legacy_scale(img:Image,_array:np.ndarray) -> np.ndarray:
+    """Float64 whole-array scaling used before the banded float32 and lookup table paths."""
+
+    out = _array.astype(np.float64)
+    v = vibrance(_array,img.mode)
+    scaling = img.stretch + ManualInterval(*img.limits(_array))
+
+    if (img.mode == Mode.RGB) or (img.mode == Mode.RGBA):
+        scale = img.mode.iinfo.max*scaling(v)/v
+        out[:, :, 0] *= scale
+        out[:, :, 1] *= scale
+        out[:, :, 2] *= scale
+        out = np.minimum(img.mode.iinfo.max,out)
+    else:
+        out = img.mode.iinfo.max*scaling(out)
+
+    return out.astype(img.mode.iinfo.dtype)
+
+def rescale_child(path:str,variant:str) -> None:
+    """Reads and scales one file in this process and prints the wall time and peak RSS."""
+
+    img = Image(path)
+    _array = img.read()
+    img.limits(_array) # Histograms are shared by both variants, so they are not timed
+    before = maxrss()
+
+    start = time.perf_counter()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if variant == 'legacy': legacy_scale(img,_array)
+        else: img.scale(_array)
+    wall = time.perf_counter() - start
+
+    print(wall, before, maxrss())
+
+def bench_rescale(args):
+    """Peak memory and wall time of scaling RGB and 16-bit FITS frames, legacy path against the current one."""
+
+    width, height = args.size or (4000,4000)
+    rng = np.random.default_rng(0)
+    inputs = {'RGB float32': lambda: rng.random((3,height,width),dtype=np.float32),
+              '16-bit int': lambda: rng.integers(-2**15,2**15,(height,width),dtype=np.int16),
+              '16-bit float': lambda: rng.random((height,width),dtype=np.float32)}
+
+    print(f'rescale, {width}x{height} FITS; each run in a fresh process')
+    print(f'{"input":<14} {"variant":<8} {"time":>8} {"RSS before":>11} {"peak RSS":>10} {"increase":>10}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in inputs.items():
+            path = os.path.join(tmp,name.replace(' ','_') + '.fits')
+            fits.PrimaryHDU(data()).writeto(path)
+
+            for variant in ('legacy','current'):
+                result = subprocess.run([sys.executable,__file__,'rescale-child',path,variant],
+                                        capture_output=True,text=True,check=True)
+                wall, before, peak = map(float,result.stdout.split())
+                print(f'{name:<14} {variant:<8} {wall:>7.2f}s {before/2**20:>9.0f}MB {peak/2**20:>8.0f}MB {(peak-before)/2**20:>8.0f}MB')
+
+def bench_threads(args):
+    """Wall time of scaling a 16-bit float FITS frame with one thread and with one per CPU."""
+
+    width, height = args.size or (8000,8000)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'frame.fits')
+        fits.PrimaryHDU(rng.random((height,width),dtype=np.float32)).writeto(path)
+
+        img = Image(path)
+        _array = img.read()
+        img.limits(_array)
+
+        print(f'scale, {width}x{height} 16-bit float FITS, best of {args.repeat}')
+        for threads in sorted({1, os.cpu_count() or 1}):
+            config.SCALE_THREADS = threads
+            parallel._pool = None
+            with np.errstate(divide='ignore', invalid='ignore'):
+                wall = best(lambda: img.scale(_array),args.repeat)
+            print(f'{threads:>3} threads {wall:>7.3f}s')
+
+def legacy_gaussian_filter(array:np.ndarray,sigma,n:int=3) -> np.ndarray:
+    """Box filter Gaussian used before the vectorized version: one 2-D filter per channel per box."""
+
+    from scipy.ndimage import uniform_filter
+
+    out = array.copy()
+    if sigma > 0:
+        for s in sigma_to_size(sigma,n):
+            if out.ndim == 3:
+                for i in range(out.shape[2]):
+                    out[:, :, i] = uniform_filter(out[:, :, i],s)
+            else:
+                out = uniform_filter(out,s)
+    return out
+
+def bench_gaussian(args):
+    """Blur of an RGB frame with 3 boxes at radii from 1 to 50, legacy against vectorized (and scipy's exact Gaussian)."""
+
+    from scipy.ndimage import gaussian_filter as scipy_gaussian_filter
+
+    width, height = args.size or (2000,2000)
+    array = random((height,width,3),Mode.RGB)
+
+    print(f'gaussian, {width}x{height} RGB uint8, n=3, best of {args.repeat}')
+    print(f'{"radius":>6} {"legacy":>10} {"vectorized":>11} {"scipy":>10}')
+
+    for sigma in (1,2,5,10,20,50):
+        legacy = best(lambda: legacy_gaussian_filter(array,sigma),args.repeat)
+        vectorized = best(lambda: gaussian_filter(array,sigma),args.repeat)
+        exact = best(lambda: scipy_gaussian_filter(array,(sigma,sigma,0)),args.repeat)
+        print(f'{sigma:>6} {legacy:>9.3f}s {vectorized:>10.3f}s {exact:>9.3f}s')
+
+def bench_playback(args):
+    """Frame rate of stepping through a 100-frame FITS cube by seeking each frame, and of playing it from the frame buffer."""
+
+    width, height = args.size or (1000,1000)
+    fps = 30
+    app = QApplication.instance() or QApplication(['benchmarks','-platform','offscreen'])
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'cube.fits')
+        hdus = [fits.PrimaryHDU()] + [fits.ImageHDU(rng.random((height,width),dtype=np.float32)) for _ in range(100)]
+        fits.HDUList(hdus).writeto(path)
+
+        print(f'playback, {width}x{height}x100 float32 FITS cube')
+        print(f'{"variant":<10} {"fps":>6} {"waits":>6}')
+
+        # Every frame read and rendered when it is shown, as the frame slider used to
+        img = Image(path)
+        img.seek(0)
+        start = time.perf_counter()
+        for i in range(1,img.n_frames): img.seek(i)
+        print(f'{"seek":<10} {(img.n_frames-1)/(time.perf_counter()-start):>6.1f} {"":>6}')
+
+        # Playback at the target rate from the frame buffer, waiting on frames that are not rendered yet
+        CACHE.clear()
+        img = Image(path)
+        img.seek(0)
+        buffer, rate = FrameBuffer(), FrameRate(period=inf)
+        buffer.update(img,0)
+        start = time.perf_counter()
+        while rate.shown < img.n_frames - 1:
+            time.sleep(max(0,start + (rate.shown + rate.waits + 1)/fps - time.perf_counter()))
+            frame = img.wrapframe(img.frame+1)
+            render = buffer.take(img,frame)
+            if render is not None:
+                img.load(render)
+                buffer.update(img,frame)
+            rate.tick(render is not None)
+            app.processEvents()
+        print(f'{f"buffer@{fps}":<10} {rate.fps:>6.1f} {rate.waits:>6}')
+
+        buffer.shutdown()
+
+def bench_tiff(args):
+    """Decoding the last page of a 1000-page TIFF stack, walking the pages with Pillow against seeking straight to it."""
+
+    import PIL.Image as pillow
+    from imgmarker.image import tiff
+
+    width, height = args.size or (256,256)
+    pages = [pillow.fromarray(page) for page in random((1000,height,width),Mode.L)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'stack.tif')
+        pages[0].save(path,save_all=True,append_images=pages[1:])
+
+        def walk():
+            with pillow.open(path) as f:
+                f.seek(f.n_frames-1)
+                return np.array(f)
+
+        def indexed(ifds):
+            with tiff.open(path,ifds) as f:
+                f.seek(f.n_frames-1)
+                return np.array(f)
+
+        ifds = tiff.ifds(path)
+        assert np.array_equal(walk(),indexed(ifds))
+
+        print(f'tiff, last page of {width}x{height}x1000 stack, best of {args.repeat}')
+        print(f'{"Pillow walk":<16} {1e3*best(walk,args.repeat):>8.2f}ms')
+        print(f'{"indexing once":<16} {1e3*best(lambda: tiff.ifds(path),args.repeat):>8.2f}ms')
+        print(f'{"indexed seek":<16} {1e3*best(lambda: indexed(ifds),args.repeat):>8.2f}ms')
+
+def bench_fits(args):
+    """Switching frames of a FITS file with 500 image extensions, parsing every header with astropy against the cached layout."""
+
+    from imgmarker.image import fits as _fits
+
+    width, height = args.size or (256,256)
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0,500,50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'extensions.fits')
+        hdus = [fits.PrimaryHDU()] + [fits.ImageHDU(rng.random((height,width),dtype=np.float32)) for _ in range(500)]
+        fits.HDUList(hdus).writeto(path)
+
+        def legacy():
+            for frame in frames:
+                with _fits.open(path) as f: _fits.read(f[frame],8)
+
+        def layout():
+            for frame in frames:
+                with _fits.hdus(path) as f: _fits.read(f[frame],8)
+
+        start = time.perf_counter()
+        _fits.layout(path)
+        scan = time.perf_counter() - start
+
+        print(f'fits, {len(frames)} random frames of a {width}x{height}x500 extension file, best of {args.repeat}')
+        print(f'{"astropy":<14} {1e3*best(legacy,args.repeat)/len(frames):>8.2f}ms per frame')
+        print(f'{"layout":<14} {1e3*best(layout,args.repeat)/len(frames):>8.2f}ms per frame')
+        print(f'{"layout scan":<14} {1e3*scan:>8.2f}ms once')
+
+def legacy_fits_read(hdu,bits:int) -> np.ndarray:
+    """Whole-array float64 normalization with separate minimum and maximum passes and dstack, used before banded reads."""
+
+    data = hdu.data
+    with np.errstate(over='ignore'):
+        data = (2**bits - 1)*((data - np.nanmin(data))/(np.nanmax(data) - np.nanmin(data)))
+    if data.ndim == 3: data = np.dstack(data[:3])
+    return np.flipud(data)
+
+def bench_normalize(args):
+    """Wall time and peak allocation of normalizing FITS frames, legacy whole-array path against `fits.read`."""
+
+    import tracemalloc
+    from imgmarker.image import fits as _fits
+
+    width, height = args.size or (4000,4000)
+    rng = np.random.default_rng(0)
+    inputs = {'float32': lambda: rng.random((height,width),dtype=np.float32),
+              'RGB float32': lambda: rng.random((3,height,width),dtype=np.float32),
+              '16-bit int': lambda: rng.integers(-2**15,2**15,(height,width),dtype=np.int16)}
+
+    print(f'normalize, {width}x{height} FITS, best of {args.repeat}')
+    print(f'{"input":<12} {"variant":<8} {"time":>8} {"peak":>9}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in inputs.items():
+            path = os.path.join(tmp,name.replace(' ','_') + '.fits')
+            fits.PrimaryHDU(data()).writeto(path)
+
+            with fits.open(path,memmap=False) as f:
+                variants = {'legacy': lambda: legacy_fits_read(f[0],16),
+                            'current': lambda: _fits.read(_fits.layout(path)[0],16)}
+
+                for variant, func in variants.items():
+                    wall = best(func,args.repeat)
+                    tracemalloc.start()
+                    func()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    print(f'{name:<12} {variant:<8} {wall:>7.3f}s {peak/2**20:>7.0f}MB')
+
+def bench_wcs(args):
+    """WCS of every frame of a 500-extension FITS file with a common solution, constructed per frame against shared."""
+
+    from imgmarker import image
+    from imgmarker.image import fits as _fits
+
+    width, height = args.size or (64,64)
+    header = {'CTYPE1': 'RA---TAN-SIP', 'CTYPE2': 'DEC--TAN-SIP', 'CRPIX1': width/2, 'CRPIX2': height/2,
+              'CRVAL1': 150.0, 'CRVAL2': 2.0, 'CD1_1': -1e-4, 'CD1_2': 0.0, 'CD2_1': 0.0, 'CD2_2': 1e-4,
+              'A_ORDER': 2, 'B_ORDER': 2, 'A_2_0': 1e-6, 'B_0_2': 1e-6}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'extensions.fits')
+        hdus = [fits.PrimaryHDU()]
+        for i in range(500):
+            hdu = fits.ImageHDU(np.zeros((height,width),dtype=np.float32))
+            hdu.header.update(header,EXTNAME=f'CCD{i}')
+            hdus.append(hdu)
+        fits.HDUList(hdus).writeto(path)
+        _fits.layout(path)
+
+        def naive():
+            with _fits.hdus(path) as f:
+                for hdu in f: image.read_wcs(fits.ImageHDU(header=fits.Header.fromstring(_fits.cards(hdu))))
+
+        def shared():
+            image._wcs.clear()
+            img = image.Image(path)
+            for frame in range(img.n_frames): img.framewcs(frame)
+            return img
+
+        img = shared()
+        revisit = best(lambda: [img.framewcs(frame) for frame in range(img.n_frames)],args.repeat)
+
+        print(f'wcs, all 500 frames of a {width}x{height}x500 extension file with a common SIP solution, best of {args.repeat}')
+        print(f'{"per frame":<14} {1e3*best(naive,args.repeat):>9.2f}ms')
+        print(f'{"shared":<14} {1e3*best(shared,args.repeat):>9.2f}ms')
+        print(f'{"revisited":<14} {1e3*revisit:>9.2f}ms')
+        print(f'{"instances":<14} {len({id(img.framewcs(frame)) for frame in range(1,img.n_frames)}):>9}')
+
+def bench_save(args):
+    """Saving the image list of 50,000 seen images with a WCS, before and after their centres are cached."""
+
+    from astropy.wcs import WCS
+    from imgmarker.io import ImagesFile
+
+    width, height = args.size or (64,64)
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crpix = [width/2, height/2]
+    wcs.wcs.crval = [150.0, 2.0]
+    wcs.wcs.cdelt = [-1e-4, 1e-4]
+    metadata = {'width': width, 'height': height, 'mode': Mode.L, 'n_channels': 1, 'n_frames': 1, 'wcs': wcs}
+
+    calls = [0]
+    all_pix2world = WCS.all_pix2world
+    def counted(self,*a,**kw):
+        calls[0] += 1
+        return all_pix2world(self,*a,**kw)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_dir = config.SAVE_DIR
+        config.SAVE_DIR = tmp
+        try:
+            images = [Image(f'image{i}.fits',metadata=metadata) for i in range(50000)]
+            for img in images: img.seen = True
+            file = ImagesFile()
+
+            # Every save used to transform the centre of every seen image twice
+            legacy = best(lambda: [wcs.all_pix2world([[width/2, height/2]],0) for _ in range(2*len(images))],1)
+
+            start = time.perf_counter()
+            file.save(images)
+            first = time.perf_counter() - start
+
+            WCS.all_pix2world = counted
+            try: later = best(lambda: file.save(images),args.repeat)
+            finally: WCS.all_pix2world = all_pix2world
+        finally: config.SAVE_DIR = save_dir
+
+    print(f'save, images file of 50000 seen {width}x{height} images, best of {args.repeat}')
+    print(f'{"2 per image":<14} {1e3*legacy:>9.2f}ms transforms of the legacy save')
+    print(f'{"first save":<14} {1e3*first:>9.2f}ms')
+    print(f'{"later saves":<14} {1e3*later:>9.2f}ms')
+    print(f'{"transforms":<14} {calls[0]//args.repeat:>9} per later save')
+
+def bench_readout(args):
+    """Cursor readouts of a frame with a 5th order SIP solution, exact against interpolated by `SkyGrid`."""
+
+    from astropy.coordinates import SkyCoord
+    from astropy.wcs import WCS
+    from imgmarker.image import SkyGrid
+
+    width, height = args.size or (4000,4000)
+    header = fits.Header({'NAXIS': 2, 'NAXIS1': width, 'NAXIS2': height, 'CTYPE1': 'RA---TAN-SIP', 'CTYPE2': 'DEC--TAN-SIP',
+                          'CRPIX1': width/2, 'CRPIX2': height/2, 'CRVAL1': 150.0, 'CRVAL2': 2.0,
+                          'CD1_1': -7e-5, 'CD1_2': 1e-6, 'CD2_1': 1e-6, 'CD2_2': 7e-5, 'A_ORDER': 5, 'B_ORDER': 5})
+    rng = np.random.default_rng(0)
+    for p in range(2,6):
+        for i in range(p+1):
+            header[f'A_{i}_{p-i}'] = rng.normal(0,2/(width/2)**p)
+            header[f'B_{i}_{p-i}'] = rng.normal(0,2/(width/2)**p)
+    wcs = WCS(header)
+
+    # A cursor path of 20,000 mouse events moving a few pixels at a time
+    path = np.clip(np.cumsum(rng.normal(0,3,(20000,2)),axis=0) + (width/2,height/2),0,(width,height))
+    points = path.tolist()
+
+    start = time.perf_counter()
+    grid = SkyGrid(wcs,width,height)
+    build = time.perf_counter() - start
+
+    exact = best(lambda: [wcs.all_pix2world([[x, y]],0)[0] for x, y in points],args.repeat)
+    interpolated = best(lambda: [grid(x,y) for x, y in points],args.repeat)
+
+    scale = 3600*np.sqrt(abs(np.linalg.det(wcs.pixel_scale_matrix)))
+    error = SkyCoord(*wcs.all_pix2world(path,0).T,unit='deg').separation(
+            SkyCoord(*np.array([grid(x,y) for x, y in points]).T,unit='deg')).arcsec.max()/scale
+
+    print(f'readout, {width}x{height} frame with a 5th order SIP solution, best of {args.repeat}')
+    print(f'{"grid":<14} {1e3*build:>9.2f}ms to build, {grid.step} px step, {grid.exact.mean():.1%} of cells exact')
+    print(f'{"exact":<14} {len(points)/exact:>9.0f} readouts/s')
+    print(f'{"interpolated":<14} {len(points)/interpolated:>9.0f} readouts/s')
+    print(f'{"error":<14} {error:>9.5f} px (tolerance {grid.tolerance} px)')
+
+def bench_cursor(args):
+    """Cursor readout for two seconds of moves from a 1000 Hz mouse, updated on every move against coalesced."""
+
+    from imgmarker.gui.pyqt import QPoint, QPointF, QEvent, QMouseEvent, Qt
+    from imgmarker.gui.window import MainWindow
+
+    width, height = args.size or (2000,2000)
+    app = QApplication.instance() or QApplication(['benchmarks','-platform','offscreen'])
+    header = fits.Header({'CTYPE1': 'RA---TAN-SIP', 'CTYPE2': 'DEC--TAN-SIP', 'CRPIX1': width/2, 'CRPIX2': height/2,
+                          'CRVAL1': 150.0, 'CRVAL2': 2.0, 'CD1_1': -1e-4, 'CD1_2': 0.0, 'CD2_1': 0.0, 'CD2_2': 1e-4,
+                          'A_ORDER': 2, 'B_ORDER': 2, 'A_2_0': 1e-7, 'B_0_2': 1e-7})
+    event = QMouseEvent(QEvent.Type.MouseMove,QPointF(0,0),QPointF(0,0),Qt.MouseButton.NoButton,
+                        Qt.MouseButton.NoButton,Qt.KeyboardModifier.NoModifier)
+
+    # Moves of about a third of a pixel every millisecond, as from a high polling rate mouse
+    rng = np.random.default_rng(0)
+    path = np.clip(np.cumsum(rng.normal(0,0.3,(2000,2)),axis=0) + (width/2,height/2),0,(width-1,height-1))
+    points = [QPoint(round(x),round(y)) for x, y in path]
+
+    image_dir, save_dir = config.IMAGE_DIR, config.SAVE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        fits.PrimaryHDU(rng.random((height,width),dtype=np.float32),header=header).writeto(os.path.join(tmp,'sip.fits'))
+        config.IMAGE_DIR, config.SAVE_DIR = tmp, tmp
+        try:
+            window = MainWindow()
+            pos = [points[0]]
+            window.image_view.mouse_pix_pos = lambda correction=True: pos[0]
+
+            spent = [0.0]
+            update_pos = window.update_pos
+            def timed():
+                start = time.perf_counter()
+                update_pos()
+                spent[0] += time.perf_counter() - start
+            window.update_pos = timed
+
+            def move(coalesce:bool):
+                window.pos_events = window.pos_updates = 0
+                window.pos_state = None
+                spent[0] = 0.0
+                start = time.perf_counter()
+                for i, point in enumerate(points):
+                    time.sleep(max(0,start + i/1000 - time.perf_counter()))
+                    pos[0] = point
+                    if coalesce: window.mouseMoveEvent(event)
+                    else:
+                        window.pos_events += 1
+                        window.pos_state = None
+                        timed()
+                    app.processEvents()
+                return window.pos_events, window.pos_updates, spent[0]
+
+            print(f'cursor, {len(points)} moves at 1000 Hz over a {width}x{height} frame with a SIP solution')
+            print(f'{"variant":<10} {"events":>7} {"updates":>8} {"readout":>10}')
+            for name, coalesce in (('every', False), ('coalesced', True)):
+                events, updates, seconds = move(coalesce)
+                print(f'{name:<10} {events:>7} {updates:>8} {1e3*seconds:>8.1f}ms')
+
+            window.close()
+        finally: config.IMAGE_DIR, config.SAVE_DIR = image_dir, save_dir
+
+def legacy_topix(ra:list,dec:list,wcs) -> tuple:
+    """Catalog positions to pixels as `WorldCoord.topix` converted them, from lists of floats."""
+
+    _radec = np.dstack((np.asarray(ra,dtype=float),np.asarray(dec,dtype=float)))[0]
+    x, _y = wcs.all_world2pix(_radec,0).T
+    return np.round(x), np.round(wcs.pixel_shape[1] - _y)
+
+def legacy_sexagesimal(ra:float,dec:float) -> tuple:
+    """A position formatted as the cursor readout formatted it, with `Angle.hms` and `Angle.dms`."""
+
+    sign = np.sign(ra)
+    m, s = np.divmod(np.abs(np.asarray(ra,dtype=float))*240,60)
+    h, m = np.divmod(m,60)
+    ra_h, ra_m, ra_s = sign*h, sign*m, sign*s
+    sign = np.sign(dec)
+    m, s = np.divmod(np.abs(np.asarray(dec,dtype=float))*3600,60)
+    d, m = np.divmod(m,60)
+    dec_d, dec_m, dec_s = sign*d, sign*m, sign*s
+
+    ra_str = rf'{np.abs(ra_h):02.0f}h {np.abs(ra_m):02.0f}m {np.abs(ra_s):05.2f}s'
+    dec_str = f'{np.abs(dec_d):02.0f}° {np.abs(dec_m):02.0f}\' {np.abs(dec_s):05.2f}\"'.replace('-','')
+    return ra_str, ('+' if dec > 0 else '-') + dec_str
+
+def bench_coordinates(args):
+    """A catalog of a million positions converted to pixels, and 100,000 of them formatted, per position against batched."""
+
+    from astropy.wcs import WCS
+    from imgmarker import coordinates
+
+    width, height = args.size or (4000,4000)
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crpix = [width/2, height/2]
+    wcs.wcs.crval = [150.0, 2.0]
+    wcs.wcs.cdelt = [-1e-4, 1e-4]
+    wcs.pixel_shape = (width, height)
+
+    rng = np.random.default_rng(0)
+    radec = np.column_stack((rng.uniform(149.8,150.2,1000000),rng.uniform(1.8,2.2,1000000)))
+    ra, dec = radec[:,0].tolist(), radec[:,1].tolist()
+
+    legacy = best(lambda: legacy_topix(ra,dec,wcs),args.repeat)
+    batched = best(lambda: coordinates.world2pix(radec,wcs),args.repeat)
+    assert np.array_equal(np.column_stack(legacy_topix(ra,dec,wcs)),np.round(coordinates.world2pix(radec,wcs)))
+
+    some = radec[:100000]
+    legacy_format = best(lambda: [legacy_sexagesimal(r,d) for r, d in some.tolist()],1)
+    batched_format = best(lambda: (coordinates.formatra(some[:,0],True),coordinates.formatdec(some[:,1],True)),args.repeat)
+
+    print(f'coordinates, {len(radec)} catalog positions on a {width}x{height} frame, best of {args.repeat}')
+    print(f'{"variant":<10} {"topix":>10} {"format":>10}')
+    print(f'{"legacy":<10} {1e3*legacy:>8.1f}ms {1e3*legacy_format:>8.1f}ms')
+    print(f'{"batched":<10} {1e3*batched:>8.1f}ms {1e3*batched_format:>8.1f}ms')
+
+def bench_toqimage(args):
+    """Conversion of a rendered frame to a QImage, by the legacy path and by `toqimage`."""
+
+    width, height = args.size or (8001,8000)
+    print(f'toqimage, {width}x{height}, best of {args.repeat}')
+    print(f'{"mode":<6} {"legacy":>10} {"array":>10} {"qbuffer":>10}')
+
+    for name, mode in {'L': Mode.L, 'I16': Mode.I16, 'RGB': Mode.RGB, 'RGBA': Mode.RGBA}.items():
+        # The legacy pipeline produced contiguous arrays, which toqimage copies once if their rows
+        # are not 32-bit aligned; the current pipeline writes into a qbuffer, which is wrapped as it is
+        array = random(shape(width,height,mode),mode)
+        buffer = qbuffer(height,width,mode)
+        buffer[...] = array
+
+        legacy = best(lambda: legacy_toqimage(array,mode),args.repeat)
+        copy = best(lambda: toqimage(array,mode),args.repeat)
+        zerocopy = best(lambda: toqimage(buffer,mode),args.repeat)
+
+        assert legacy_toqimage(array,mode) == toqimage(buffer,mode)
+        print(f'{name:<6} {1e3*legacy:>8.1f}ms {1e3*copy:>8.1f}ms {1e3*zerocopy:>8.1f}ms')
+
+BENCHMARKS = {'toqimage': bench_toqimage, 'rescale': bench_rescale, 'threads': bench_threads,
+              'gaussian': bench_gaussian, 'playback': bench_playback, 'tiff': bench_tiff,
+              'fits': bench_fits, 'normalize': bench_normalize,
+              'wcs': bench_wcs, 'save': bench_save,
+              'readout': bench_readout, 'cursor': bench_cursor,
+              'coordinates': bench_coordinates}
+
+def main():
+    if sys.argv[1:2] == ['rescale-child']: return rescale_child(*sys.argv[2:4])
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=BENCHMARKS, help='benchmark to run')
+    parser.add_argument('--size', type=size, default=None,
+                        help='WIDTHxHEIGHT of the synthetic images (default 8001x8000 for toqimage, where an odd '
+                             'width needs row padding, 4000x4000 for rescale and normalize, 8000x8000 for threads, 2000x2000 for gaussian, '
+                             '1000x1000 for playback, 256x256 for tiff and fits, 64x64 for wcs and save, 4000x4000 for readout and coordinates and 2000x2000 for cursor)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the best of which is reported')
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == '__main__':
+    main()